@@ -0,0 +1,5 @@
+# coding=utf-8
+"""
+Benchmarks, kept out of the library packages so that importing them
+never pulls in test code.
+"""
@@ -0,0 +1,514 @@
+#!/usr/bin/python
+# coding=utf-8
+
+"""
+Micro benchmarks for the response handling hot paths.
+
+Run a single benchmark with::
+
+    python -m bench.imap lexer
+
+or all of them by giving no arguments, from the top of the
+repository.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import asyncio
+import base64
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+from net.imap.aio import AsyncIMAPClient
+from net.imap.cache import MessageCache
+from net.imap.datetime_util import _parse_slow, parse_datetimes, parse_to_datetime
+from net.imap.download import download_part
+from net.imap.fixed_offset import FixedOffset
+from net.imap.imap_utf7 import FolderNameCache, decode as decode_utf7, encode as encode_utf7
+from net.imap.imapclient import IMAPClient, join_message_ids
+from net.imap.response_lexer import TokenSource
+from net.imap import response_parser
+from net.imap.response_parser import ENGINES, parse_fetch_response, parse_message_list, parse_response, set_engine
+from net.imap.sequence_set import SequenceSet
+from net.imap.sync import MailboxSync, SyncStateStore
+from net.imap.test.fake_server import FakeIMAPServer
+from net.imap.walk import plan_parts, walk_messages, walk_parts
+
+ENVELOPE_LINE = (
+    b'%d (UID %d FLAGS (\\Seen $Forwarded) ENVELOPE ('
+    b'"Tue, 16 Mar 2010 16:45:32 +0000" "%s" '
+    b'(("Bob Smith" NIL "bob" "smith.com")) (("Bob Smith" NIL "bob" "smith.com")) '
+    b'(("Bob Smith" NIL "bob" "smith.com")) '
+    b'(("Some One" NIL "some" "one.com") (NIL NIL "foo" "foo.com")) '
+    b'NIL NIL NIL "<1234.5678@smith.com>") BODY[HEADER.FIELDS (FROM)] NIL)'
+)
+
+
+SUBJECTS = [b'Re: Invoice %d' % i for i in range(19)] + [b'A \\"quoted\\" subject']
+
+
+def envelope_corpus(count):
+    return [ENVELOPE_LINE % (i, i, SUBJECTS[i % len(SUBJECTS)])
+            for i in range(1, count + 1)]
+
+
+def timed(func, repeat=3):
+    """Return the best wall clock time of *repeat* calls to *func*.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def report(name, count, unit, elapsed):
+    print('%-24s %10d %-8s %8.3fs %12.0f %s/s' % (
+        name, count, unit, elapsed, count / elapsed, unit))
+
+
+def bench_lexer():
+    corpus = envelope_corpus(50000)
+    count = len(list(TokenSource(corpus)))
+    elapsed = timed(lambda: list(TokenSource(corpus)))
+    report('lexer', count, 'tokens', elapsed)
+
+
+def bench_batched_fetch():
+    # 20ms round trip to a server holding 50k messages
+    with FakeIMAPServer(50000, latency=0.01) as server:
+        client = IMAPClient(server.host, server.port)
+        client.login('user', 'pass')
+        client.select_folder('INBOX')
+        ids = client.search('ALL')
+
+        for name, max_length, depth in [
+                ('fetch single command', None, 1),
+                ('fetch batched', 8000, 1),
+                ('fetch batched+pipelined', 8000, 4)]:
+            client.max_id_list_length = max_length
+            client.pipeline_depth = depth
+            elapsed = timed(lambda: client.fetch(ids, ['FLAGS']))
+            report(name, len(ids), 'msgs', elapsed)
+        client.logout()
+
+
+def bench_sequence_set():
+    # A 1M message archive where a third of the messages match, in
+    # runs of a few hundred messages.
+    ids = [i for i in range(1, 1000001) if (i // 300) % 3 == 0]
+    other = [i for i in range(1, 1000001) if (i // 200) % 2 == 0]
+    print('%-24s %10d bytes -> %d bytes' % (
+        'id list encoding', len(b','.join(str(i).encode('ascii') for i in ids)),
+        len(join_message_ids(ids))))
+
+    a, b = SequenceSet(ids), SequenceSet(other)
+    report('SequenceSet()', len(ids), 'ids', timed(lambda: SequenceSet(ids)))
+    for name, func in [('|', lambda: a | b), ('&', lambda: a & b), ('-', lambda: a - b)]:
+        report('SequenceSet ' + name, len(a) + len(b), 'ids', timed(func))
+
+    x, y = set(ids), set(other)
+    for name, func in [('|', lambda: x | y), ('&', lambda: x & y), ('-', lambda: x - y)]:
+        report('set ' + name, len(x) + len(y), 'ids', timed(func))
+
+
+def allocated(func):
+    """Return the result of *func* and the bytes it left allocated.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def peak_allocated(func):
+    """Return the peak number of bytes allocated while running *func*.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_search_ids():
+    # A SEARCH response matching 1M messages
+    data = [b' '.join(str(i).encode('ascii') for i in range(1, 1000001))]
+
+    ids, size = allocated(lambda: parse_message_list(data))
+    _, list_size = allocated(lambda: [int(n) for n in data[0].split()])
+    print('%-24s %10d bytes (list of ints: %d bytes)' % ('SearchIds memory', size, list_size))
+    report('parse_message_list', len(ids), 'ids', timed(lambda: parse_message_list(data)))
+
+    other = ids[::2]
+    report('SearchIds &', len(ids) + len(other), 'ids', timed(lambda: ids & other))
+    report('SearchIds |', len(ids) + len(other), 'ids', timed(lambda: ids | other))
+
+
+def bench_esearch():
+    # Counting the messages in a 100k message folder (a plain SEARCH
+    # response for it is ~590KB, the ESEARCH one a few dozen bytes)
+    with FakeIMAPServer(100000) as server:
+        client = IMAPClient(server.host, server.port)
+        client.login('user', 'pass')
+        client.select_folder('INBOX')
+
+        report('len(search())', 1, 'counts', timed(lambda: len(client.search('ALL'))))
+        report('search(returning=COUNT)', 1, 'counts',
+               timed(lambda: client.search('ALL', returning=['COUNT']).count))
+        report('search(returning=ALL)', 1, 'searches',
+               timed(lambda: client.search('ALL', returning=['ALL']).all))
+        client.logout()
+
+
+def bench_sync():
+    # Polling a 100k message folder in which 10 messages change between
+    # polls, against re-running a SEARCH every time
+    with FakeIMAPServer(100000) as server:
+        client = IMAPClient(server.host, server.port)
+        client.login('user', 'pass')
+        sync = MailboxSync(client, SyncStateStore(), 'user')
+
+        report('full sync', 1, 'syncs', timed(lambda: sync.sync('INBOX'), repeat=1))
+
+        def change_and_sync():
+            server.deliver(5)
+            client.add_flags(range(server.message_count - 50, server.message_count - 45), ['x'])
+            sync.sync('INBOX')
+
+        report('incremental sync', 1, 'syncs', timed(change_and_sync))
+        report('search NOT KEYWORD', 1, 'searches',
+               timed(lambda: client.search([b'NOT', b'KEYWORD', b'processed'])))
+        client.logout()
+
+
+def bench_cache():
+    # Repeating a search result listing for 5000 messages, 10ms away
+    with FakeIMAPServer(5000, latency=0.005) as server:
+        client = IMAPClient(server.host, server.port)
+        client.login('user', 'pass')
+        client.select_folder('INBOX')
+        ids = list(range(1, 5001))
+        items = ['ENVELOPE', 'FLAGS', 'RFC822.SIZE']
+
+        report('fetch uncached', len(ids), 'msgs', timed(lambda: client.fetch(ids, items)))
+        client.cache = MessageCache(':memory:', 'user')
+        client.fetch(ids, items)
+        report('fetch cached', len(ids), 'msgs', timed(lambda: client.fetch(ids, items)))
+        client.logout()
+
+
+def bench_aio():
+    # Checking 50 mailboxes on a server 20ms away
+    accounts = 50
+
+    def check_blocking(server):
+        for n in range(accounts):
+            client = IMAPClient(server.host, server.port)
+            client.login('user%d' % n, 'pass')
+            client.select_folder('INBOX')
+            client.fetch(client.search(), ['FLAGS'])
+            client.logout()
+
+    async def check_one(server, n):
+        async with AsyncIMAPClient(server.host, server.port) as client:
+            await client.login('user%d' % n, 'pass')
+            await client.select_folder('INBOX')
+            await client.fetch(await client.search(), ['FLAGS'])
+
+    async def check_all(server):
+        await asyncio.gather(*[check_one(server, n) for n in range(accounts)])
+
+    with FakeIMAPServer(100, latency=0.01) as server:
+        report('IMAPClient serial', accounts, 'accounts',
+               timed(lambda: check_blocking(server), repeat=1))
+        report('AsyncIMAPClient gather', accounts, 'accounts',
+               timed(lambda: asyncio.run(check_all(server)), repeat=1))
+
+
+def bench_pipeline():
+    # Per message fetch and store for 100 messages on a server 20ms away
+    with FakeIMAPServer(100, latency=0.01) as server:
+        client = IMAPClient(server.host, server.port)
+        client.login('user', 'pass')
+        client.select_folder('INBOX')
+        ids = list(range(1, 101))
+
+        def one_by_one():
+            for msgid in ids:
+                client.fetch([msgid], ['ENVELOPE'])
+                client.add_flags([msgid], ['processed'])
+
+        def pipelined():
+            with client.pipeline() as p:
+                for msgid in ids:
+                    p.fetch([msgid], ['ENVELOPE'])
+                    p.add_flags([msgid], ['processed'])
+
+        report('fetch+store serial', len(ids), 'msgs', timed(one_by_one, repeat=1))
+        report('fetch+store pipeline', len(ids), 'msgs', timed(pipelined))
+        client.logout()
+
+
+def bench_walk():
+    # 20 messages with a text part and 5 PDFs each, on a server 20ms away
+    structure = (b'(("text" "plain" ("charset" "utf-8") NIL NIL "7bit" 4 1 NIL NIL NIL NIL)' +
+                 b''.join(b'("application" "pdf" NIL NIL NIL "base64" 4 NIL '
+                          b'("attachment" ("filename" "%d.pdf")) NIL NIL)' % n
+                          for n in range(2, 7)) +
+                 b' "mixed" ("boundary" "x") NIL NIL NIL)')
+    sections = dict((str(n), b'QUJD') for n in range(2, 7))
+    sections['1'] = b'text'
+
+    with FakeIMAPServer(20, latency=0.01) as server:
+        for i in range(1, 21):
+            server.bodies[i] = (structure, sections)
+        client = IMAPClient(server.host, server.port)
+        client.login('user', 'pass')
+        client.select_folder('INBOX')
+        structures = dict((msgid, data[b'BODYSTRUCTURE'])
+                          for msgid, data in client.fetch(range(1, 21), ['BODYSTRUCTURE']).items())
+
+        def part_by_part():
+            # What walk_parts used to do: a FETCH per part
+            for msgid, msg in structures.items():
+                for section in plan_parts(msg, lambda *_: True).sections:
+                    client.fetch([msgid], [section])
+
+        report('fetch per part', len(structures), 'msgs', timed(part_by_part, repeat=1))
+        report('walk_messages', len(structures), 'msgs',
+               timed(lambda: walk_messages(structures, client, lambda *_: True)))
+        client.logout()
+
+
+def bench_download():
+    # Saving a 4MB base64 encoded attachment
+    content = os.urandom(4 * 1024 * 1024)
+    encoded = base64.encodebytes(content).replace(b'\n', b'\r\n')
+    structure = (b'("application" "pdf" NIL NIL NIL "base64" %d NIL '
+                 b'("attachment" ("filename" "big.pdf")) NIL NIL)' % len(encoded))
+
+    with FakeIMAPServer(1) as server:
+        server.bodies[1] = (structure, {'1': encoded})
+        client = IMAPClient(server.host, server.port)
+        client.login('user', 'pass')
+        client.select_folder('INBOX')
+        part = client.fetch([1], ['BODYSTRUCTURE'])[1][b'BODYSTRUCTURE']
+
+        def in_memory():
+            with open(os.devnull, 'wb') as f:
+                f.write(walk_parts(part, 1, client, ['big.pdf'])[1]['big.pdf'][2])
+
+        def streamed():
+            with open(os.devnull, 'wb') as f:
+                download_part(client, 1, part, '1', f)
+
+        for name, func in [('walk_parts', in_memory), ('download_part', streamed)]:
+            print('%-24s %10d bytes peak for a %d byte attachment' % (
+                name, peak_allocated(func), len(content)))
+            report(name, len(content) // 1024, 'KB', timed(func))
+        client.logout()
+
+        # The same with the server decoding it (BINARY)
+        server.capabilities += b' BINARY'
+        server.binary[1] = {'1': content}
+        client = IMAPClient(server.host, server.port)
+        client.login('user', 'pass')
+        client.select_folder('INBOX')
+        print('%-24s %10d bytes on the wire instead of %d' % (
+            'download_part BINARY', len(content), len(encoded)))
+        report('download_part BINARY', len(content) // 1024, 'KB', timed(streamed))
+        client.logout()
+
+
+def bench_index():
+    # Planning the parts of 2000 messages with a text part and 5 PDFs.
+    # The index is built on the first plan and reused after that, when
+    # dms, walk_parts and the UI look at the same message again.
+    structure = (b'(("text" "plain" ("charset" "utf-8") NIL NIL "7bit" 4 1 NIL NIL NIL NIL)' +
+                 b''.join(b'("application" "pdf" NIL NIL NIL "base64" 4 NIL '
+                          b'("attachment" ("filename" "%d.pdf")) NIL NIL)' % n
+                          for n in range(2, 7)) +
+                 b' "mixed" ("boundary" "x") NIL NIL NIL)')
+    lines = [b'%d (BODYSTRUCTURE %s)' % (i, structure) for i in range(1, 2001)]
+    messages = [data[b'BODYSTRUCTURE'] for data in parse_fetch_response(lines).values()]
+
+    def by_property():
+        # What plan_parts used to do on every call: rebuild the
+        # disposition dict and content type string of each part
+        for msg in messages:
+            for part in msg[0]:
+                for key, filename in part.dtypes.items():
+                    if key.lower() == b'filename':
+                        filename.decode('utf8'), part.content_type
+                part.content_type.lower()
+
+    def by_index():
+        for msg in messages:
+            plan_parts(msg)
+
+    report('dtypes per access', len(messages), 'plans', timed(by_property))
+    report('part index, first', len(messages), 'plans', timed(by_index, repeat=1))
+    report('part index, cached', len(messages), 'plans', timed(by_index))
+
+
+def bench_lazy():
+    # Parsing ENVELOPE, INTERNALDATE and BODYSTRUCTURE responses for
+    # 20000 messages when only the flags are used, as a listing that
+    # filters on flags before showing anything does
+    structure = (b'("text" "plain" ("charset" "utf-8") NIL NIL "7bit" 4 1 NIL NIL NIL NIL)'
+                 b'("application" "pdf" NIL NIL NIL "base64" 4 NIL '
+                 b'("attachment" ("filename" "a.pdf")) NIL NIL) "mixed" ("boundary" "x") NIL NIL NIL')
+    corpus = [line[:-1] + b' INTERNALDATE "16-Mar-2010 16:45:32 +0000" BODYSTRUCTURE (' + structure + b'))'
+              for line in envelope_corpus(20000)]
+
+    def flags(lazy):
+        for data in parse_fetch_response(corpus, lazy=lazy).values():
+            data[b'FLAGS']
+
+    def everything(lazy):
+        for data in parse_fetch_response(corpus, lazy=lazy).values():
+            data[b'FLAGS'], data[b'ENVELOPE'], data[b'INTERNALDATE'], data[b'BODYSTRUCTURE']
+
+    report('eager, flags only', len(corpus), 'messages', timed(lambda: flags(False)))
+    report('lazy, flags only', len(corpus), 'messages', timed(lambda: flags(True)))
+    report('eager, all items', len(corpus), 'messages', timed(lambda: everything(False)))
+    report('lazy, all items', len(corpus), 'messages', timed(lambda: everything(True)))
+
+
+def bench_engines():
+    # parse_response, and parse_fetch_response which also converts the
+    # values, with each parser engine on large ENVELOPE and
+    # BODYSTRUCTURE responses
+    structure = (b'(("text" "plain" ("charset" "utf-8") NIL NIL "quoted-printable" 1024 20 NIL NIL NIL NIL)'
+                 b'("text" "html" ("charset" "utf-8") NIL NIL "quoted-printable" 4096 80 NIL NIL NIL NIL) '
+                 b'"alternative" ("boundary" "y") NIL NIL NIL)'
+                 b'("application" "pdf" ("name" "invoice.pdf") NIL NIL "base64" 81920 NIL '
+                 b'("attachment" ("filename" "invoice.pdf")) NIL NIL) "mixed" ("boundary" "x") NIL NIL NIL')
+    corpora = [
+        ('ENVELOPE', envelope_corpus(20000)),
+        ('BODYSTRUCTURE', [b'%d (UID %d BODYSTRUCTURE (%s))' % (i, i, structure) for i in range(1, 20001)]),
+    ]
+    try:
+        for name, corpus in corpora:
+            for engine in ENGINES:
+                set_engine(engine)
+                report('%s %s' % (engine, name), len(corpus), 'messages',
+                       timed(lambda: parse_response(corpus)))
+            for engine in ENGINES:
+                set_engine(engine)
+                report('%s %s fetch' % (engine, name), len(corpus), 'messages',
+                       timed(lambda: parse_fetch_response(corpus)))
+    finally:
+        set_engine(ENGINES[0])
+
+
+def bench_records():
+    # The memory held by the parsed FETCH data of 100k messages, from
+    # 500 senders, as kept for a folder listing: with nothing shared
+    # between messages (dicts and namedtuples as parsed), with the item
+    # names, flags and addresses shared, and in CompactRecords
+    corpus = [line.replace(b'"some"', b'"some%d"' % (i % 500))
+              for i, line in enumerate(envelope_corpus(100000))]
+    tables = [response_parser._item_names, response_parser._flag_tuples,
+              response_parser._addresses, response_parser._address_lists]
+    limit = response_parser._INTERN_LIMIT
+
+    def parsed(unshared=False, compact=False):
+        for table in tables:
+            table.clear()
+        response_parser._INTERN_LIMIT = 0 if unshared else limit
+        try:
+            return allocated(lambda: parse_fetch_response(corpus, compact=compact))
+        finally:
+            response_parser._INTERN_LIMIT = limit
+
+    for name, kwargs in [('unshared dicts', dict(unshared=True)),
+                         ('shared dicts', {}),
+                         ('CompactRecords', dict(compact=True))]:
+        out, size = parsed(**kwargs)
+        print('%-24s %10d bytes %8.0f bytes/message' % (name, size, size / len(out)))
+        del out
+
+
+def bench_dates():
+    # Normalised INTERNALDATEs of 100k messages, all different and from
+    # 1000 different times, compared with parsedate_tz and a new system
+    # offset for each one
+    unique = [b'%2d-Mar-2010 %02d:%02d:%02d +0100' % (1 + i // 86400, i // 3600 % 24, i // 60 % 60, i % 60)
+              for i in range(100000)]
+    repeated = [unique[i % 1000] for i in range(100000)]
+
+    def old(dates):
+        return [_parse_slow(date).astimezone(FixedOffset.for_system()).replace(tzinfo=None)
+                for date in dates]
+
+    report('parsedate_tz', len(unique), 'dates', timed(lambda: old(unique)))
+    report('parse_to_datetime', len(unique), 'dates',
+           timed(lambda: [parse_to_datetime(date) for date in unique]))
+    report('parse_to_datetime cached', len(repeated), 'dates',
+           timed(lambda: [parse_to_datetime(date) for date in repeated]))
+    report('parse_datetimes', len(repeated), 'dates', timed(lambda: parse_datetimes(repeated)))
+
+
+def bench_folders():
+    # A 10k folder LIST response, a fifth of the names accented, decoded
+    # and encoded again as when each folder is selected
+    names = ['Projects/%d/%s' % (i, 'R\xe9sum\xe9s' if i % 5 == 0 else 'Reports') for i in range(10000)]
+    encoded = [encode_utf7(name) for name in names]
+    cache = FolderNameCache(size=len(names))
+
+    report('decode', len(encoded), 'names', timed(lambda: [decode_utf7(name) for name in encoded]))
+    report('encode', len(names), 'names', timed(lambda: [encode_utf7(name) for name in names]))
+    report('cached decode', len(encoded), 'names', timed(lambda: [cache.decode(name) for name in encoded]))
+    report('cached encode', len(names), 'names', timed(lambda: [cache.encode(name) for name in names]))
+
+    with FakeIMAPServer() as server:
+        server.folders = encoded
+        client = IMAPClient(server.host, server.port)
+        client.login('user', 'pass')
+        report('list_folders', len(names), 'folders', timed(client.list_folders))
+        client.logout()
+
+
+BENCHMARKS = [
+    ('lexer', bench_lexer),
+    ('batched_fetch', bench_batched_fetch),
+    ('sequence_set', bench_sequence_set),
+    ('search_ids', bench_search_ids),
+    ('esearch', bench_esearch),
+    ('sync', bench_sync),
+    ('cache', bench_cache),
+    ('aio', bench_aio),
+    ('pipeline', bench_pipeline),
+    ('walk', bench_walk),
+    ('download', bench_download),
+    ('index', bench_index),
+    ('lazy', bench_lazy),
+    ('engines', bench_engines),
+    ('records', bench_records),
+    ('dates', bench_dates),
+    ('folders', bench_folders),
+]
+
+
+def main():
+    wanted = sys.argv[1:]
+    for name, func in BENCHMARKS:
+        if not wanted or name in wanted:
+            func()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,7 @@
 # coding=utf-8
+import os
+
+from net.imap.cache import MessageCache
 from net.imap.imapclient import IMAPClient
 from net.imap.walk import walk_parts
 from net.utils import parse_command_line_args
@@ -10,6 +13,8 @@ print('Connecting...')
 # client = create_client_from_config(args)
 server = IMAPClient(args.host, use_uid=True, ssl=args.ssl)
 server.login(args.username, args.password)
+os.makedirs(os.path.dirname(args.cache) or '.', exist_ok=True)
+server.cache = MessageCache(args.cache, args.username)
 print('Connected.')
 select_info = server.select_folder('INBOX')
 print('%d messages in INBOX' % select_info[b'EXISTS'])
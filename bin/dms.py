@@ -1,94 +1,425 @@
 # coding=utf-8
+import hashlib
 import os
 import re
+import shutil
 import tempfile
+import threading
 import subprocess
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
 from email.mime.application import MIMEApplication
 from email.mime.multipart import MIMEMultipart
 from os.path import basename
-from smtplib import SMTP
+from queue import Empty, Full, Queue
+from bin.idle_watcher import IdleWatcher
+from bin.ocr_cache import OCRCache
+from bin.scheduler import AccountScheduler
+from bin.sent_log import SentLog
+from net.imap.download import download_parts
 from net.imap.imapclient import IMAPClient
-from net.imap.walk import walk_parts
+from net.imap.session import SessionManager
+from net.imap.sync import MailboxSync, SyncStateStore
+from net.imap.walk import plan_parts
+from net.smtp.pool import SMTPPool
 import json
 import sched
+import sys
 import time
 
 with open('users.json') as f:
     config = json.loads(f.read())
 
+sync_state = SyncStateStore('sync_state.json')
 
-def main():
+# Messages sent on but not flagged yet, so they are never sent twice
+sent_log = SentLog(config.get('sent_log', 'sent_log.json'))
+
+# Messages whose PDFs are downloaded together
+BATCH_SIZE = 20
+
+# Accounts processed at once, and how long a cycle waits for one
+WORKERS = config.get('workers', 8)
+ACCOUNT_TIMEOUT = config.get('account_timeout', 600)
+
+# Accounts not watched with IDLE are polled this often, and all of them
+# now and then
+POLL_INTERVAL = 60
+FULL_POLL_INTERVAL = 15 * 60
+
+# So a dead IMAP or SMTP server fails the account instead of hanging it
+SOCKET_TIMEOUT = 60
+
+# Each account's IMAP connection stays logged in between runs, and is
+# checked with NOOP if it has been idle for a while
+sessions = SessionManager(timeout=SOCKET_TIMEOUT, check_after=POLL_INTERVAL / 2)
+
+# Each account's SMTP connection is kept open and reused between sends
+SMTP_PORT = 587
+smtp_pool = SMTPPool(timeout=SOCKET_TIMEOUT)
+
+# PDFs are OCR'd in parallel, one per core, for all accounts together.
+# The OCR runs in ocrmypdf processes, so threads are enough to wait on
+# them.
+OCR_WORKERS = os.cpu_count() or 1
+ocr_pool = ThreadPoolExecutor(OCR_WORKERS, thread_name_prefix='ocr')
+OCR_LANGUAGES = 'deu+fra+eng'
+
+# Results for PDFs seen before are reused rather than OCR'd again, and
+# a PDF already being OCR'd for another message is waited for
+ocr_cache = OCRCache(config.get('ocr_cache', 'ocr_cache'), config.get('ocr_cache_bytes', 1024 ** 3))
+ocr_in_flight = {}
+ocr_in_flight_lock = threading.Lock()
+
+# Messages of an account downloaded and waiting for OCR or sending.
+# Downloading stops when this many are queued.
+SEND_QUEUE_SIZE = 2 * BATCH_SIZE
+
+
+def main(users=None):
+    start = time.monotonic()
+    outcomes = scheduler.run_cycle(config['users'] if users is None else users)
+    print('cycle took %.1fs: %s' % (time.monotonic() - start, ', '.join(
+        f'{username} {outcome}' for username, outcome in sorted(outcomes.items()))))
+
+
+def connect(username: str, password: str, imap: str, **_) -> IMAPClient:
+    server = IMAPClient(imap, use_uid=True, ssl=993, timeout=SOCKET_TIMEOUT)
+    try:
+        server.login(username, password)
+    except BaseException:
+        server.shutdown()
+        raise
+    return server
+
+
+def push():
+    """Process each account as soon as its INBOX changes, watching it with IDLE.
+
+    Accounts whose server can't IDLE, or whose IDLE connection is down, are polled every
+    POLL_INTERVAL seconds. Every account is polled every FULL_POLL_INTERVAL seconds in case
+    something was missed or a run failed.
+    """
+    watchers = {}
     for username, userconf in config['users'].items():
-        process_user(username, **userconf)
+        watchers[username] = IdleWatcher(
+            username, lambda username=username, userconf=userconf: connect(username, **userconf),
+            wake=lambda username=username, userconf=userconf: scheduler.trigger(username, userconf),
+            ignore_flags=[b'processed'])
+        watchers[username].start()
+
+    last_full_poll = time.monotonic()
+    while True:
+        time.sleep(POLL_INTERVAL)
+        if time.monotonic() - last_full_poll >= FULL_POLL_INTERVAL:
+            last_full_poll = time.monotonic()
+            main()
+        else:
+            polled = {username: userconf for username, userconf in config['users'].items()
+                      if not watchers[username].idling.is_set()}
+            if polled:
+                main(polled)
 
 
 def process_user(username: str, receiver: str, password: str, imap: str, smtp: str):
-    server = IMAPClient(imap, use_uid=True, ssl=993)
-    server.login(username, password)
+    session = sessions.get(imap, username, password,
+                           on_connect=lambda server: start_session(server, username))
+    # Run again on a new connection if the server drops this one
+    session.run(lambda server: process_mailbox(server, session.state, username, receiver, password, smtp))
+
+
+def start_session(server: IMAPClient, username: str) -> MailboxSync:
     print(f'{username} connected')
-    server.select_folder('INBOX')
-    message_ids = server.search([b'NOT', b'KEYWORD', 'processed'])  # UNSEEN
-    print('%d messages in INBOX' % len(message_ids))
-    messages = server.fetch(message_ids, data=['ENVELOPE', 'BODYSTRUCTURE', 'RFC822.SIZE'])
-    for mid, content in messages.items():
+    # Enables CONDSTORE/QRESYNC, which has to happen before SELECT
+    return MailboxSync(server, sync_state, username)
 
-        bodystructure = content[b'BODYSTRUCTURE']
-        text, attachments = walk_parts(bodystructure, msgid=mid, server=server)
 
-        filenames = [k for k, v in attachments.items() if v[0] == 'application/pdf']
-        _, data = walk_parts(bodystructure, msgid=mid, server=server, download_attachments=filenames)
+def process_mailbox(server: IMAPClient, sync: MailboxSync, username: str, receiver: str, password: str,
+                    smtp: str):
+    # Only new and changed messages are reported after the first run;
+    # the state is committed once they have all been handled.
+    changes = sync.sync('INBOX', commit=False)
+    uidvalidity = changes.state.uidvalidity
+    # Sent by a run that failed before it could flag them
+    unflagged = sent_log.get(username, uidvalidity)
+    if unflagged:
+        server.add_flags(sorted(unflagged), ['processed'])
+        sent_log.discard(username, uidvalidity, unflagged)
+    message_ids = [mid for mid, flags in changes.flags.items()
+                   if b'processed' not in (flag.lower() for flag in flags) and mid not in unflagged]
+    print(f'{username}: %d unprocessed messages in INBOX' % len(message_ids))
+    if message_ids:
+        process_inbox(server, message_ids, uidvalidity, username, receiver, password, smtp)
 
-        msg = MIMEMultipart()
+    sync.commit('INBOX', changes)
 
-        with tempfile.TemporaryDirectory() as tmpdirname:
 
-            for filename, attachment in data.items():
-                input_pdf = os.path.join(tmpdirname, filename)
-                output_pdf = input_pdf.replace('.pdf', '_ocr.pdf')
-                output_txt = input_pdf.replace('.pdf', '.txt')
-                with open(input_pdf, 'wb') as f:
-                    if attachment[2] is None:
-                        continue
-                    f.write(attachment[2])
+def process_inbox(server: IMAPClient, message_ids, uidvalidity: int, username: str, receiver: str,
+                  password: str, smtp: str):
+    """Download, OCR and send on the PDFs of *message_ids* as three overlapping stages.
 
-                    process = subprocess.Popen(['/usr/local/bin/ocrmypdf', '-l', 'deu+fra+eng', '--sidecar', output_txt, input_pdf, output_pdf])
-                    process.wait()
+    This thread downloads a batch at a time and hands each message's PDFs to the OCR pool. A
+    sender thread takes the messages in order from a bounded queue, waits for their OCR and
+    mails them. Each message sent is recorded in the sent log straight away, and flagged here
+    as soon as this thread gets to it, as the IMAP connection belongs to this thread.
+    """
+    to_send = Queue(SEND_QUEUE_SIZE)
+    sent = Queue()
+    with tempfile.TemporaryDirectory() as directory, ThreadPoolExecutor(1) as sender:
+        sending = sender.submit(send_stage, to_send, sent, directory, uidvalidity, username, receiver,
+                                password, smtp)
+        try:
+            for start in range(0, len(message_ids), BATCH_SIZE):
+                for mid, jobs in process_messages(server, message_ids[start:start + BATCH_SIZE], directory):
+                    _put(to_send, (mid, jobs), sending)
+                    flag_sent(server, sent, username, uidvalidity)
+            _put(to_send, None, sending)
+            sending.result()
+        except BaseException:
+            # A sender still running is stopped after the message it is on
+            if not sending.done():
+                _drain(to_send)
+                to_send.put(None)
+            sending.exception()
+            try:
+                flag_sent(server, sent, username, uidvalidity)
+            except Exception as e:
+                # Most likely the connection is what failed. The messages
+                # are in the sent log, so the next run flags them instead
+                # of sending them again.
+                print(f'{username}: could not flag the messages sent: {e!r}')
+            raise
+        flag_sent(server, sent, username, uidvalidity)
 
-                with open(output_pdf, "rb") as fil:
-                    part = MIMEApplication(fil.read(), Name=basename(f.name))
-                    part['Content-Disposition'] = 'attachment; filename="%s"' % basename(f.name)
-                    msg.attach(part)
-                with open(output_txt, "rb") as fil:
-                    part = MIMEApplication(fil.read(), Name=basename(f.name.replace('pdf', 'txt')))
-                    fil.seek(0)
-                    subject = fil.readline().decode('utf8').strip()
-                    msg['Subject'] = re.sub(r'([^\s\w]|_)+', '', subject)
-                    part['Content-Disposition'] = 'attachment; filename="%s"' % basename(f.name.replace('pdf', 'txt'))
-                    msg.attach(part)
 
-        conn = SMTP(smtp, port=587)
-        conn.set_debuglevel(False)
+def _put(queue: Queue, item, sending):
+    # Wait for room in the queue, unless the sender has died
+    while True:
+        if sending.done():
+            sending.result()
+            raise RuntimeError('sender stopped early')
+        try:
+            queue.put(item, timeout=1)
+            return
+        except Full:
+            pass
 
-        msg['From'] = username  # some SMTP servers will do this automatically, not all
 
-        conn.login(username, password)
+def _drain(queue: Queue):
+    # Drop the queued messages. Their OCR carries on and is cached for
+    # the next run.
+    while True:
         try:
-            conn.sendmail(username, [receiver], msg.as_string())
-            server.add_flags([mid], ['processed'])
-        finally:
-            conn.close()
+            queue.get_nowait()
+        except Empty:
+            return
+
 
-    server.logout()
-    server.shutdown()
+def flag_sent(server: IMAPClient, sent: Queue, username: str, uidvalidity: int):
+    mids = []
+    while True:
+        try:
+            mids.append(sent.get_nowait())
+        except Empty:
+            break
+    if mids:
+        server.add_flags(mids, ['processed'])
+        sent_log.discard(username, uidvalidity, mids)
 
 
-if __name__ == "__main__":
+def is_pdf(filename: str, content_type: str) -> bool:
+    return content_type == 'application/pdf'
+
+
+class HashingWriter:
+    """Writes to the file *f*, keeping the SHA-256 of what was written."""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.f.write(data)
+
+
+def download_pdfs(server: IMAPClient, plans, directory: str):
+    """Stream the PDFs picked by *plans* to files in *directory*.
+
+    Returns the ``(path, SHA-256 digest)`` of each message's PDFs.
+    """
+    paths = defaultdict(list)
+    downloads = []
+    writers = []
+    with ExitStack() as stack:
+        for mid, plan in plans.items():
+            for filename, part, section in plan.attachments:
+                if section is None:
+                    continue
+                path = os.path.join(directory, str(mid), basename(filename))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                writer = HashingWriter(stack.enter_context(open(path, 'wb')))
+                downloads.append((mid, part, section, writer))
+                writers.append((mid, path, writer))
+        download_parts(server, downloads)
+    for mid, path, writer in writers:
+        paths[mid].append((path, writer.sha256.digest()))
+    return paths
+
+
+def process_messages(server: IMAPClient, message_ids, directory: str):
+    """Download the PDFs of *message_ids* into *directory* and start OCRing them.
+
+    Returns a list of ``(mid, jobs)`` tuples, *jobs* being a list of ``(pdf path, future)`` tuples
+    whose futures give the paths of the OCR'd PDF and of its text.
+    """
+    messages = server.fetch(message_ids, data=['ENVELOPE', 'BODYSTRUCTURE', 'RFC822.SIZE'])
+    plans = {mid: plan_parts(content[b'BODYSTRUCTURE'], download_attachments=is_pdf)
+             for mid, content in messages.items()}
+
+    # The PDFs of the whole batch are streamed to disk in pipelined chunks
+    pdfs = download_pdfs(server, plans, directory)
+
+    return [(mid, [(pdf, start_ocr(pdf, digest)) for pdf, digest in pdfs.get(mid, [])])
+            for mid in plans]
+
+
+def ocr_outputs(input_pdf: str):
+    return input_pdf.replace('.pdf', '_ocr.pdf'), input_pdf.replace('.pdf', '.txt')
+
+
+def start_ocr(input_pdf: str, digest: bytes) -> Future:
+    """Start OCRing *input_pdf*, whose content has SHA-256 *digest*, unless its result is cached.
+
+    The future returned gives the paths of the OCR'd PDF and of its text.
+    """
+    key = OCRCache.key(digest, OCR_LANGUAGES)
+    outputs = ocr_outputs(input_pdf)
+    future = Future()
+    future.set_running_or_notify_cancel()
+    with ocr_in_flight_lock:
+        pending = ocr_in_flight.get(key)
+    if pending is None:
+        # Copied out of the cache without the lock, which every PDF waits on
+        if ocr_cache.get(key, *outputs):
+            future.set_result(outputs)
+            return future
+        with ocr_in_flight_lock:
+            # Another message may have started on the same PDF meanwhile
+            pending = ocr_in_flight.get(key)
+            if pending is None:
+                ocr_in_flight[key] = future
+    # Callbacks run straight away on jobs already done, so they are
+    # added without holding the lock
+    if pending is None:
+        ocr_pool.submit(ocr_pdf, input_pdf).add_done_callback(lambda job: _ocr_done(key, job, future))
+    else:
+        pending.add_done_callback(lambda _: _copy_ocr(key, pending, input_pdf, future))
+    return future
+
+
+def _ocr_done(key: str, job: Future, future: Future):
+    # Cache the result before anyone waiting on it can remove the files
+    error = outputs = None
+    try:
+        outputs = job.result()
+        ocr_cache.put(key, *outputs)
+    except BaseException as e:
+        error = e
+    with ocr_in_flight_lock:
+        if ocr_in_flight.get(key) is future:
+            del ocr_in_flight[key]
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(outputs)
+
+
+def _copy_ocr(key: str, pending: Future, input_pdf: str, future: Future):
+    # The same PDF was OCR'd for another message
+    if pending.exception() is not None:
+        future.set_exception(pending.exception())
+        return
+    outputs = ocr_outputs(input_pdf)
+    if ocr_cache.get(key, *outputs):
+        future.set_result(outputs)
+    else:
+        # Evicted already
+        ocr_pool.submit(ocr_pdf, input_pdf).add_done_callback(lambda job: _ocr_done(key, job, future))
+
+
+def ocr_pdf(input_pdf: str):
+    """OCR *input_pdf*, returning the paths of the OCR'd PDF and of its text. Runs in the OCR pool."""
+    output_pdf, output_txt = ocr_outputs(input_pdf)
+    # One job each, the pool already keeps every core busy
+    subprocess.run(['/usr/local/bin/ocrmypdf', '--jobs', '1', '-l', OCR_LANGUAGES,
+                    '--sidecar', output_txt, input_pdf, output_pdf], check=True)
+    return output_pdf, output_txt
+
+
+def send_stage(to_send: Queue, sent: Queue, directory: str, uidvalidity: int, username: str, receiver: str,
+               password: str, smtp: str):
+    """Send each message taken from *to_send* once its PDFs are OCR'd, until None is taken.
+
+    The ids of the messages sent are recorded in the sent log and put on *sent*. Runs on the
+    sender thread of :py:func:`process_inbox`.
+    """
+    while True:
+        item = to_send.get()
+        if item is None:
+            return
+        mid, jobs = item
+        pdfs = [(pdf,) + job.result() for pdf, job in jobs]
+        send_processed(pdfs, username, receiver, password, smtp)
+        sent_log.add(username, uidvalidity, mid)
+        sent.put(mid)
+        shutil.rmtree(os.path.join(directory, str(mid)), ignore_errors=True)
+
+
+def send_processed(pdfs, username: str, receiver: str, password: str, smtp: str):
+    msg = MIMEMultipart()
+
+    for input_pdf, output_pdf, output_txt in pdfs:
+        with open(output_pdf, "rb") as fil:
+            part = MIMEApplication(fil.read(), Name=basename(input_pdf))
+            part['Content-Disposition'] = 'attachment; filename="%s"' % basename(input_pdf)
+            msg.attach(part)
+        with open(output_txt, "rb") as fil:
+            part = MIMEApplication(fil.read(), Name=basename(input_pdf.replace('pdf', 'txt')))
+            fil.seek(0)
+            subject = fil.readline().decode('utf8').strip()
+            msg['Subject'] = re.sub(r'([^\s\w]|_)+', '', subject)
+            part['Content-Disposition'] = 'attachment; filename="%s"' % basename(input_pdf.replace('pdf', 'txt'))
+            msg.attach(part)
+
+    msg['From'] = username  # some SMTP servers will do this automatically, not all
+
+    smtp_pool.send(smtp, SMTP_PORT, username, password, msg, username, [receiver])
+
+
+scheduler = AccountScheduler(process_user, workers=WORKERS, timeout=ACCOUNT_TIMEOUT)
+
+
+def poll():
+    """Process every account every POLL_INTERVAL seconds, without IDLE."""
     s = sched.scheduler(time.time, time.sleep)
 
     def do_something(sc):
         # do your stuff
         main()
-        s.enter(60, 1, do_something, (sc,))
+        s.enter(POLL_INTERVAL, 1, do_something, (sc,))
 
     s.enter(0, 1, do_something, (s,))
     s.run()
+
+
+def run(argv):
+    if '--poll' in argv:
+        poll()
+    else:
+        push()
+
+
+if __name__ == "__main__":
+    run(sys.argv)
@@ -0,0 +1,129 @@
+# coding=utf-8
+"""
+Watches a folder with IMAP IDLE (:rfc:`2177`) and calls back when
+messages arrive or change, so an account is only processed when there
+is something to do::
+
+    watcher = IdleWatcher(username, connect, wake=lambda: scheduler.trigger(username, settings))
+    watcher.start()
+
+The watcher holds its own connection, used for nothing but IDLE. IDLE
+is restarted every *renew* seconds, as servers may drop connections
+that have idled for 30 minutes, and the connection is re-established
+with a backoff if it is lost. Each time it connects the watcher calls
+back once, to catch up on anything that happened while it wasn't
+watching.
+"""
+import threading
+import time
+import traceback
+from typing import Callable, Iterable
+
+# Restart IDLE well within the 29 minutes of RFC 2177
+IDLE_RENEW = 25 * 60
+
+# Reconnection delays double from the first up to the second
+RECONNECT_BACKOFF = (1, 300)
+
+
+class IdleWatcher(threading.Thread):
+    """Watches *folder* of *account* on a connection opened by
+    *connect*, a callable returning a logged in
+    :py:class:`~net.imap.imapclient.IMAPClient`. *wake* is called on
+    EXISTS responses, and on FETCH responses unless they carry one of
+    *ignore_flags* (e.g. a flag set by the processing itself).
+
+    :py:attr:`idling` is set while the folder is being watched. It is
+    never set for servers without IDLE, which have to be polled.
+    """
+
+    def __init__(self, account: str, connect: Callable, wake: Callable[[], object],
+                 folder: str = 'INBOX', ignore_flags: Iterable[bytes] = (), renew: float = IDLE_RENEW):
+        super().__init__(name=f'idle {account}', daemon=True)
+        self.account = account
+        self.connect = connect
+        self.wake = wake
+        self.folder = folder
+        self.ignore_flags = set(flag.lower() for flag in ignore_flags)
+        self.renew = renew
+        self.idling = threading.Event()
+        self._stopping = threading.Event()
+        self._client = None
+
+    def stop(self):
+        """Stop watching and close the connection.
+        """
+        self._stopping.set()
+        client = self._client
+        if client is not None:
+            try:
+                client.shutdown()
+            except OSError:
+                pass
+
+    def run(self):
+        delay = RECONNECT_BACKOFF[0]
+        while not self._stopping.is_set():
+            try:
+                if not self._watch():
+                    return
+                delay = RECONNECT_BACKOFF[0]
+            except Exception:
+                if self._stopping.is_set():
+                    return
+                print(f'{self.account}: IDLE connection lost')
+                traceback.print_exc()
+                self._stopping.wait(delay)
+                delay = min(delay * 2, RECONNECT_BACKOFF[1])
+            finally:
+                self.idling.clear()
+                self._close()
+
+    def _watch(self) -> bool:
+        # Returns False if the server can't IDLE, raises when the
+        # connection is lost
+        client = self._client = self.connect()
+        if not client.has_capability('IDLE'):
+            print(f'{self.account}: no IDLE, polling instead')
+            return False
+        client.select_folder(self.folder, readonly=True)
+        self.idling.set()
+        self.wake()
+        while not self._stopping.is_set():
+            client.idle()
+            deadline = time.monotonic() + self.renew
+            try:
+                while not self._stopping.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    started = time.monotonic()
+                    responses = client.idle_check(timeout=remaining)
+                    if not responses and time.monotonic() - started < remaining / 2:
+                        # Readable but nothing to read: the server hung up
+                        raise ConnectionError('connection closed by the server')
+                    if any(self._wanted(response) for response in responses):
+                        self.wake()
+            finally:
+                if not self._stopping.is_set():
+                    client.idle_done()
+        return True
+
+    def _wanted(self, response) -> bool:
+        if len(response) < 2:
+            return False
+        if response[1] == b'EXISTS':
+            return True
+        if response[1] == b'FETCH' and len(response) > 2:
+            data = response[2]
+            flags = dict(zip(data[::2], data[1::2])).get(b'FLAGS', ())
+            return not any(flag.lower() in self.ignore_flags for flag in flags)
+        return False
+
+    def _close(self):
+        client, self._client = self._client, None
+        if client is not None:
+            try:
+                client.logout()
+            except Exception:
+                pass
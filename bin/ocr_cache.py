@@ -0,0 +1,139 @@
+# coding=utf-8
+"""
+A disk cache of OCR results, keyed by the content of the PDF.
+
+The same PDF turns up again with forwarded invoices, or when a message
+is processed a second time after a failed send. Its OCR'd PDF and text
+are then copied out of the cache instead of running the OCR again::
+
+    cache = OCRCache('ocr_cache', max_bytes=1024 ** 3)
+    key = OCRCache.key(hashlib.sha256(pdf_bytes).digest(), 'deu+fra+eng')
+    if not cache.get(key, output_pdf, output_txt):
+        ocr(input_pdf, output_pdf, output_txt)
+        cache.put(key, output_pdf, output_txt)
+
+Least recently used results are evicted once the cache grows beyond
+*max_bytes*.
+"""
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+
+class OCRCache:
+    """OCR results stored in *directory* as ``<key>.pdf`` and
+    ``<key>.txt`` pairs, at most *max_bytes* of them. Safe to share
+    between threads.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Key -> size of the pair, least recently used first
+        self._entries = OrderedDict()
+        self._size = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def key(digest: bytes, settings: str) -> str:
+        """The cache key for a PDF with SHA-256 *digest* OCR'd with
+        *settings*, e.g. the languages.
+        """
+        return hashlib.sha256(digest + b'\0' + settings.encode('utf8')).hexdigest()
+
+    def get(self, key: str, output_pdf: str, output_txt: str) -> bool:
+        """Copy the cached result for *key* to *output_pdf* and
+        *output_txt*. Returns False if there is none.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return False
+            self._entries.move_to_end(key)
+        # Copied without the lock so other lookups don't wait on the disk
+        pdf, txt = self._paths(key)
+        try:
+            shutil.copyfile(pdf, output_pdf)
+            shutil.copyfile(txt, output_txt)
+            os.utime(pdf)
+        except OSError:
+            # Evicted meanwhile, or removed behind our back
+            with self._lock:
+                if key in self._entries:
+                    self._remove(key)
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def put(self, key: str, output_pdf: str, output_txt: str):
+        """Store the OCR'd *output_pdf* and *output_txt* under *key*.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+        pdf, txt = self._paths(key)
+        # Copied under temporary names so readers never see half a file
+        suffix = '.%d.%d.tmp' % (os.getpid(), threading.get_ident())
+        shutil.copyfile(output_pdf, pdf + suffix)
+        shutil.copyfile(output_txt, txt + suffix)
+        os.replace(txt + suffix, txt)
+        os.replace(pdf + suffix, pdf)
+        size = os.path.getsize(pdf) + os.path.getsize(txt)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = size
+                self._size += size
+            self._evict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def _paths(self, key: str):
+        base = os.path.join(self.directory, key)
+        return base + '.pdf', base + '.txt'
+
+    def _load(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                os.remove(os.path.join(self.directory, name))
+                continue
+            key, ext = os.path.splitext(name)
+            if ext != '.pdf':
+                continue
+            pdf, txt = self._paths(key)
+            if not os.path.exists(txt):
+                os.remove(pdf)
+                continue
+            stat = os.stat(pdf)
+            entries.append((stat.st_mtime, key, stat.st_size + os.path.getsize(txt)))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._size += size
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        self._size -= self._entries.pop(key)
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
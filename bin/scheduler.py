@@ -0,0 +1,227 @@
+# coding=utf-8
+"""
+Runs a job for many accounts at once on a pool of worker threads.
+
+Each cycle starts every account that is due, so a cycle takes about as
+long as the slowest account rather than the sum of them all::
+
+    scheduler = AccountScheduler(process_user, workers=8, timeout=300)
+    while True:
+        scheduler.run_cycle(config['users'])
+        time.sleep(60)
+
+Accounts can also be run as soon as something happens to them, with
+:py:meth:`AccountScheduler.trigger`, e.g. from an IDLE watcher.
+
+An account never has more than one run in flight. A run that fails or
+takes longer than *timeout* from when it starts puts its account on an
+exponential backoff; a run that overruns is left to finish in the
+background (threads can't be killed, so jobs should use socket
+timeouts) and its account is skipped until it does. Runs still queued
+when every worker is held up by an overrunning run are cancelled
+without counting against their account.
+"""
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+# Outcomes of an account's run in a cycle
+DONE = 'done'
+FAILED = 'failed'
+TIMED_OUT = 'timed out'
+RUNNING = 'still running'
+BACKING_OFF = 'backing off'
+NOT_STARTED = 'not started'
+
+
+class AccountScheduler:
+    """Calls ``job(account, **settings)`` for each account given to
+    :py:meth:`run_cycle`, with at most *workers* accounts running at
+    once. Runs taking more than *timeout* seconds from when they start
+    are abandoned by the cycle. Failing accounts are retried after
+    *backoff* seconds, doubling for each consecutive failure up to
+    *max_backoff*.
+    """
+
+    def __init__(self, job: Callable, workers: int = 8, timeout: float = 300,
+                 backoff: float = 60, max_backoff: float = 3600, clock: Callable[[], float] = time.monotonic):
+        self.job = job
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix='account')
+        # Reentrant, as cancelling a queued run calls _finished at once
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._running = {}
+        # Accounts whose run has started -> when it did
+        self._started = {}
+        # Accounts triggered while running or backing off -> settings
+        self._rerun = {}
+        self._timed_out = set()
+        self._failures = {}
+        self._not_before = {}
+
+    def run_cycle(self, accounts: Dict[str, dict]) -> Dict[str, str]:
+        """Run the job for every due account in *accounts*, a dict
+        mapping account names to the job's keyword arguments, and wait
+        for the runs to finish or time out. Returns the outcome of each
+        account.
+        """
+        outcomes = {}
+        started = {}
+        now = self.clock()
+        with self._lock:
+            for account, settings in accounts.items():
+                if account in self._running:
+                    outcomes[account] = RUNNING
+                elif self._not_before.get(account, now) > now:
+                    outcomes[account] = BACKING_OFF
+                else:
+                    started[account] = self._submit(account, settings)
+        for account, future in started.items():
+            self._watch(account, future)
+
+        overran = self._wait(started, outcomes)
+        for account in overran:
+            self._failed(account)
+        for account, future in started.items():
+            if account in outcomes:
+                continue
+            if future.exception() is not None:
+                outcomes[account] = FAILED
+            else:
+                outcomes[account] = DONE
+        return outcomes
+
+    def _wait(self, futures: dict, outcomes: Dict[str, str]) -> list:
+        # Wait for each run in *futures* to finish or overrun its
+        # timeout, recording the runs that don't finish in *outcomes*.
+        # Returns the accounts that overran.
+        overran = []
+        waiting = dict(futures)
+        with self._lock:
+            while waiting:
+                now = self.clock()
+                for account, future in list(waiting.items()):
+                    if self._running.get(account) is not future:
+                        del waiting[account]
+                    elif account in self._started and now - self._started[account] >= self.timeout:
+                        # Under the lock so _finished sees the mark if
+                        # the run completes just after the check
+                        self._timed_out.add(account)
+                        outcomes[account] = TIMED_OUT
+                        overran.append(account)
+                        del waiting[account]
+                if not waiting:
+                    break
+                queued = [account for account in waiting if account not in self._started]
+                deadlines = [started + self.timeout for started in self._started.values()
+                             if started + self.timeout > now]
+                if queued and not deadlines and len(self._started) >= self.workers:
+                    # Every worker is held up by an overrunning run, so
+                    # the queued runs may never start
+                    for account in queued:
+                        if waiting[account].cancel():
+                            outcomes[account] = NOT_STARTED
+                            del waiting[account]
+                    continue
+                self._changed.wait(min(deadlines) - now if deadlines else None)
+        return overran
+
+    def trigger(self, account: str, settings: dict) -> bool:
+        """Start a run for *account* with keyword arguments *settings*
+        without waiting for it, returning True if it was started. If
+        the account is running already another run follows; if it is
+        backing off it runs once it is due.
+        """
+        with self._lock:
+            if account in self._running:
+                self._rerun[account] = settings
+                return False
+            delay = self._not_before.get(account, 0) - self.clock()
+            if delay > 0:
+                # A timer is already set if a run is pending
+                pending = account in self._rerun
+                self._rerun[account] = settings
+            else:
+                future = self._submit(account, settings)
+        if delay > 0:
+            if not pending:
+                timer = threading.Timer(delay, self._trigger_rerun, (account,))
+                timer.daemon = True
+                timer.start()
+            return False
+        self._watch(account, future)
+        return True
+
+    def _trigger_rerun(self, account: str):
+        # With the last settings, unless the account has run since
+        with self._lock:
+            settings = self._rerun.pop(account, None)
+        if settings is not None:
+            self.trigger(account, settings)
+
+    def shutdown(self):
+        """Wait for the runs still in flight and stop the workers.
+        """
+        self._pool.shutdown()
+
+    def _submit(self, account: str, settings: dict):
+        # With the lock held
+        self._rerun.pop(account, None)
+        future = self._pool.submit(self._run, account, settings)
+        self._running[account] = future
+        return future
+
+    def _run(self, account: str, settings: dict):
+        with self._lock:
+            self._started[account] = self.clock()
+            self._changed.notify_all()
+        return self.job(account, **settings)
+
+    def _watch(self, account: str, future):
+        # Without the lock, as the callback runs straight away if the
+        # run is already over
+        future.add_done_callback(lambda f: self._finished(account, f))
+
+    def _finished(self, account: str, future):
+        error = None if future.cancelled() else future.exception()
+        if error is not None:
+            print(f'{account} failed:')
+            traceback.print_exception(type(error), error, error.__traceback__)
+        rerun = None
+        with self._lock:
+            # An overrunning run was already counted as a failure
+            counted = account in self._timed_out
+            self._timed_out.discard(account)
+            if future.cancelled():
+                pass
+            elif error is None:
+                self._failures.pop(account, None)
+                self._not_before.pop(account, None)
+                rerun = self._rerun.get(account)
+            elif not counted:
+                self._failed(account)
+            # Only once the outcome is recorded, which run_cycle waits for
+            self._running.pop(account, None)
+            self._started.pop(account, None)
+            self._changed.notify_all()
+        if rerun is not None:
+            self.trigger(account, rerun)
+
+    def _failed(self, account: str):
+        with self._lock:
+            failures = self._failures[account] = self._failures.get(account, 0) + 1
+            delay = min(self.backoff * 2 ** (failures - 1), self.max_backoff)
+            self._not_before[account] = self.clock() + delay
+            rerun = self._rerun.pop(account, None)
+        if rerun is not None:
+            # Run when the backoff is over, as nothing may trigger it again
+            timer = threading.Timer(delay, self.trigger, (account, rerun))
+            timer.daemon = True
+            timer.start()
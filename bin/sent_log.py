@@ -0,0 +1,75 @@
+# coding=utf-8
+"""
+A record of the messages sent on but not yet flagged as processed.
+
+Messages are flagged on the IMAP connection some time after they are
+sent. If the connection drops in between, the next run would find them
+unflagged and send them again. Recording each message as soon as it is
+sent lets that run flag it instead::
+
+    log = SentLog('sent_log.json')
+    send(message)
+    log.add(account, uidvalidity, uid)
+    ...
+    server.add_flags([uid], ['processed'])
+    log.discard(account, uidvalidity, [uid])
+"""
+import json
+import os
+import threading
+from typing import Iterable, Set
+
+
+class SentLog:
+    """The UIDs sent for each account, kept in a JSON file at *path*,
+    or only in memory if *path* is None. Safe to share between threads.
+
+    UIDs are only meaningful with the UIDVALIDITY they were sent under,
+    so those recorded under an older one are forgotten.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self._lock = threading.Lock()
+        # Account -> [uidvalidity, [uid, ...]]
+        self._sent = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self._sent = json.load(f)
+
+    def add(self, account: str, uidvalidity: int, uid: int):
+        """Record that *uid* has been sent. Written out before returning.
+        """
+        with self._lock:
+            validity, uids = self._sent.get(account, (uidvalidity, []))
+            if validity != uidvalidity:
+                uids = []
+            self._sent[account] = [uidvalidity, sorted(set(uids) | {uid})]
+            self._save()
+
+    def get(self, account: str, uidvalidity: int) -> Set[int]:
+        """The UIDs recorded as sent but not discarded yet.
+        """
+        with self._lock:
+            validity, uids = self._sent.get(account, (uidvalidity, []))
+        return set(uids) if validity == uidvalidity else set()
+
+    def discard(self, account: str, uidvalidity: int, uids: Iterable[int]):
+        """Forget *uids*, once they have been flagged.
+        """
+        with self._lock:
+            validity, recorded = self._sent.get(account, (uidvalidity, []))
+            remaining = sorted(set(recorded).difference(uids)) if validity == uidvalidity else []
+            if remaining:
+                self._sent[account] = [validity, remaining]
+            elif self._sent.pop(account, None) is None:
+                return
+            self._save()
+
+    def _save(self):
+        # With the lock held
+        if self.path:
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self._sent, f)
+            os.replace(tmp, self.path)
@@ -0,0 +1,135 @@
+# coding=utf-8
+
+import base64
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from bin.sent_log import SentLog
+from bin.test.util import fake_ocr, import_dms
+from net.imap.imapclient import IMAPClient
+from net.imap.sync import MailboxSync, SyncStateStore
+from net.imap.test.fake_server import FakeIMAPServer
+
+dms = import_dms()
+
+BODYSTRUCTURE = (
+    b'(("text" "plain" ("charset" "utf-8") NIL NIL "7bit" 4 1 NIL NIL NIL NIL)'
+    b'("application" "pdf" ("name" "scan.pdf") NIL NIL "base64" 12 NIL '
+    b'("attachment" ("filename" "scan.pdf")) NIL NIL) '
+    b'"mixed" ("boundary" "x") NIL NIL NIL)'
+)
+
+
+class TestProcessInbox(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeIMAPServer(5)
+        for mid in range(1, 6):
+            self.server.bodies[mid] = (BODYSTRUCTURE, {
+                '1': b'body',
+                '2': base64.b64encode(b'%%PDF scan %d' % mid),
+            })
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+        self.sent = []
+        self.fail_on = None
+        self.drop_after = None
+        self.sent_log = SentLog()
+        for name, value in [('sent_log', self.sent_log), ('send_processed', self.send),
+                            ('ocr_pdf', fake_ocr), ('ocr_cache', dms.OCRCache(tempfile.mkdtemp()))]:
+            patcher = mock.patch.object(dms, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.store = SyncStateStore()
+
+    def send(self, pdfs, username, receiver, password, smtp):
+        mid = int(os.path.basename(os.path.dirname(pdfs[0][0])))
+        if mid == self.fail_on:
+            raise OSError('SMTP server went away')
+        self.sent.append(mid)
+        if mid == self.drop_after:
+            self.server.drop_connections()
+
+    def connect(self):
+        client = IMAPClient(self.server.host, self.server.port)
+        client.login('user', 'pass')
+        self.addCleanup(client.shutdown)
+        return client
+
+    def run_mailbox(self):
+        client = self.connect()
+        sync = MailboxSync(client, self.store, 'user')
+        dms.process_mailbox(client, sync, 'user', 'receiver@example.com', 'pass', 'smtp.example.com')
+
+    def flagged(self):
+        return sorted(mid for mid, flags in self.server.flags.items() if b'processed' in flags)
+
+    def test_all_sent_and_flagged(self):
+        self.run_mailbox()
+
+        self.assertEqual(sorted(self.sent), [1, 2, 3, 4, 5])
+        self.assertEqual(self.flagged(), [1, 2, 3, 4, 5])
+        self.assertEqual(self.sent_log.get('user', 1), set())
+
+    def test_sender_failing_mid_batch(self):
+        self.fail_on = 3
+
+        self.assertRaises(OSError, self.run_mailbox)
+
+        self.assertEqual(self.sent, [1, 2])
+        self.assertEqual(self.flagged(), [1, 2])
+        self.assertEqual(self.sent_log.get('user', 1), set())
+
+        self.fail_on = None
+        self.run_mailbox()
+        self.assertEqual(self.sent, [1, 2, 3, 4, 5])
+        self.assertEqual(self.flagged(), [1, 2, 3, 4, 5])
+
+    def test_connection_lost_before_flagging(self):
+        self.drop_after = 2
+        self.fail_on = 3
+
+        with self.assertRaises(Exception):
+            self.run_mailbox()
+
+        self.assertEqual(self.sent, [1, 2])
+        self.assertIn(2, self.sent_log.get('user', 1))
+
+        self.fail_on = None
+        self.drop_after = None
+        self.run_mailbox()
+        # Flagged by the retry rather than sent again
+        self.assertEqual(self.sent, [1, 2, 3, 4, 5])
+        self.assertEqual(self.flagged(), [1, 2, 3, 4, 5])
+        self.assertEqual(self.sent_log.get('user', 1), set())
+
+
+class TestSentLog(unittest.TestCase):
+
+    def test_persisted(self):
+        path = os.path.join(tempfile.mkdtemp(), 'sent.json')
+        log = SentLog(path)
+        log.add('user', 1, 5)
+        log.add('user', 1, 3)
+        log.add('other', 7, 1)
+
+        self.assertEqual(SentLog(path).get('user', 1), {3, 5})
+        log.discard('user', 1, [3, 5])
+        self.assertEqual(SentLog(path).get('user', 1), set())
+        self.assertEqual(SentLog(path).get('other', 7), {1})
+
+    def test_uidvalidity_change(self):
+        log = SentLog()
+        log.add('user', 1, 5)
+
+        self.assertEqual(log.get('user', 2), set())
+        log.add('user', 2, 6)
+        self.assertEqual(log.get('user', 2), {6})
+        self.assertEqual(log.get('user', 1), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
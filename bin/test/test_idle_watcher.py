@@ -0,0 +1,133 @@
+# coding=utf-8
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from bin import idle_watcher
+from bin.idle_watcher import IdleWatcher
+from bin.test.util import import_dms
+from net.imap.imapclient import IMAPClient
+from net.imap.test.fake_server import FakeIMAPServer
+
+dms = import_dms()
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out waiting')
+        time.sleep(0.01)
+
+
+class TestIdleWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeIMAPServer(5)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.wakes = 0
+        self.lock = threading.Lock()
+        patcher = mock.patch.object(idle_watcher, 'RECONNECT_BACKOFF', (0.05, 0.1))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def connect(self):
+        client = IMAPClient(self.server.host, self.server.port)
+        client.login('user', 'pass')
+        return client
+
+    def wake(self):
+        with self.lock:
+            self.wakes += 1
+
+    def idle_started(self):
+        # idling is set just before IDLE is sent, so new messages are
+        # only delivered once the server has it
+        wait_until(lambda: self.server._idlers)
+
+    def watch(self):
+        watcher = IdleWatcher('user', self.connect, self.wake)
+        watcher.start()
+        self.addCleanup(watcher.join, 5)
+        self.addCleanup(watcher.stop)
+        return watcher
+
+    def test_wakes_on_new_messages(self):
+        watcher = self.watch()
+        self.assertTrue(watcher.idling.wait(5))
+        # Once on connecting, to catch up
+        wait_until(lambda: self.wakes == 1)
+        self.idle_started()
+
+        self.server.deliver()
+
+        wait_until(lambda: self.wakes == 2)
+        self.assertIn(b'EXAMINE "INBOX"', [c.split(b' ', 1)[1] for c in self.server.commands])
+
+    def test_reconnects_when_connection_lost(self):
+        watcher = self.watch()
+        self.assertTrue(watcher.idling.wait(5))
+
+        self.server.drop_connections()
+
+        wait_until(lambda: self.server.connections == 2 and watcher.idling.is_set())
+        wait_until(lambda: self.wakes == 2)
+        self.idle_started()
+        self.server.deliver()
+        wait_until(lambda: self.wakes == 3)
+
+    def test_falls_back_to_polling_without_idle(self):
+        self.server.capabilities = b'IMAP4rev1 UIDPLUS'
+
+        watcher = self.watch()
+        watcher.join(5)
+
+        self.assertFalse(watcher.is_alive())
+        self.assertFalse(watcher.idling.is_set())
+        self.assertEqual(self.wakes, 0)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_ignored_flags(self):
+        watcher = IdleWatcher('user', self.connect, self.wake, ignore_flags=[b'Processed'])
+
+        self.assertTrue(watcher._wanted((3, b'EXISTS')))
+        self.assertTrue(watcher._wanted((3, b'FETCH', (b'FLAGS', (b'\\Seen',)))))
+        self.assertFalse(watcher._wanted((3, b'FETCH', (b'FLAGS', (b'\\Seen', b'processed')))))
+        self.assertFalse(watcher._wanted((3, b'RECENT')))
+
+
+class StopPolling(Exception):
+    pass
+
+
+class TestPoll(unittest.TestCase):
+
+    def test_poll_option_keeps_polling_loop(self):
+        calls = []
+
+        def main(users=None):
+            calls.append(users)
+            if len(calls) == 3:
+                raise StopPolling()
+
+        with mock.patch.object(dms, 'main', main), mock.patch.object(dms, 'POLL_INTERVAL', 0.01), \
+                mock.patch.object(dms, 'push') as push:
+            self.assertRaises(StopPolling, dms.run, ['dms.py', '--poll'])
+
+        # Every account, every time, and no IDLE watchers
+        self.assertEqual(calls, [None, None, None])
+        push.assert_not_called()
+
+    def test_push_by_default(self):
+        with mock.patch.object(dms, 'poll') as poll, mock.patch.object(dms, 'push') as push:
+            dms.run(['dms.py'])
+
+        push.assert_called_once_with()
+        poll.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
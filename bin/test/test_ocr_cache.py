@@ -0,0 +1,194 @@
+# coding=utf-8
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from bin.ocr_cache import OCRCache
+from bin.test.util import fake_ocr, import_dms
+
+dms = import_dms()
+
+
+def digest(data):
+    return hashlib.sha256(data).digest()
+
+
+class TestOCRCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache_dir = os.path.join(self.directory, 'cache')
+        self.cache = OCRCache(self.cache_dir, max_bytes=100)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            return f.read()
+
+    def put(self, key, pdf=b'p' * 10, txt=b't' * 10):
+        self.cache.put(key, self.write('in.pdf', pdf), self.write('in.txt', txt))
+
+    def get(self, key):
+        return self.cache.get(key, os.path.join(self.directory, 'out.pdf'),
+                              os.path.join(self.directory, 'out.txt'))
+
+    def test_hit_and_miss(self):
+        key = OCRCache.key(digest(b'scan'), 'deu')
+        self.assertFalse(self.get(key))
+        self.put(key, b'ocrd', b'text')
+
+        self.assertTrue(self.get(key))
+        self.assertEqual(self.read('out.pdf'), b'ocrd')
+        self.assertEqual(self.read('out.txt'), b'text')
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_key_depends_on_content_and_settings(self):
+        key = OCRCache.key(digest(b'scan'), 'deu')
+        self.put(key)
+
+        self.assertFalse(self.get(OCRCache.key(digest(b'scan, changed'), 'deu')))
+        self.assertFalse(self.get(OCRCache.key(digest(b'scan'), 'deu+eng')))
+        self.assertTrue(self.get(key))
+
+    def test_least_recently_used_evicted(self):
+        for key in 'a', 'b', 'c', 'd':
+            self.put(key)
+        self.assertTrue(self.get('a'))
+
+        self.put('e')
+
+        self.assertEqual(len(self.cache), 5)
+        self.put('f')
+        self.assertEqual(self.cache.size, 100)
+        self.assertFalse(self.get('b'))
+        self.assertTrue(self.get('a'))
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, 'b.pdf')))
+
+    def test_reloaded(self):
+        self.put('a')
+        self.put('b')
+
+        cache = OCRCache(self.cache_dir, max_bytes=100)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.size, 40)
+
+    def test_partial_entries_removed_on_load(self):
+        self.put('a')
+        os.remove(os.path.join(self.cache_dir, 'a.txt'))
+        with open(os.path.join(self.cache_dir, 'b.pdf.1.2.tmp'), 'wb') as f:
+            f.write(b'half')
+
+        cache = OCRCache(self.cache_dir, max_bytes=100)
+
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_entry_removed_behind_our_back(self):
+        self.put('a')
+        os.remove(os.path.join(self.cache_dir, 'a.pdf'))
+
+        self.assertFalse(self.get('a'))
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.size, 0)
+
+    def test_copied_without_lock(self):
+        self.put('a')
+        copy = shutil.copyfile
+
+        def copyfile(src, dst):
+            # Would block if get() held the lock
+            self.assertTrue(self.cache._lock.acquire(timeout=1))
+            self.cache._lock.release()
+            return copy(src, dst)
+
+        with mock.patch('bin.ocr_cache.shutil.copyfile', copyfile):
+            self.assertTrue(self.get('a'))
+        self.assertEqual(self.read('out.pdf'), b'p' * 10)
+
+    def test_evicted_while_copying(self):
+        self.put('a')
+        copy = shutil.copyfile
+
+        def copyfile(src, dst):
+            if src == os.path.join(self.cache_dir, 'a.txt'):
+                self.put('b', b'p' * 50, b't' * 50)
+            return copy(src, dst)
+
+        with mock.patch('bin.ocr_cache.shutil.copyfile', copyfile):
+            self.assertFalse(self.get('a'))
+        self.assertEqual(list(self.cache._entries), ['b'])
+        self.assertEqual(self.cache.size, 100)
+        self.assertEqual(self.cache.misses, 1)
+
+
+class TestStartOCR(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.ocr_runs = []
+        for name, value in [('ocr_pdf', self.ocr),
+                            ('ocr_cache', OCRCache(os.path.join(self.directory, 'cache')))]:
+            patcher = mock.patch.object(dms, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def ocr(self, input_pdf):
+        self.ocr_runs.append(input_pdf)
+        return fake_ocr(input_pdf)
+
+    def pdf(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path, digest(data)
+
+    def test_cache_hit_skips_ocr(self):
+        first = self.pdf('first.pdf', b'%PDF scan')
+        second = self.pdf('second.pdf', b'%PDF scan')
+
+        self.assertEqual(dms.start_ocr(*first).result(), dms.ocr_outputs(first[0]))
+        output_pdf, output_txt = dms.start_ocr(*second).result()
+
+        self.assertEqual(self.ocr_runs, [first[0]])
+        with open(output_pdf, 'rb') as f:
+            self.assertEqual(f.read(), b'%PDF scan')
+        with open(output_txt) as f:
+            self.assertEqual(f.read(), 'Invoice\n')
+
+    def test_cache_read_without_in_flight_lock(self):
+        first = self.pdf('first.pdf', b'%PDF scan')
+        dms.start_ocr(*first).result()
+        get = dms.ocr_cache.get
+
+        def cache_get(*args):
+            self.assertFalse(dms.ocr_in_flight_lock.locked())
+            return get(*args)
+
+        with mock.patch.object(dms.ocr_cache, 'get', cache_get):
+            dms.start_ocr(*self.pdf('second.pdf', b'%PDF scan')).result()
+        self.assertEqual(self.ocr_runs, [first[0]])
+
+    def test_changed_pdf_misses(self):
+        first = self.pdf('first.pdf', b'%PDF scan')
+        changed = self.pdf('changed.pdf', b'%PDF scan, changed')
+
+        dms.start_ocr(*first).result()
+        dms.start_ocr(*changed).result()
+
+        self.assertEqual(self.ocr_runs, [first[0], changed[0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
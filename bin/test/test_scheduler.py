@@ -0,0 +1,145 @@
+# coding=utf-8
+
+import threading
+import time
+import unittest
+
+from bin.scheduler import (AccountScheduler, BACKING_OFF, DONE, FAILED, NOT_STARTED, RUNNING,
+                           TIMED_OUT)
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestAccountScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.errors = {}
+        self.delays = {}
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def job(self, account, **settings):
+        self.calls.append((account, settings))
+        if account in self.errors:
+            raise self.errors[account]
+        if account == 'stuck':
+            self.release.wait(10)
+        time.sleep(self.delays.get(account, 0))
+
+    def scheduler(self, **kwargs):
+        scheduler = AccountScheduler(self.job, **kwargs)
+        self.addCleanup(scheduler.shutdown)
+        return scheduler
+
+    def test_runs_every_account(self):
+        scheduler = self.scheduler()
+
+        outcomes = scheduler.run_cycle({'a': {'x': 1}, 'b': {}})
+
+        self.assertEqual(outcomes, {'a': DONE, 'b': DONE})
+        self.assertEqual(sorted(self.calls), [('a', {'x': 1}), ('b', {})])
+
+    def test_failures_back_off(self):
+        clock = FakeClock()
+        scheduler = self.scheduler(backoff=10, clock=clock)
+        self.errors['a'] = RuntimeError('boom')
+
+        self.assertEqual(scheduler.run_cycle({'a': {}, 'b': {}}), {'a': FAILED, 'b': DONE})
+        self.assertEqual(scheduler.run_cycle({'a': {}, 'b': {}}), {'a': BACKING_OFF, 'b': DONE})
+
+        clock.now += 10
+        self.assertEqual(scheduler.run_cycle({'a': {}}), {'a': FAILED})
+        # The delay doubles with each failure in a row
+        clock.now += 10
+        self.assertEqual(scheduler.run_cycle({'a': {}}), {'a': BACKING_OFF})
+
+        del self.errors['a']
+        clock.now += 10
+        self.assertEqual(scheduler.run_cycle({'a': {}}), {'a': DONE})
+        self.assertEqual(scheduler.run_cycle({'a': {}}), {'a': DONE})
+
+    def test_timeout_counts_from_start_of_run(self):
+        # With one worker the second run only starts once the first is
+        # over, after more than the timeout in total
+        scheduler = self.scheduler(workers=1, timeout=0.5)
+        self.delays = {'a': 0.3, 'b': 0.3}
+
+        self.assertEqual(scheduler.run_cycle({'a': {}, 'b': {}}), {'a': DONE, 'b': DONE})
+
+    def test_overrunning_run(self):
+        scheduler = self.scheduler(timeout=0.1)
+
+        self.assertEqual(scheduler.run_cycle({'stuck': {}}), {'stuck': TIMED_OUT})
+        self.assertEqual(scheduler.run_cycle({'stuck': {}}), {'stuck': RUNNING})
+
+        # Skipped until the run is over, which clears the backoff if it
+        # succeeded after all
+        self.release.set()
+        time.sleep(0.1)
+        self.assertEqual(scheduler.run_cycle({'stuck': {}}), {'stuck': DONE})
+
+    def test_overrunning_run_backs_off(self):
+        scheduler = self.scheduler(timeout=0.1)
+        self.delays['slow'] = 0.3
+
+        self.assertEqual(scheduler.run_cycle({'slow': {}, 'a': {}}), {'slow': TIMED_OUT, 'a': DONE})
+        self.assertEqual(scheduler.run_cycle({'slow': {}}), {'slow': RUNNING})
+        self.assertEqual(scheduler._failures, {'slow': 1})
+
+    def test_queued_run_not_penalised(self):
+        scheduler = self.scheduler(workers=1, timeout=0.1)
+
+        outcomes = scheduler.run_cycle({'stuck': {}, 'b': {}})
+
+        self.assertEqual(outcomes, {'stuck': TIMED_OUT, 'b': NOT_STARTED})
+        self.assertEqual(scheduler.run_cycle({'b': {}}), {'b': NOT_STARTED})
+        self.release.set()
+        time.sleep(0.1)
+        self.assertEqual(scheduler.run_cycle({'b': {}}), {'b': DONE})
+        self.assertEqual(self.calls, [('stuck', {}), ('b', {})])
+
+    def test_trigger(self):
+        scheduler = self.scheduler()
+
+        self.assertTrue(scheduler.trigger('stuck', {'n': 1}))
+        time.sleep(0.1)
+        # Runs again once the current run is over, with the last settings
+        self.assertFalse(scheduler.trigger('stuck', {'n': 2}))
+        self.assertFalse(scheduler.trigger('stuck', {'n': 3}))
+        self.assertEqual(scheduler.run_cycle({'stuck': {}}), {'stuck': RUNNING})
+
+        self.release.set()
+        time.sleep(0.2)
+        self.assertEqual(self.calls, [('stuck', {'n': 1}), ('stuck', {'n': 3})])
+
+    def test_trigger_while_backing_off(self):
+        clock = FakeClock()
+        scheduler = self.scheduler(backoff=10, clock=clock)
+        self.errors['a'] = RuntimeError('boom')
+        scheduler.run_cycle({'a': {}})
+
+        self.assertFalse(scheduler.trigger('a', {}))
+        self.assertEqual(len(self.calls), 1)
+
+    def test_trigger_runs_once_backoff_is_over(self):
+        scheduler = self.scheduler(backoff=0.2)
+        self.errors['a'] = RuntimeError('boom')
+        scheduler.run_cycle({'a': {}})
+        del self.errors['a']
+
+        self.assertFalse(scheduler.trigger('a', {'n': 1}))
+        self.assertFalse(scheduler.trigger('a', {'n': 2}))
+        time.sleep(0.5)
+        self.assertEqual(self.calls, [('a', {}), ('a', {'n': 2})])
+
+
+if __name__ == '__main__':
+    unittest.main()
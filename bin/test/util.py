@@ -0,0 +1,34 @@
+# coding=utf-8
+import json
+import os
+import shutil
+import tempfile
+
+
+def import_dms():
+    """Import bin.dms, which reads its configuration from, and keeps its
+    state in, the working directory.
+    """
+    directory = tempfile.mkdtemp()
+    with open(os.path.join(directory, 'users.json'), 'w') as f:
+        json.dump({'users': {}, 'ocr_cache': os.path.join(directory, 'ocr_cache')}, f)
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        from bin import dms
+    finally:
+        os.chdir(cwd)
+    return dms
+
+
+def fake_ocr(input_pdf):
+    """Stands in for dms.ocr_pdf: the PDF is copied as it is and its
+    text is always the same.
+    """
+    from bin.dms import ocr_outputs
+
+    output_pdf, output_txt = ocr_outputs(input_pdf)
+    shutil.copyfile(input_pdf, output_pdf)
+    with open(output_txt, 'w') as f:
+        f.write('Invoice\n')
+    return output_pdf, output_txt
@@ -0,0 +1,532 @@
+# coding=utf-8
+"""
+An asyncio based IMAP client.
+
+AsyncIMAPClient offers the core of IMAPClient's interface as
+coroutines running on asyncio streams, so a single process can drive
+many mailboxes concurrently::
+
+    async def count_unseen(host, username, password):
+        async with AsyncIMAPClient(host, ssl=True) as client:
+            await client.login(username, password)
+            await client.select_folder('INBOX')
+            return len(await client.search(['UNSEEN']))
+
+Responses go through the same lexer, parser and response types as
+IMAPClient's so results have exactly the same shape.
+
+Commands on one client are run one at a time; use one client per
+mailbox for concurrency. Python 3 only.
+"""
+
+import asyncio
+import re
+import ssl as ssl_lib
+from collections import defaultdict
+from itertools import count
+
+from .imapclient import (
+    IMAPClient, SEARCH_RETURN_OPTIONS, DELETED, join_message_ids, process_select_response,
+    seq_to_parenstr, seq_to_parenstr_upper, _is8bit, _normalise_search_criteria,
+    _normalise_text_list, _quote, _summarise_search)
+from .datetime_util import datetime_to_INTERNALDATE
+from .imap_utf7 import FolderNameCache
+from .response_parser import (
+    parse_esearch_response, parse_fetch_response, parse_message_list, parse_response)
+from .util import to_bytes, to_unicode
+
+__all__ = ['AsyncIMAPClient']
+
+_LITERAL_RE = re.compile(br'\{(\d+)\}$')
+_UNTAGGED_RE = re.compile(br'\* (?:(\d+) )?([A-Za-z-]+)(?: (.*))?$', re.DOTALL)
+_RESPONSE_CODE_RE = re.compile(br'\[([A-Za-z-]+)(?: ([^\]]*))?\]')
+
+# Largest response line accepted, literals aside (a SEARCH response for
+# a large folder comes as one line)
+_LINE_LIMIT = 16 * 1024 * 1024
+
+
+class _Literal(bytes):
+    """An argument which is always sent as a literal."""
+
+
+class AsyncIMAPClient(object):
+    """An asyncio IMAP client for the server at *host*.
+
+    The *port*, *use_uid*, *ssl*, *ssl_context* and *timeout*
+    arguments and the *folder_encode*, *normalise_times*, *lazy_fetch*
+    and *compact_fetch* attributes are as for :py:class:`IMAPClient`. An
+    ``ssl.SSLContext`` is used for *ssl_context*.
+
+    Call ``await connect()`` before anything else, or use the client
+    as an ``async with`` context manager which connects on entry and
+    logs out on exit.
+    """
+
+    Error = IMAPClient.Error
+    AbortError = IMAPClient.AbortError
+    ReadOnlyError = IMAPClient.ReadOnlyError
+
+    def __init__(self, host, port=None, use_uid=True, ssl=False, ssl_context=None,
+                 timeout=None):
+        if port is None:
+            port = ssl and 993 or 143
+        self.host = host
+        self.port = port
+        self.ssl = ssl
+        self.ssl_context = ssl_context
+        self.use_uid = use_uid
+        self.folder_encode = True
+        self.normalise_times = True
+        self.lazy_fetch = False
+        self.compact_fetch = False
+        self._folder_names = FolderNameCache()
+        self.welcome = None
+
+        self._timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._lock = None
+        self._tags = count(1)
+        self._untagged = defaultdict(list)
+        self._responses = []
+        self._pending_read = None
+        self._cached_capabilities = None
+        self._idle_tag = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        try:
+            if self._writer is not None and not self._writer.is_closing():
+                await self.logout()
+        except (self.Error, OSError):
+            # Don't hide the exception that ended the block
+            if exc_type is None:
+                raise
+        finally:
+            await self.shutdown()
+
+    async def connect(self):
+        """Open the connection and read the server greeting.
+        """
+        context = None
+        if self.ssl:
+            context = self.ssl_context or ssl_lib.create_default_context()
+        self._lock = asyncio.Lock()
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=context, limit=_LINE_LIMIT),
+            self._timeout)
+        items = await self._read_response()
+        self.welcome = items[-1]
+        if not self.welcome.startswith((b'* OK', b'* PREAUTH')):
+            await self.shutdown()
+            raise self.Error('unexpected greeting: %s' % to_unicode(self.welcome))
+        return self
+
+    async def shutdown(self):
+        """Close the connection without logging out.
+        """
+        if self._pending_read is not None:
+            self._pending_read.cancel()
+            self._pending_read = None
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (OSError, ssl_lib.SSLError):
+                pass
+
+    async def login(self, username, password):
+        """Login using *username* and *password*, returning the
+        server response.
+        """
+        text, _ = await self._command(b'LOGIN', _astring(username), _astring(password))
+        self._cached_capabilities = None
+        return text
+
+    async def logout(self):
+        """Logout, returning the server response.
+        """
+        text, _ = await self._command(b'LOGOUT')
+        await self.shutdown()
+        return text
+
+    async def capabilities(self):
+        """Returns the server capability list.
+        """
+        if self._cached_capabilities is None:
+            _, untagged = await self._command(b'CAPABILITY')
+            if not untagged.get('CAPABILITY'):
+                raise self.Error('no CAPABILITY response from the server')
+            self._cached_capabilities = tuple(untagged['CAPABILITY'][-1].upper().split())
+        return self._cached_capabilities
+
+    async def has_capability(self, capability):
+        """Return ``True`` if the IMAP server has the given *capability*.
+        """
+        return to_bytes(capability).upper() in await self.capabilities()
+
+    async def noop(self):
+        """Execute the NOOP command, returning the server response and
+        the list of status responses sent with it, as for
+        :py:meth:`IMAPClient.noop`.
+        """
+        text, _ = await self._command(b'NOOP')
+        return text, self._pop_responses()
+
+    async def select_folder(self, folder, readonly=False):
+        """Set the current folder on the server, returning the same
+        dict as :py:meth:`IMAPClient.select_folder`.
+        """
+        command = b'EXAMINE' if readonly else b'SELECT'
+        _, untagged = await self._command(command, self._normalise_folder(folder))
+        return process_select_response(untagged)
+
+    async def close_folder(self):
+        """Close the currently selected folder, returning the server
+        response string.
+        """
+        text, _ = await self._command(b'CLOSE')
+        return text
+
+    async def search(self, criteria='ALL', charset=None, returning=None):
+        """Return the messages in the current folder matching
+        *criteria*, as for :py:meth:`IMAPClient.search`.
+        """
+        if returning:
+            returning = [to_bytes(option).upper() for option in _normalise_text_list(returning)]
+            for option in returning:
+                if option not in SEARCH_RETURN_OPTIONS:
+                    raise ValueError('unsupported search return option: %s'
+                                     % to_unicode(option))
+            if not await self.has_capability('ESEARCH'):
+                return _summarise_search(await self._search([], criteria, charset), returning)
+            args = [b'RETURN', b'(' + b' '.join(returning) + b')']
+            _, untagged = await self._command(b'SEARCH', *self._search_args(args, criteria, charset),
+                                              uid=True)
+            return parse_esearch_response(untagged.get('ESEARCH') or [None], returning)
+        return await self._search([], criteria, charset)
+
+    async def _search(self, args, criteria, charset):
+        _, untagged = await self._command(b'SEARCH', *self._search_args(args, criteria, charset),
+                                          uid=True)
+        data = untagged.get('SEARCH')
+        if not data:
+            data = [None]
+        elif len(data) > 1:
+            data = [b' '.join(data)]
+        return parse_message_list(data)
+
+    def _search_args(self, args, criteria, charset):
+        if charset:
+            args.extend([b'CHARSET', to_bytes(charset)])
+        args.extend(_normalise_search_criteria(criteria, charset))
+        return args
+
+    async def fetch(self, messages, data, modifiers=None):
+        """Retrieve *data* for *messages* from the current folder,
+        returning the same dict as :py:meth:`IMAPClient.fetch`.
+        """
+        if not messages:
+            return {}
+        args = [join_message_ids(messages), to_bytes(seq_to_parenstr_upper(data))]
+        if modifiers:
+            args.append(to_bytes(seq_to_parenstr_upper(modifiers)))
+        _, untagged = await self._command(b'FETCH', *args, uid=True)
+        return parse_fetch_response(untagged.get('FETCH') or [None],
+                                    self.normalise_times, self.use_uid, self.lazy_fetch,
+                                    self.compact_fetch)
+
+    async def get_flags(self, messages):
+        """Return a dict of the flags set for each of *messages*.
+        """
+        response = await self.fetch(messages, ['FLAGS'])
+        return dict((msgid, data[b'FLAGS']) for msgid, data in response.items())
+
+    async def add_flags(self, messages, flags):
+        """Add *flags* to *messages*, returning the new flags of each
+        message.
+        """
+        return await self.store(messages, b'+FLAGS', flags)
+
+    async def remove_flags(self, messages, flags):
+        """Remove *flags* from *messages*, returning the new flags of
+        each message.
+        """
+        return await self.store(messages, b'-FLAGS', flags)
+
+    async def set_flags(self, messages, flags):
+        """Set the flags of *messages* to *flags*, returning the new
+        flags of each message.
+        """
+        return await self.store(messages, b'FLAGS', flags)
+
+    async def delete_messages(self, messages):
+        """Flag *messages* as deleted.
+        """
+        return await self.add_flags(messages, DELETED)
+
+    async def store(self, messages, command, flags):
+        """Run a STORE *command* (eg. ``b'+FLAGS'``) with *flags* for
+        *messages*, returning the new flags of each message.
+        """
+        if not messages:
+            return {}
+        if isinstance(flags, (str, bytes)):
+            flags = [flags]
+        _, untagged = await self._command(
+            b'STORE', join_message_ids(messages), to_bytes(command),
+            to_bytes(seq_to_parenstr(to_unicode(f) for f in flags)), uid=True)
+        response = parse_fetch_response(untagged.get('FETCH') or [None],
+                                        self.normalise_times, self.use_uid)
+        return dict((msgid, data[b'FLAGS']) for msgid, data in response.items()
+                    if b'FLAGS' in data)
+
+    async def copy(self, messages, folder):
+        """Copy *messages* from the current folder to *folder*,
+        returning the COPY response string.
+        """
+        text, _ = await self._command(b'COPY', join_message_ids(messages),
+                                      self._normalise_folder(folder), uid=True)
+        return text
+
+    async def expunge(self):
+        """Remove all messages flagged as deleted from the current
+        folder, returning the server response and the list of EXPUNGE
+        responses.
+        """
+        text, _ = await self._command(b'EXPUNGE')
+        return text, self._pop_responses()
+
+    async def append(self, folder, msg, flags=(), msg_time=None):
+        """Append the message *msg* to *folder*, as for
+        :py:meth:`IMAPClient.append`.
+        """
+        args = [self._normalise_folder(folder)]
+        if flags:
+            args.append(to_bytes(seq_to_parenstr(to_unicode(f) for f in flags)))
+        if msg_time:
+            args.append(b'"' + to_bytes(datetime_to_INTERNALDATE(msg_time)) + b'"')
+        args.append(_Literal(to_bytes(msg)))
+        text, _ = await self._command(b'APPEND', *args)
+        return text
+
+    async def idle(self):
+        """Put the server into IDLE mode. Use :py:meth:`idle_check` to
+        wait for responses and :py:meth:`idle_done` to end IDLE mode.
+        No other command may be run until then.
+        """
+        await self._lock.acquire()
+        try:
+            self._responses = []
+            self._idle_tag = await self._send(b'IDLE', ())
+        except BaseException:
+            self._idle_tag = None
+            self._lock.release()
+            raise
+
+    async def idle_check(self, timeout=None):
+        """Wait up to *timeout* seconds (forever if None) for IDLE
+        responses, returning them parsed as for
+        :py:meth:`IMAPClient.idle_check`.
+        """
+        if self._pending_read is None:
+            self._pending_read = asyncio.ensure_future(self._read_one())
+        done, _ = await asyncio.wait([self._pending_read], timeout=timeout)
+        if not done:
+            return []
+        while self._pending_read is not None and self._pending_read.done():
+            items = self._pending_read.result()
+            self._pending_read = None
+            self._handle_untagged(items)
+            # Pick up anything else that's already arrived
+            self._pending_read = asyncio.ensure_future(self._read_one())
+            await asyncio.sleep(0)
+        return self._pop_responses()
+
+    async def idle_done(self):
+        """Take the server out of IDLE mode, returning the server
+        response and any IDLE responses not yet returned by
+        :py:meth:`idle_check`.
+        """
+        try:
+            self._writer.write(b'DONE\r\n')
+            await self._writer.drain()
+            typ, text = await self._wait_tagged(self._idle_tag)
+        finally:
+            self._idle_tag = None
+            self._lock.release()
+        self._check_ok('IDLE', typ, text)
+        return text, self._pop_responses()
+
+    def _normalise_folder(self, folder_name):
+        if isinstance(folder_name, bytes):
+            folder_name = folder_name.decode('ascii')
+        if self.folder_encode:
+            folder_name = self._folder_names.encode(folder_name)
+        return _quote(to_bytes(folder_name))
+
+    async def _command(self, name, *args, uid=False):
+        """Run the command *name* with *args* (bytes) and return its
+        completion text and the untagged responses received, keyed by
+        type (eg. ``'FETCH'``) like imaplib's.
+        """
+        async with self._lock:
+            self._untagged = defaultdict(list)
+            self._responses = []
+            tag = await self._send(name, args, uid)
+            typ, text = await self._wait_tagged(tag)
+            untagged = self._untagged
+        self._check_ok(to_unicode(name), typ, text)
+        return text, untagged
+
+    def _check_ok(self, name, typ, text):
+        if typ != 'OK':
+            raise self.Error('%s failed: %s' % (name, to_unicode(text)))
+
+    async def _send(self, name, args, uid=False):
+        tag = b'A%d' % next(self._tags)
+        line = tag
+        if uid and self.use_uid:
+            line += b' UID'
+        line += b' ' + name
+        for arg in args:
+            if isinstance(arg, _Literal) or _is8bit(arg):
+                self._writer.write(line + b' {%d}\r\n' % len(arg))
+                await self._writer.drain()
+                await self._wait_continuation(tag)
+                line = bytes(arg)
+            else:
+                line += b' ' + arg
+        self._writer.write(line + b'\r\n')
+        await self._writer.drain()
+        if name == b'IDLE':
+            await self._wait_continuation(tag)
+        return tag
+
+    async def _wait_continuation(self, tag):
+        while True:
+            items = await self._read_response()
+            first = _first_line(items)
+            if first.startswith(b'+'):
+                return
+            if first.startswith(b'* '):
+                self._handle_untagged(items)
+                continue
+            got_tag, typ, text = _split_tagged(first)
+            raise self.Error('unexpected response while waiting for continuation: %s %s'
+                             % (typ, to_unicode(text)))
+
+    async def _wait_tagged(self, tag):
+        while True:
+            items = await self._read_response()
+            first = _first_line(items)
+            if first.startswith(b'* '):
+                self._handle_untagged(items)
+                continue
+            if first.startswith(b'+'):
+                continue
+            got_tag, typ, text = _split_tagged(first)
+            if got_tag == tag:
+                self._add_response_code(text)
+                return typ, text
+
+    def _handle_untagged(self, items):
+        self._responses.append(items)
+        match = _UNTAGGED_RE.match(_first_line(items))
+        if not match:
+            return
+        number, typ, rest = match.groups()
+        typ = typ.upper().decode('ascii')
+        data = b' '.join(part for part in (number, rest) if part is not None)
+        if isinstance(items[0], tuple):
+            items = [(data, items[0][1])] + items[1:]
+        else:
+            items = [data] + items[1:]
+        self._untagged[typ].extend(items)
+
+        if typ in ('OK', 'NO', 'BAD') and rest:
+            self._add_response_code(rest)
+
+    def _add_response_code(self, text):
+        # As imaplib does, file "[CODE data]" under CODE
+        code = _RESPONSE_CODE_RE.match(text)
+        if code:
+            self._untagged[code.group(1).upper().decode('ascii')].append(code.group(2))
+
+    def _pop_responses(self):
+        responses, self._responses = self._responses, []
+        return [_parse_untagged(items) for items in responses]
+
+    async def _read_response(self):
+        """Read one complete response, returned in imaplib's format:
+        a list holding a ``(line, literal)`` tuple for each line ending
+        in a literal, followed by the final line.
+        """
+        if self._pending_read is not None:
+            pending, self._pending_read = self._pending_read, None
+            return await pending
+        return await self._read_one()
+
+    async def _read_one(self):
+        items = []
+        line = await self._read_line()
+        while True:
+            match = _LITERAL_RE.search(line)
+            if not match:
+                break
+            literal = await self._read(self._reader.readexactly(int(match.group(1))))
+            items.append((line, literal))
+            line = await self._read_line()
+        items.append(line)
+        return items
+
+    async def _read_line(self):
+        line = await self._read(self._reader.readuntil(b'\r\n'))
+        return line[:-2]
+
+    async def _read(self, coro):
+        try:
+            return await asyncio.wait_for(coro, self._timeout)
+        except asyncio.TimeoutError:
+            raise self.AbortError('socket timed out')
+        except asyncio.IncompleteReadError:
+            raise self.AbortError('socket error: EOF')
+        except asyncio.LimitOverrunError:
+            raise self.AbortError('response line too long')
+
+
+def _astring(value):
+    value = to_bytes(value)
+    if _is8bit(value):
+        return _Literal(value)
+    return _quote(value)
+
+
+def _first_line(items):
+    first = items[0]
+    if isinstance(first, tuple):
+        return first[0]
+    return first
+
+
+def _split_tagged(line):
+    parts = line.split(b' ', 2)
+    while len(parts) < 3:
+        parts.append(b'')
+    tag, typ, text = parts
+    return tag, typ.upper().decode('ascii', 'replace'), text
+
+
+def _parse_untagged(items):
+    first = _first_line(items)[2:]
+    if first.startswith((b'OK ', b'NO ')) and len(items) == 1:
+        return tuple(first.split(b' ', 1))
+    if isinstance(items[0], tuple):
+        items = [(first, items[0][1])] + items[1:]
+    else:
+        items = [first] + items[1:]
+    return parse_response(items)
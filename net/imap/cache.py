@@ -0,0 +1,139 @@
+# coding=utf-8
+"""
+A persistent cache of parsed message metadata, stored in SQLite.
+
+Entries are keyed by account, folder, UIDVALIDITY and UID, so they stay
+valid for as long as the folder's UIDVALIDITY does. ENVELOPE, BODY,
+BODYSTRUCTURE, RFC822.SIZE and INTERNALDATE never change for a given
+UID and are kept indefinitely. FLAGS do change, and are only trusted
+together with the folder MODSEQ they were last brought up to date at
+(see :rfc:`7162`). They are refreshed when a folder is selected with
+a higher HIGHESTMODSEQ, so changes made by other clients show up the
+next time the folder is selected.
+
+Assign a MessageCache to :py:attr:`IMAPClient.cache` to have
+``fetch()`` use it::
+
+    client.cache = MessageCache('messages.db', 'user@example.com')
+"""
+
+from __future__ import unicode_literals
+
+import sqlite3
+
+from six import iteritems
+from six.moves import cPickle as pickle
+
+__all__ = ['MessageCache', 'CACHED_ITEMS']
+
+# FETCH items that can be served from the cache
+CACHED_ITEMS = frozenset([
+    b'ENVELOPE', b'BODY', b'BODYSTRUCTURE', b'RFC822.SIZE', b'INTERNALDATE', b'FLAGS'])
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS folders (
+    account TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    uidvalidity INTEGER NOT NULL,
+    modseq INTEGER,
+    PRIMARY KEY (account, folder)
+);
+CREATE TABLE IF NOT EXISTS items (
+    account TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    uid INTEGER NOT NULL,
+    item TEXT NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (account, folder, uid, item)
+);
+'''
+
+# Stay well below SQLite's limit on the number of query parameters
+_CHUNK_SIZE = 500
+
+
+class MessageCache(object):
+    """Cached message metadata for one *account*, stored in the SQLite
+    database at *path* (``':memory:'`` gives a throwaway cache).
+
+    Values are stored as parsed by ``fetch()`` with *normalise_times*
+    off, so datetimes keep their original timezone.
+    """
+
+    def __init__(self, path, account):
+        self.account = account
+        self._db = sqlite3.connect(path)
+        self._db.text_factory = bytes
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def folder_state(self, folder):
+        """Return the ``(uidvalidity, modseq)`` recorded for *folder*,
+        or ``(None, None)`` if nothing is cached for it.
+        """
+        row = self._db.execute(
+            'SELECT uidvalidity, modseq FROM folders WHERE account = ? AND folder = ?',
+            (self.account, folder)).fetchone()
+        if row is None:
+            return None, None
+        return row
+
+    def set_folder_state(self, folder, uidvalidity, modseq):
+        """Record *folder*'s UIDVALIDITY and the MODSEQ its cached
+        flags are up to date at. Everything cached for the folder is
+        dropped if *uidvalidity* has changed.
+        """
+        with self._db:
+            if self.folder_state(folder)[0] not in (None, uidvalidity):
+                self._db.execute('DELETE FROM items WHERE account = ? AND folder = ?',
+                                 (self.account, folder))
+            self._db.execute('INSERT OR REPLACE INTO folders VALUES (?, ?, ?, ?)',
+                             (self.account, folder, uidvalidity, modseq))
+
+    def get(self, folder, uids, items):
+        """Return the cached *items* for *uids* in *folder* as a dict
+        of dicts shaped like the result of ``fetch()``. UIDs with
+        nothing cached are left out.
+        """
+        items = [item.decode('ascii') for item in items]
+        out = {}
+        if not items:
+            return out
+        uids = list(uids)
+        query = ('SELECT uid, item, value FROM items WHERE account = ? AND folder = ? '
+                 'AND item IN (%s) AND uid IN (%%s)' % ', '.join('?' * len(items)))
+        for start in range(0, len(uids), _CHUNK_SIZE):
+            chunk = uids[start:start + _CHUNK_SIZE]
+            rows = self._db.execute(query % ', '.join('?' * len(chunk)),
+                                    [self.account, folder] + items + chunk)
+            for uid, item, value in rows:
+                out.setdefault(uid, {})[item] = pickle.loads(value)
+        return out
+
+    def put(self, folder, fetched):
+        """Store the cacheable items in *fetched*, a ``fetch()`` style
+        dict keyed by UID.
+        """
+        rows = [
+            (self.account, folder, uid, item.decode('ascii'),
+             sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+            for uid, data in iteritems(fetched)
+            for item, value in iteritems(data)
+            if item in CACHED_ITEMS
+        ]
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?)', rows)
+
+    def discard(self, folder, uids):
+        """Forget everything cached for *uids* (for example because
+        they were expunged).
+        """
+        uids = list(uids)
+        with self._db:
+            for start in range(0, len(uids), _CHUNK_SIZE):
+                chunk = uids[start:start + _CHUNK_SIZE]
+                self._db.execute(
+                    'DELETE FROM items WHERE account = ? AND folder = ? AND uid IN (%s)'
+                    % ', '.join('?' * len(chunk)), [self.account, folder] + chunk)
@@ -5,13 +5,32 @@
 
 
 import re
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 from email.utils import parsedate_tz
+from functools import lru_cache
 
 from .fixed_offset import FixedOffset
 
 _SHORT_MONTHS = ' Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec'.split(' ')
 
+_MONTHS = {name.lower().encode('ascii'): number
+           for number, name in enumerate(_SHORT_MONTHS) if name}
+
+# The two formats nearly every timestamp comes in, parsed without
+# parsedate_tz: INTERNALDATE (' 9-Feb-2007 17:08:08 +0100') and RFC 2822
+# ('Tue, 16 Mar 2010 16:45:32 +0000', maybe followed by a comment)
+_INTERNALDATE_RE = re.compile(
+    br' ?(\d{1,2})-([A-Za-z]{3})-([1-9]\d{3}) (\d\d):(\d\d):(\d\d) ([+-]?)(\d\d)(\d\d)$')
+_RFC2822_RE = re.compile(
+    br'(?:[A-Za-z]{3}, ?)?(\d{1,2}) ([A-Za-z]{3}) ([1-9]\d{3}) (\d\d):(\d\d)(?::(\d\d))? '
+    br'([+-]?)(\d\d)(\d\d)(?: \(.*\))?$')
+
+# The parsed timestamps most recently used. Mail in a folder was mostly
+# received at the same few times, and the same folders are fetched
+# over and over.
+_CACHE_SIZE = 8192
+
 
 def parse_to_datetime(timestamp, normalise=True):
     """Convert an IMAP datetime string to a datetime.
@@ -21,7 +40,83 @@ def parse_to_datetime(timestamp, normalise=True):
 
     If normalise is False, then the returned datetime will be
     unadjusted but will contain timezone information as per the input.
+
+    The results for the timestamps most recently parsed are kept, so
+    parsing one of them again is cheap.
+    """
+    system = _system_offset() if normalise else None
+    try:
+        return _parse_cached(timestamp, system)
+    except TypeError:
+        # Not hashable
+        return _parse(timestamp, system)
+
+
+def parse_datetimes(timestamps, normalise=True):
+    """Convert a sequence of IMAP datetime strings, returning a list of
+    datetimes as :py:func:`parse_to_datetime` does, with None for any
+    which can't be parsed.
     """
+    system = _system_offset() if normalise else None
+    seen = {}
+    out = []
+    for timestamp in timestamps:
+        try:
+            dt = seen[timestamp]
+        except KeyError:
+            try:
+                dt = _parse_cached(timestamp, system) if timestamp else None
+            except ValueError:
+                dt = None
+            seen[timestamp] = dt
+        out.append(dt)
+    return out
+
+
+def _parse(timestamp, system):
+    # Normalised to the *system* offset unless it is None
+    dt = _parse_fast(timestamp, system)
+    if dt is None:
+        dt = _parse_slow(timestamp)
+        if system is not None and dt.tzinfo:
+            dt = dt.astimezone(system).replace(tzinfo=None)
+    return dt
+
+
+_parse_cached = lru_cache(maxsize=_CACHE_SIZE)(_parse)
+
+# What to add to a time at an offset (in minutes) to normalise it to a
+# system FixedOffset, by (offset, system offset)
+_shifts = {}
+
+
+def _parse_fast(timestamp, system):
+    m = _INTERNALDATE_RE.match(timestamp) or _RFC2822_RE.match(timestamp)
+    if m is None:
+        return None
+    day, month, year, hour, minute, second, sign, tz_hours, tz_minutes = m.groups()
+    month = _MONTHS.get(month.lower())
+    if month is None:
+        return None
+    offset = int(tz_hours) * 60 + int(tz_minutes)
+    if sign == b'-':
+        offset = -offset
+    if not -1440 < offset < 1440:
+        # Not a valid offset, left for the slow path to reject
+        return None
+    if system is None:
+        return datetime(int(year), month, int(day), int(hour), int(minute), int(second or 0),
+                        tzinfo=FixedOffset.for_minutes(offset))
+
+    # As astimezone(system) would, without making an aware datetime
+    try:
+        shift = _shifts[offset, system]
+    except KeyError:
+        shift = _shifts[offset, system] = system.utcoffset(None) - timedelta(minutes=offset)
+    return datetime(int(year), month, int(day), int(hour), int(minute), int(second or 0)) + shift
+
+
+def _parse_slow(timestamp):
     time_tuple = parsedate_tz(_munge(timestamp))
     if time_tuple is None:
         raise ValueError("couldn't parse datetime %r" % timestamp)
@@ -29,17 +124,44 @@ def parse_to_datetime(timestamp, normalise=True):
     tz_offset_seconds = time_tuple[-1]
     tz = None
     if tz_offset_seconds is not None:
-        tz = FixedOffset(tz_offset_seconds / 60)
+        tz = FixedOffset.for_minutes(tz_offset_seconds // 60)
 
-    dt = datetime(*time_tuple[:6], tzinfo=tz)
-    if normalise and tz:
-        dt = datetime_to_native(dt)
-
-    return dt
+    return datetime(*time_tuple[:6], tzinfo=tz)
 
 
 def datetime_to_native(dt):
-    return dt.astimezone(FixedOffset.for_system()).replace(tzinfo=None)
+    return dt.astimezone(_system_offset()).replace(tzinfo=None)
+
+
+# The FixedOffset of the system and the time (from time.time()) until
+# which it holds: the next change between standard and daylight saving
+# time, or a day ahead if there is none before then
+_system = (None, 0)
+
+
+def _system_offset():
+    global _system
+    offset, until = _system
+    now = time.time()
+    if now >= until:
+        offset = FixedOffset.for_system()
+        _system = (offset, _next_dst_change(now))
+    return offset
+
+
+def _next_dst_change(now, within=86400):
+    isdst = time.localtime(now).tm_isdst
+    low, high = now, now + within
+    if time.localtime(high).tm_isdst == isdst:
+        return high
+    # Narrow it down to the second
+    while high - low > 1:
+        middle = (low + high) / 2
+        if time.localtime(middle).tm_isdst == isdst:
+            low = middle
+        else:
+            high = middle
+    return high
 
 
 def datetime_to_INTERNALDATE(dt):
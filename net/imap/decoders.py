@@ -0,0 +1,88 @@
+# coding=utf-8
+"""
+Incremental decoders for the content transfer encodings of body parts.
+
+Data can be fed to a decoder in pieces of any size, as they arrive::
+
+    decoder = decoder_for(part.encoding)
+    for chunk in chunks:
+        out.write(decoder.decode(chunk))
+    out.write(decoder.flush())
+
+This module depends on nothing else in the package so that both
+:py:mod:`download` and :py:mod:`util` can use it.
+"""
+
+from __future__ import unicode_literals
+
+import binascii
+
+__all__ = ['decoder_for', 'Base64Decoder', 'QuotedPrintableDecoder', 'IdentityDecoder']
+
+
+class Base64Decoder(object):
+    """Incrementally decodes base64 data fed to it in arbitrary
+    pieces.
+    """
+
+    def __init__(self):
+        self._pending = b''
+
+    def decode(self, data):
+        data = self._pending + data.translate(None, b' \t\r\n')
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        return binascii.a2b_base64(data[:usable])
+
+    def flush(self):
+        # Tolerate missing padding at the very end
+        data, self._pending = self._pending, b''
+        if not data:
+            return b''
+        return binascii.a2b_base64(data + b'=' * (-len(data) % 4))
+
+
+class QuotedPrintableDecoder(object):
+    """Incrementally decodes quoted-printable data fed to it in
+    arbitrary pieces. Data is decoded a line at a time so soft line
+    breaks and escapes split across pieces are handled.
+    """
+
+    def __init__(self):
+        self._pending = b''
+
+    def decode(self, data):
+        data = self._pending + data
+        end = data.rfind(b'\n') + 1
+        self._pending = data[end:]
+        return binascii.a2b_qp(data[:end])
+
+    def flush(self):
+        data, self._pending = self._pending, b''
+        return binascii.a2b_qp(data)
+
+
+class IdentityDecoder(object):
+    """For 7bit, 8bit and binary parts, which need no decoding.
+    """
+
+    def decode(self, data):
+        return data
+
+    def flush(self):
+        return b''
+
+
+_DECODERS = {
+    b'base64': Base64Decoder,
+    b'quoted-printable': QuotedPrintableDecoder,
+}
+
+
+def decoder_for(encoding):
+    """Return a new incremental decoder for the content transfer
+    *encoding* of a body part.
+    """
+    if not isinstance(encoding, bytes):
+        encoding = (encoding or '').encode('ascii')
+    return _DECODERS.get(encoding.lower(), IdentityDecoder)()
@@ -0,0 +1,158 @@
+# coding=utf-8
+"""
+Streaming download of message body parts.
+
+Parts are fetched as ``BODY.PEEK[n]<offset.length>`` chunks and their
+content transfer encoding is decoded as each chunk arrives, straight
+into a file object (or a writable buffer such as a bytearray or
+memoryview). Memory use is bounded by the chunk size and the number
+of chunks in flight, however large the part is::
+
+    plan = plan_parts(bodystructure, ['report.pdf'])
+    for filename, part, section in plan.attachments:
+        if section is not None:
+            with open(filename, 'wb') as f:
+                download_part(client, msgid, part, section, f)
+
+Servers supporting BINARY (:rfc:`3516`) are asked for
+``BINARY.PEEK[n]<offset.length>`` chunks instead. They decode the
+part themselves, which saves the base64 overhead on the wire and the
+decoding here.
+"""
+
+from __future__ import unicode_literals
+
+from collections import deque
+
+from .decoders import Base64Decoder, IdentityDecoder, QuotedPrintableDecoder, decoder_for
+from .util import to_bytes
+
+__all__ = ['download_part', 'download_parts', 'decoder_for',
+           'Base64Decoder', 'QuotedPrintableDecoder', 'IdentityDecoder']
+
+DEFAULT_CHUNK_SIZE = 256 * 1024
+
+# Chunk FETCHes in flight at once
+DEFAULT_WINDOW = 4
+
+
+def download_part(client, msgid, part, section, sink,
+                  chunk_size=DEFAULT_CHUNK_SIZE, window=DEFAULT_WINDOW, binary=None):
+    """Download and decode *section* (e.g. ``'2'`` or ``'1.3'``) of
+    message *msgid* into *sink*. *part* is the section's
+    :py:class:`~net.imap.response_types.Part` (or
+    :py:class:`~net.imap.response_types.BodyData`), which gives its
+    encoding and size.
+
+    *sink* is a file object opened for writing in binary mode or a
+    writable buffer. Returns the number of decoded bytes written.
+
+    BINARY is used if *binary* is True, or if it is None and the server
+    supports it. Parts the server can't decode are fetched with BODY
+    and decoded here.
+    """
+    return download_parts(client, [(msgid, part, section, sink)], chunk_size, window, binary)[0]
+
+
+def download_parts(client, downloads, chunk_size=DEFAULT_CHUNK_SIZE, window=DEFAULT_WINDOW,
+                   binary=None):
+    """Like :py:func:`download_part` for each ``(msgid, part, section,
+    sink)`` tuple in *downloads*. The chunk FETCHes of all the parts are
+    pipelined through one :py:meth:`IMAPClient.pipeline`, with at most
+    *window* in flight.
+
+    Returns the number of decoded bytes written for each download.
+    """
+    downloads = list(downloads)
+    if binary is None:
+        binary = client.has_capability('BINARY')
+    sizes = [None] * len(downloads)
+    if binary:
+        sizes = _binary_sizes(client, downloads)
+
+    states = [_Download(msgid, part, section, sink, chunk_size, size)
+              for (msgid, part, section, sink), size in zip(downloads, sizes)]
+    todo = deque((state, offset) for state in states for offset in state.offsets())
+    in_flight = deque()
+
+    with client.pipeline(depth=window) as p:
+        while todo or in_flight:
+            while todo and len(in_flight) < window:
+                state, offset = todo.popleft()
+                in_flight.append((state, offset, p.fetch([state.msgid], [state.item(offset)])))
+
+            state, offset, result = in_flight.popleft()
+            msg_data = result.result().get(state.msgid, {})
+            data = msg_data.get(state.key(offset)) or b''
+            state.write(state.decoder.decode(data))
+            if offset == state.last_offset and len(data) == chunk_size and not state.exact:
+                # The part is larger than its BODYSTRUCTURE said
+                state.last_offset += chunk_size
+                todo.append((state, state.last_offset))
+
+    for state in states:
+        state.write(state.decoder.flush())
+    return [state.written for state in states]
+
+
+def _binary_sizes(client, downloads):
+    # The decoded size of each part, or None for the parts the server
+    # can't decode.
+    sizes = []
+    with client.pipeline() as p:
+        results = [(msgid, b'BINARY.SIZE[%s]' % to_bytes(section),
+                    p.fetch([msgid], [b'BINARY.SIZE[%s]' % to_bytes(section)]))
+                   for msgid, _, section, _ in downloads]
+        for msgid, key, result in results:
+            try:
+                sizes.append(result.result().get(msgid, {}).get(key))
+            except client.Error:
+                sizes.append(None)
+    return sizes
+
+
+class _Download(object):
+
+    def __init__(self, msgid, part, section, sink, chunk_size, binary_size=None):
+        self.msgid = msgid
+        self.section = to_bytes(section)
+        self.chunk_size = chunk_size
+        self.written = 0
+        # BINARY.SIZE is exact, BODYSTRUCTURE sizes may not be
+        self.exact = binary_size is not None
+        if binary_size is None:
+            self.kind = b'BODY'
+            self.decoder = decoder_for(part.encoding)
+            self.size = part.size or 0
+        else:
+            self.kind = b'BINARY'
+            self.decoder = IdentityDecoder()
+            self.size = binary_size
+        self.last_offset = max(self.size - 1, 0) // chunk_size * chunk_size
+        if hasattr(sink, 'write'):
+            self._write = sink.write
+        else:
+            self._buffer = memoryview(sink).cast('B')
+            self._write = self._write_buffer
+            if binary_size is not None and binary_size > len(self._buffer):
+                raise ValueError('decoded part is larger than the buffer given')
+
+    def offsets(self):
+        return range(0, self.last_offset + 1, self.chunk_size)
+
+    def item(self, offset):
+        return b'%s.PEEK[%s]<%d.%d>' % (self.kind, self.section, offset, self.chunk_size)
+
+    def key(self, offset):
+        return b'%s[%s]<%d>' % (self.kind, self.section, offset)
+
+    def write(self, data):
+        if data:
+            self._write(data)
+            self.written += len(data)
+
+    def _write_buffer(self, data):
+        end = self.written + len(data)
+        if end > len(self._buffer):
+            raise ValueError('decoded part is larger than the buffer given')
+        self._buffer[self.written:end] = data
@@ -10,6 +10,9 @@ from datetime import tzinfo, timedelta
 
 ZERO = timedelta(0)
 
+# Instances shared by for_minutes(), by offset in minutes
+_instances = {}
+
 
 class FixedOffset(tzinfo):
     """
@@ -26,6 +29,10 @@ class FixedOffset(tzinfo):
         hours, remaining_mins = divmod(abs(minutes), 60)
         self.__name = '%s%02d%02d' % (sign, hours, remaining_mins)
 
+    def __getinitargs__(self):
+        # Lets pickle (and so the message cache) recreate instances
+        return (self.__offset.days * 1440 + self.__offset.seconds // 60,)
+
     def utcoffset(self, _):
         return self.__offset
 
@@ -35,6 +42,16 @@ class FixedOffset(tzinfo):
     def dst(self, _):
         return ZERO
 
+    @classmethod
+    def for_minutes(klass, minutes):
+        """Return the FixedOffset instance for *minutes*, the same one
+        for every call with the same offset.
+        """
+        try:
+            return _instances[minutes]
+        except KeyError:
+            return _instances.setdefault(minutes, klass(minutes))
+
     @classmethod
     def for_system(klass):
         """Return a FixedOffset instance for the current working timezone and
@@ -44,4 +61,4 @@ class FixedOffset(tzinfo):
             offset = time.altzone
         else:
             offset = time.timezone
-        return klass(-offset // 60)
+        return klass.for_minutes(-offset // 60)
@@ -0,0 +1,206 @@
+# coding=utf-8
+"""
+A single pass parser for IMAP responses.
+
+The two stage parser first splits a response into bytes tokens
+(:py:mod:`~net.imap.response_lexer`) and then looks at every token
+again to turn it into a value: is it a tuple, NIL, a literal, quoted,
+all digits? This parser goes straight from the bytes of the response
+to the nested tuples, ints, bytes and None that make up the parsed
+response. A single regular expression pulls out the content of quoted
+strings and the atoms, which are the values themselves, and the
+tuples are built around them in the same loop.
+
+Literals are taken from the response record whose text ends with their
+``{size}`` marker, as imaplib hands them over.
+
+Select it as the engine of :py:mod:`~net.imap.response_parser` with
+:py:func:`~net.imap.response_parser.set_engine`.
+"""
+
+from __future__ import unicode_literals
+
+import re
+
+from .response_lexer import _ATOM, _ESCAPE_RE
+
+__all__ = ['parse', 'Deferred']
+
+# Each token is either a quoted string, whose content is the first
+# group, or anything else (an atom, a parenthesis or a stray
+# character) as the second. findall() then hands over the values of
+# quoted strings and atoms as they are, with no token to look at again.
+_TOKEN_RE = re.compile(br'"([^"\\]*(?:\\.[^"\\]*)*)"|(' + _ATOM + br'|[^ \t\r\n])', re.DOTALL)
+
+# The second group tokens which aren't plain atoms
+_OPEN, _CLOSE, _NIL, _BAD = range(4)
+_SPECIAL = {b'(': _OPEN, b')': _CLOSE, b'NIL': _NIL, b'"': _BAD, b'[': _BAD}
+
+_UNTERMINATED = {
+    b'"': "No closing '\"'",
+    b'[': "No closing ']'",
+}
+
+# What matters to find the end of a tuple without parsing it: its
+# parentheses, and the quoted strings and [...] sections that may hold
+# parentheses which don't count
+_QUOTED = br'"[^"\\]*(?:\\.[^"\\]*)*"'
+_BRACKETED = br'\[[^\]]*\]'
+_SKIP_RE = re.compile(br'[()]|' + _QUOTED + b'|' + _BRACKETED)
+
+
+def _balanced(depth):
+    # A tuple nested at most *depth* deep, so the common ones are
+    # skipped by a single match
+    inner = br'[^()"\[]|' + _QUOTED + b'|' + _BRACKETED
+    if depth > 1:
+        inner += b'|' + _balanced(depth - 1)
+    return br'\((?:' + inner + br')*\)'
+
+
+_BALANCED_RE = re.compile(_balanced(8))
+
+_defer_res = {}
+
+
+class Deferred(object):
+    """A tuple in a response left unparsed by :py:func:`parse`: the
+    pieces of the response records it spans. :py:meth:`parse` parses
+    it.
+    """
+
+    __slots__ = ('records',)
+
+    def __init__(self, records):
+        self.records = records
+
+    def parse(self):
+        return parse(self.records)[0]
+
+
+def parse(records, defer=()):
+    """Parse the response *records* as imaplib returns them (each one
+    bytes, or a ``(text, literal)`` tuple), returning a list of the
+    values at the top level.
+
+    The tuple following any atom in *defer* which is a key of a tuple
+    at the first level (an even position, as in a FETCH response) is
+    not parsed. Its place is taken by a :py:class:`Deferred`.
+
+    Raises ValueError if the response is malformed.
+    """
+    values = []
+    current = values
+    stack = []
+    deferring = None
+    depth = 0
+    defer_re = _defer_re(defer) if defer else None
+    for record in records:
+        if isinstance(record, tuple):
+            text, literal = record
+        else:
+            text, literal = record, None
+        braces = b'{' in text
+
+        pos = 0
+        while True:
+            if deferring is not None:
+                start = pos
+                m = _BALANCED_RE.match(text, pos) if not depth else None
+                if m is not None:
+                    pos = m.end()
+                else:
+                    pos, depth = _skip(text, pos, depth)
+                if depth:
+                    # Carries on in the next record
+                    deferring.append((text[start:], literal) if literal is not None else text[start:])
+                    break
+                deferring.append(text[start:pos])
+                current.append(Deferred(deferring))
+                deferring = None
+
+            # Parse up to the next key whose value may be deferred
+            key = None
+            end = len(text)
+            if defer_re is not None:
+                m = defer_re.match(text, pos)
+                if m is not None:
+                    key = m.group(1)
+                    end = m.end()
+
+            for quoted, token in _TOKEN_RE.findall(text, pos, end):
+                if not token:
+                    if b'\\' in quoted:
+                        quoted = _ESCAPE_RE.sub(br'\1', quoted)
+                    current.append(quoted)
+                    continue
+                kind = _SPECIAL.get(token)
+                if kind is None:
+                    if token.isdigit():
+                        current.append(int(token))
+                    elif braces and token[-1:] == b'}' and (token[:1] == b'{' or token[:2] == b'~{'):
+                        current.append(_literal(token, literal))
+                    else:
+                        current.append(token)
+                elif kind == _OPEN:
+                    stack.append(current)
+                    current = []
+                elif kind == _CLOSE:
+                    if stack:
+                        value = tuple(current)
+                        current = stack.pop()
+                        current.append(value)
+                    else:
+                        current.append(token)
+                elif kind == _NIL:
+                    current.append(None)
+                else:
+                    raise ValueError(_UNTERMINATED[token])
+
+            if key is None:
+                break
+            pos = end
+            if len(stack) == 1 and len(current) % 2 and current[-1] == key:
+                deferring = []
+                depth = 0
+                pos += 1    # the space before "("
+
+    if deferring is not None or stack:
+        raise ValueError('Tuple incomplete before "(%s"' % ' '.join(str(item) for item in current))
+    return values
+
+
+def _defer_re(keys):
+    # Matches from a token up to the next of *keys* followed by a
+    # tuple, stepping over quoted strings and [...] sections whole
+    keys = frozenset(keys)
+    regex = _defer_res.get(keys)
+    if regex is None:
+        regex = _defer_res[keys] = re.compile(
+            br'(?:"[^"\\]*(?:\\.[^"\\]*)*"|\[[^\]]*\]|[^"\[])*?(?<![^ (])(' +
+            b'|'.join(re.escape(key) for key in sorted(keys, key=len, reverse=True)) +
+            br')(?= \()', re.DOTALL)
+    return regex
+
+
+def _skip(text, pos, depth):
+    # Move past the parentheses from *pos* until they balance, or to
+    # the end of *text*. Returns where it stopped and the depth there.
+    for m in _SKIP_RE.finditer(text, pos):
+        char = text[m.start()]
+        if char == 40:      # (
+            depth += 1
+        elif char == 41:    # )
+            depth -= 1
+            if not depth:
+                return m.end(), 0
+    return len(text), depth
+
+
+def _literal(token, literal):
+    literal_len = int(token[token.index(b'{') + 1:-1])
+    if literal is None:
+        raise ValueError('No literal corresponds to %r' % token)
+    if len(literal) != literal_len:
+        raise ValueError('Expecting literal of size %d, got %d' % (literal_len, len(literal)))
+    return literal
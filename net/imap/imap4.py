@@ -12,5 +12,6 @@ class IMAP4WithTimeout(imaplib.IMAP4):
         self._timeout = timeout
         imaplib.IMAP4.__init__(self, address, port)
 
-    def _create_socket(self):
+    def _create_socket(self, timeout=None):
+        # Python 3.9+ passes imaplib's own timeout, ours takes precedence
         return socket.create_connection((self.host, self.port), self._timeout)
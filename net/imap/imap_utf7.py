@@ -24,12 +24,25 @@
 
 from __future__ import unicode_literals
 
-from six import binary_type, text_type, byte2int, iterbytes, unichr
+import base64
+import re
+
+from six import binary_type, text_type, byte2int
 
 
 PRINTABLE = set(range(0x20, 0x26)) | set(range(0x27, 0x7f))
 
-# TODO: module needs refactoring (e.g. variable names suck)
+# Names made only of printable ASCII characters other than "&" are the
+# same encoded and decoded
+_PLAIN_TEXT_RE = re.compile(r'[\x20-\x25\x27-\x7e]*\Z')
+
+# What encode() replaces: "&", and each run of characters which aren't
+# printable ASCII
+_ENCODED_RE = re.compile(r'&|[^\x20-\x7e]+')
+
+# What decode() replaces: each "&" and what follows it up to a "-" (or
+# the end)
+_SHIFTED_RE = re.compile(br'&([^-]*)(-?)')
 
 
 def encode(s):
@@ -40,28 +53,16 @@ def encode(s):
     """
     if not isinstance(s, text_type):
         return s
+    if _PLAIN_TEXT_RE.match(s):
+        return s.encode('ascii')
+    return _ENCODED_RE.sub(_encode_run, s).encode('ascii')
 
-    r = []
-    _in = []
-
-    def extend_result_if_chars_buffered():
-        if _in:
-            r.extend([b'&', modified_utf7(''.join(_in)), b'-'])
-            del _in[:]
-
-    for c in s:
-        if ord(c) in PRINTABLE:
-            extend_result_if_chars_buffered()
-            r.append(c.encode('latin-1'))
-        elif c == '&':
-            extend_result_if_chars_buffered()
-            r.append(b'&-')
-        else:
-            _in.append(c)
-
-    extend_result_if_chars_buffered()
 
-    return b''.join(r)
+def _encode_run(m):
+    run = m.group()
+    if run == '&':
+        return '&-'
+    return '&' + modified_utf7(run).decode('ascii') + '-'
 
 
 AMPERSAND_ORD = byte2int(b'&')
@@ -78,30 +79,81 @@ def decode(s):
 
     if not isinstance(s, binary_type):
         return s
+    if b'&' not in s:
+        return s.decode('latin-1')
 
     r = []
-    _in = bytearray()
-    for c in iterbytes(s):
-        if c == AMPERSAND_ORD and not _in:
-            _in.append(c)
-        elif c == DASH_ORD and _in:
-            if len(_in) == 1:
-                r.append('&')
-            else:
-                r.append(modified_deutf7(_in[1:]))
-            _in = bytearray()
-        elif _in:
-            _in.append(c)
+    pos = 0
+    for m in _SHIFTED_RE.finditer(s):
+        r.append(s[pos:m.start()].decode('latin-1'))
+        shifted, dash = m.groups()
+        if dash and not shifted:
+            r.append('&')
         else:
-            r.append(unichr(c))
-    if _in:
-        r.append(modified_deutf7(_in[1:]))
+            r.append(modified_deutf7(shifted))
+        pos = m.end()
+    r.append(s[pos:].decode('latin-1'))
     return ''.join(r)
 
 
+class FolderNameCache(object):
+    """:py:func:`encode` and :py:func:`decode` which remember the
+    names they have converted, in both directions: a name decoded from
+    a LIST response is not encoded again when it is selected.
+
+    Plain ASCII names cost nothing to convert and aren't kept. At most
+    *size* other names are, the oldest being forgotten first.
+    """
+
+    def __init__(self, size=4096):
+        self.size = size
+        self._encoded = {}
+        self._decoded = {}
+
+    def encode(self, name):
+        if not isinstance(name, text_type):
+            return name
+        if _PLAIN_TEXT_RE.match(name):
+            return name.encode('ascii')
+        try:
+            return self._encoded[name]
+        except KeyError:
+            encoded = encode(name)
+            # Only names that come back unchanged are kept, so the
+            # reverse direction can't return the wrong name
+            if decode(encoded) == name:
+                self._remember(name, encoded)
+            return encoded
+
+    def decode(self, name):
+        if not isinstance(name, binary_type):
+            return name
+        if b'&' not in name:
+            return name.decode('latin-1')
+        try:
+            return self._decoded[name]
+        except KeyError:
+            decoded = decode(name)
+            self._remember(decoded, name)
+            return decoded
+
+    def _remember(self, name, encoded):
+        # The two tables are kept the inverse of each other, even when
+        # a server spells a name in more than one way
+        self._decoded.pop(self._encoded.pop(name, None), None)
+        self._encoded.pop(self._decoded.pop(encoded, None), None)
+        if len(self._encoded) >= self.size:
+            oldest = next(iter(self._encoded))
+            del self._decoded[self._encoded.pop(oldest)]
+        self._encoded[name] = encoded
+        self._decoded[encoded] = name
+
+
 def modified_utf7(s):
-    s_utf7 = s.encode('utf-7')
-    return s_utf7[1:-1].replace(b'/', b',')
+    # Base64 of the UTF-16 rather than the utf-7 codec, which would
+    # leave characters such as tab and newline unencoded
+    s_utf16 = s.encode('utf-16-be', 'surrogatepass')
+    return base64.b64encode(s_utf16).rstrip(b'=').replace(b'/', b',')
 
 
 def modified_deutf7(s):
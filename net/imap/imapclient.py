@@ -11,6 +11,7 @@ import select
 import socket
 import sys
 import re
+from collections import defaultdict, deque
 from datetime import datetime, date
 from operator import itemgetter
 
@@ -27,9 +28,13 @@ except ImportError:
 from . import imap4
 from . import response_lexer
 from . import tls
-from .datetime_util import datetime_to_INTERNALDATE, format_criteria_date
-from .imap_utf7 import encode as encode_utf7, decode as decode_utf7
-from .response_parser import parse_response, parse_message_list, parse_fetch_response
+from .datetime_util import datetime_to_INTERNALDATE, datetime_to_native, format_criteria_date
+from .imap_utf7 import FolderNameCache
+from .response_parser import (parse_response, parse_message_list, parse_fetch_response,
+                              parse_esearch_response)
+from .response_types import CompactRecord, ESearchResult, FetchRecord
+from .cache import CACHED_ITEMS
+from .sequence_set import SequenceSet
 
 xrange = moves.xrange
 
@@ -67,6 +72,9 @@ FLAGGED = br'\Flagged'
 DRAFT = br'\Draft'
 RECENT = br'\Recent'         # This flag is read-only
 
+# Summaries which can be requested with search(returning=...)
+SEARCH_RETURN_OPTIONS = (b'MIN', b'MAX', b'COUNT', b'ALL')
+
 
 class Namespace(tuple):
 
@@ -95,6 +103,10 @@ class IMAPClient(object):
     control SSL/TLS connection parameters. If this is not provided a
     sensible default context will be used.
 
+    *ssl_session* is an :py:attr:`ssl_session` of an earlier
+    connection made with the same *ssl_context*. The TLS session is
+    resumed if the server allows it, which saves a full handshake.
+
     If *stream* is ``True`` then *host* is used as the command to run
     to establish a connection to the IMAP server (defaults to
     ``False``). This is useful for exotic connection or authentication
@@ -113,6 +125,31 @@ class IMAPClient(object):
     system time). This attribute can be changed between ``fetch()``
     calls if required.
 
+    Set the *lazy_fetch* attribute to True to have ``fetch()`` and
+    ``iter_fetch()`` return each message's data as a
+    :py:class:`~net.imap.response_types.FetchRecord`, which only
+    converts ENVELOPE, BODY, BODYSTRUCTURE and INTERNALDATE values
+    when they are looked up. This saves most of the parsing for callers
+    that only use some of the items fetched.
+
+    Set the *compact_fetch* attribute to True to have them return each
+    message's data as a :py:class:`~net.imap.response_types.CompactRecord`
+    instead, which holds the common items in slots rather than a dict.
+    This is worth it for the data of large folders kept in memory.
+
+    The *max_id_list_length* attribute bounds the length (in bytes) of
+    the message id list sent with a single FETCH, STORE or COPY
+    command. Larger id sets are split into several commands which are
+    pipelined, with at most *pipeline_depth* commands in flight at
+    once, and their results merged. Set *max_id_list_length* to
+    ``None`` to always send a single command.
+
+    The *cache* attribute can be set to a
+    :py:class:`~net.imap.cache.MessageCache` to keep message metadata
+    (ENVELOPE, BODY, BODYSTRUCTURE, RFC822.SIZE, INTERNALDATE and
+    FLAGS) across calls and sessions. ``fetch()`` then only asks the
+    server for what isn't cached.
+
     The *debug* property can be used to enable debug logging. It can
     be set to an integer from 0 to 5 where 0 disables debug output and
     5 enables full output with wire logging and parsing logs. ``True``
@@ -130,7 +167,7 @@ class IMAPClient(object):
     ReadOnlyError = imaplib.IMAP4.readonly
 
     def __init__(self, host, port=None, use_uid=True, ssl=False, stream=False,
-                 ssl_context=None, timeout=None):
+                 ssl_context=None, timeout=None, ssl_session=None):
         if stream:
             if port is not None:
                 raise ValueError("can't set 'port' when 'stream' True")
@@ -143,11 +180,18 @@ class IMAPClient(object):
         self.port = port
         self.ssl = ssl
         self.ssl_context = ssl_context
+        self._ssl_session = ssl_session
         self.stream = stream
         self.use_uid = use_uid
         self.folder_encode = True
         self.log_file = sys.stderr
         self.normalise_times = True
+        self.lazy_fetch = False
+        self.compact_fetch = False
+        self._folder_names = FolderNameCache()
+        self.max_id_list_length = 8000
+        self.pipeline_depth = 4
+        self.cache = None
 
         self._timeout = timeout
         self._starttls_done = False
@@ -155,6 +199,7 @@ class IMAPClient(object):
         self._imap = self._create_IMAP4()
         self._imap._mesg = self._log    # patch in custom debug log method
         self._idle_tag = None
+        self._selected = None
 
         self._set_timeout()
 
@@ -164,10 +209,19 @@ class IMAPClient(object):
 
         if self.ssl:
             return tls.IMAP4_TLS(self.host, self.port, self.ssl_context,
-                                 self._timeout)
+                                 self._timeout, self._ssl_session)
 
         return imap4.IMAP4WithTimeout(self.host, self.port, self._timeout)
 
+    @property
+    def ssl_session(self):
+        """The :py:class:`ssl.SSLSession` of the connection, or None
+        if it isn't encrypted. Pass it as *ssl_session*, together with
+        the same *ssl_context*, to resume the session on a new
+        connection.
+        """
+        return getattr(self._sock, 'session', None)
+
     def _set_timeout(self):
         if self._timeout is not None:
             self._sock.settimeout(self._timeout)
@@ -339,6 +393,24 @@ class IMAPClient(object):
         # be detected by this method.
         return to_bytes(capability).upper() in self.capabilities()
 
+    def enable(self, *capabilities):
+        """Activate one or more server side capability extensions,
+        such as ``CONDSTORE`` or ``QRESYNC``.
+
+        Returns the list of capabilities the server actually enabled.
+        ENABLE is only allowed before a folder has been selected.
+
+        See :rfc:`5161` for more details.
+        """
+        if not self.has_capability('ENABLE'):
+            raise ValueError('server does not support the ENABLE extension')
+        data = self._raw_command_untagged(
+            b'ENABLE', [to_bytes(c) for c in capabilities],
+            unpack=True, response_name=b'ENABLED', uid=False)
+        if not data:
+            return []
+        return data.upper().split()
+
     def namespace(self):
         """Return the namespace for the account as a (personal, other,
         shared) tuple.
@@ -361,7 +433,7 @@ class IMAPClient(object):
                 converted = []
                 for prefix, separator in item:
                     if self.folder_encode:
-                        prefix = decode_utf7(prefix)
+                        prefix = self._folder_names.decode(prefix)
                     converted.append((prefix, to_unicode(separator)))
                 parts.append(tuple(converted))
         return Namespace(*parts)
@@ -447,10 +519,9 @@ class IMAPClient(object):
 
         ret = []
         parsed = parse_response(folder_data)
-        while parsed:
-            # TODO: could be more efficient
-            flags, delim, name = parsed[:3]
-            parsed = parsed[3:]
+        decode = self._folder_names.decode
+        for i in xrange(0, len(parsed), 3):
+            flags, delim, name = parsed[i:i + 3]
 
             if isinstance(name, (int, long)):
                 # Some IMAP implementations return integer folder names
@@ -458,7 +529,7 @@ class IMAPClient(object):
                 # back to strings.
                 name = text_type(name)
             elif self.folder_encode:
-                name = decode_utf7(name)
+                name = decode(name)
 
             ret.append((flags, delim, name))
         return ret
@@ -481,34 +552,14 @@ class IMAPClient(object):
              b'UIDNEXT': 11,
              b'UIDVALIDITY': 1239278212}
         """
+        self._selected = None
         self._command_and_check('select', self._normalise_folder(folder), readonly)
-        return self._process_select_response(self._imap.untagged_responses)
+        info = self._process_select_response(self._imap.untagged_responses)
+        self._selected = (folder, info)
+        return info
 
     def _process_select_response(self, resp):
-        untagged = _dict_bytes_normaliser(resp)
-        out = {}
-
-        # imaplib doesn't parse these correctly (broken regex) so replace
-        # with the raw values out of the OK section
-        for line in untagged.get(b'OK', []):
-            match = re.match(br'\[(?P<key>[A-Z-]+)( \((?P<data>.*)\))?\]', line)
-            if match:
-                key = match.group('key')
-                if key == b'PERMANENTFLAGS':
-                    out[key] = tuple(match.group('data').split())
-
-        for key, value in iteritems(untagged):
-            key = key.upper()
-            if key in (b'OK', b'PERMANENTFLAGS'):
-                continue  # already handled above
-            elif key in (b'EXISTS', b'RECENT', b'UIDNEXT', b'UIDVALIDITY', b'HIGHESTMODSEQ'):
-                value = int(value[0])
-            elif key == b'READ-WRITE':
-                value = True
-            elif key == b'FLAGS':
-                value = tuple(value[0][1:-1].split())
-            out[key] = value
-        return out
+        return process_select_response(resp)
 
     def noop(self):
         """Execute the NOOP command.
@@ -529,6 +580,25 @@ class IMAPClient(object):
         tag = self._imap._command('NOOP')
         return self._consume_until_tagged_response(tag, 'NOOP')
 
+    def pipeline(self, depth=None):
+        """Return a :py:class:`~net.imap.pipeline.Pipeline` that sends
+        commands without waiting for the ones before them to complete.
+        Each command returns a result object whose ``result()`` method
+        gives what the matching IMAPClient method would have returned::
+
+            with client.pipeline() as p:
+                bodies = [p.fetch([msgid], ['BODY.PEEK[1]']) for msgid in ids]
+                p.add_flags(ids, ['processed'])
+            for body in bodies:
+                print(body.result())
+
+        At most *depth* commands are in flight at once (64 by default).
+        The client must not be used directly while the pipeline still
+        has commands in flight.
+        """
+        from .pipeline import Pipeline, DEFAULT_DEPTH
+        return Pipeline(self, depth or DEFAULT_DEPTH)
+
     def idle(self):
         """Put the server into IDLE mode.
 
@@ -638,6 +708,7 @@ class IMAPClient(object):
         """Close the currently selected folder, returning the server
         response string.
         """
+        self._selected = None
         return self._command_and_check('close', unpack=True)
 
     def create_folder(self, folder):
@@ -673,7 +744,7 @@ class IMAPClient(object):
         """
         return self._command_and_check('unsubscribe', self._normalise_folder(folder))
 
-    def search(self, criteria='ALL', charset=None):
+    def search(self, criteria='ALL', charset=None, returning=None):
         """Return a list of messages ids from the currently selected
         folder matching *criteria*.
 
@@ -724,7 +795,23 @@ class IMAPClient(object):
         attribute. This is set if the server included a MODSEQ value
         to the search response (i.e. if a MODSEQ criteria was included
         in the search).
+
+        *returning* asks for a summary of the matching messages rather
+        than the full list of ids. It is a sequence of one or more of
+        ``MIN``, ``MAX``, ``COUNT`` and ``ALL`` and an
+        :py:class:`.ESearchResult` is returned. For example, to count
+        the unread messages in a folder::
+
+            c.search(['UNSEEN'], returning=['COUNT']).count
+
+        ``ALL`` gives the matching ids as a range encoded
+        :py:class:`.SequenceSet`. If the server supports ESEARCH
+        (:rfc:`4731`) only the requested summary is transferred,
+        otherwise the full list of ids is fetched and summarised
+        locally.
         """
+        if returning:
+            return self._esearch(criteria, charset, returning)
         return self._search(criteria, charset)
 
     def gmail_search(self, query, charset='UTF-8'):
@@ -752,6 +839,23 @@ class IMAPClient(object):
         data = self._raw_command_untagged(b'SEARCH', args)
         return parse_message_list(data)
 
+    def _esearch(self, criteria, charset, returning):
+        returning = [to_bytes(option).upper() for option in _normalise_text_list(returning)]
+        for option in returning:
+            if option not in SEARCH_RETURN_OPTIONS:
+                raise ValueError('unsupported search return option: %s' % to_unicode(option))
+
+        if not self.has_capability('ESEARCH'):
+            return _summarise_search(self._search(criteria, charset), returning)
+
+        args = [b'RETURN', b'(' + b' '.join(returning) + b')']
+        if charset:
+            args.extend([b'CHARSET', to_bytes(charset)])
+        args.extend(_normalise_search_criteria(criteria, charset))
+
+        data = self._raw_command_untagged(b'SEARCH', args, response_name=b'ESEARCH')
+        return parse_esearch_response(data, returning)
+
     def sort(self, sort_criteria, criteria='ALL', charset='UTF-8'):
         """Return a list of message ids from the currently selected
         folder, sorted by *sort_criteria* and optionally filtered by
@@ -959,10 +1063,181 @@ class IMAPClient(object):
                     b'INTERNALDATE': datetime.datetime(2011, 2, 24, 19, 30, 36),
                     b'SEQ': 110}}
 
+        If a *cache* is set, *use_uid* is on and *messages* is a
+        sequence of UIDs, cached items are returned without asking the
+        server for them. Messages answered entirely from the cache have
+        no *SEQ* entry.
+
         """
         if not messages:
             return {}
+        if self._cache_usable(messages, modifiers):
+            return self._cached_fetch(messages, data)
+        return self._fetch(messages, data, modifiers, self.normalise_times)
+
+    def _fetch(self, messages, data, modifiers, normalise_times):
+        batches = self._batch_message_ids(messages)
+        if len(batches) > 1:
+            parsed = defaultdict(CompactRecord if self.compact_fetch else
+                                 FetchRecord if self.lazy_fetch else dict)
+            commands = [self._fetch_args(batch, data, modifiers) for batch in batches]
+            for _ in self._pipelined('FETCH', commands):
+                records = self._imap.untagged_responses.pop('FETCH', [])
+                for msgid, msg_data in iteritems(parse_fetch_response(
+                        records, normalise_times, self.use_uid, self.lazy_fetch,
+                        self.compact_fetch)):
+                    parsed[msgid].update(msg_data)
+            return parsed
+
+        tag = self._imap._command(*self._fetch_args(batches[0], data, modifiers))
+        typ, data = self._imap._command_complete('FETCH', tag)
+        self._checkok('fetch', typ, data)
+        typ, data = self._imap._untagged_response(typ, data, 'FETCH')
+
+        # return email.message_from_bytes(data[0][1])
+
+        return parse_fetch_response(data, normalise_times, self.use_uid, self.lazy_fetch,
+                                    self.compact_fetch)
+
+    def _cache_usable(self, messages, modifiers):
+        if self.cache is None or not self.use_uid or modifiers or not self._selected:
+            return False
+        if isinstance(messages, (text_type, binary_type)):
+            return False
+        if isinstance(messages, integer_types + (SequenceSet,)):
+            return True
+        return all(isinstance(m, integer_types) for m in messages)
+
+    def _cached_fetch(self, messages, data):
+        folder, info = self._cached_folder()
+        uidvalidity = info.get(b'UIDVALIDITY')
+        highestmodseq = info.get(b'HIGHESTMODSEQ')
+        cache = self.cache
+        if isinstance(messages, integer_types):
+            messages = [messages]
+        uids = list(messages)
+
+        if isinstance(data, (text_type, binary_type)):
+            data = [data]
+        items = [to_bytes(item).upper() for item in data]
+        immutable = [item for item in items if item in CACHED_ITEMS and item != b'FLAGS']
+        uncached = [item for item in items if item not in CACHED_ITEMS]
+
+        cached_validity, modseq = cache.folder_state(folder)
+        if cached_validity != uidvalidity or modseq is None:
+            modseq = highestmodseq
+            cache.set_folder_state(folder, uidvalidity, modseq)
+
+        # Cached flags can be trusted once brought up to date with a
+        # CHANGEDSINCE fetch, which isn't needed if they're already as
+        # recent as the HIGHESTMODSEQ the folder was selected at. Without
+        # CONDSTORE they're always fetched and never cached.
+        flags_cached = b'FLAGS' in items and highestmodseq is not None and modseq is not None
+        if flags_cached and modseq < highestmodseq:
+            self._refresh_cached_flags(folder, uidvalidity, modseq)
+        lookup = (immutable + [b'FLAGS']) if flags_cached else immutable
+        out = cache.get(folder, uids, lookup)
+
+        # Group the UIDs by what still has to be fetched for them
+        missing = defaultdict(list)
+        for uid in uids:
+            have = out.get(uid, {})
+            need = [item for item in lookup if item not in have] + uncached
+            if b'FLAGS' in items and not flags_cached:
+                need.append(b'FLAGS')
+            if need:
+                missing[tuple(need)].append(uid)
+
+        for need, need_uids in iteritems(missing):
+            fetched = self._fetch(need_uids, need, None, False)
+            if flags_cached or b'FLAGS' not in need:
+                cache.put(folder, fetched)
+            else:
+                cache.put(folder, dict((uid, dict((k, v) for k, v in iteritems(msg_data) if k != b'FLAGS'))
+                                       for uid, msg_data in iteritems(fetched)))
+            gone = set(need_uids).difference(fetched)
+            if gone:
+                cache.discard(folder, gone)
+            for uid in gone:
+                out.pop(uid, None)
+            for uid, msg_data in iteritems(fetched):
+                out.setdefault(uid, {}).update(msg_data)
+
+        if self.normalise_times:
+            for msg_data in out.values():
+                _normalise_cached_times(msg_data)
+        return out
+
+    def _cached_folder(self):
+        folder, info = self._selected
+        # Keyed by the name as sent to the server, so 'INBOX' and
+        # b'INBOX' share their cached messages and MODSEQ
+        return to_unicode(self._encode_folder(folder)), info
+
+    def _cache_stored_flags(self, stored):
+        # Flags set by this client won't be picked up by a CHANGEDSINCE
+        # fetch if that is skipped, so the cache is updated here
+        if self.cache is None or not self.use_uid or not self._selected:
+            return
+        folder, info = self._cached_folder()
+        if self.cache.folder_state(folder)[0] == info.get(b'UIDVALIDITY'):
+            self.cache.put(folder, dict((uid, {b'FLAGS': msg_data[b'FLAGS']})
+                                        for uid, msg_data in iteritems(stored)
+                                        if b'FLAGS' in msg_data))
+
+    def _refresh_cached_flags(self, folder, uidvalidity, modseq):
+        changed = self._fetch(b'1:*', [b'FLAGS'], ['CHANGEDSINCE %d' % modseq], False)
+        if not changed:
+            return
+        self.cache.put(folder, changed)
+        latest = max(msg_data.get(b'MODSEQ', (modseq,))[0] for msg_data in changed.values())
+        self.cache.set_folder_state(folder, uidvalidity, max(latest, modseq))
+
+    def iter_fetch(self, messages, data, modifiers=None):
+        """Retrieve selected *data* associated with one or more
+        *messages*, yielding a ``(msgid, data)`` tuple for each message
+        as soon as its FETCH response has been read from the server.
+
+        The arguments and the per-message data are the same as for
+        :py:meth:`.fetch`. Only one message is held in memory at a
+        time, so this is the better choice for large result sets.
 
+        No other command may be issued until the returned generator
+        is exhausted. If it is closed early the rest of the response
+        is read and discarded.
+
+        Example::
+
+            >> for msgid, data in c.iter_fetch(ids, ['ENVELOPE']):
+            ..     print(msgid, data[b'ENVELOPE'].subject)
+
+        """
+        if not messages:
+            return
+
+        tag = self._imap._command(*self._fetch_args(messages, data, modifiers))
+        tagged_commands = self._imap.tagged_commands
+        untagged = self._imap.untagged_responses
+        try:
+            while not tagged_commands[tag]:
+                self._imap._get_response()
+                records = untagged.pop('FETCH', None)
+                if records:
+                    parsed = parse_fetch_response(records, self.normalise_times, self.use_uid,
+                                                  self.lazy_fetch, self.compact_fetch)
+                    for item in iteritems(parsed):
+                        yield item
+        except GeneratorExit:
+            while not tagged_commands[tag]:
+                self._imap._get_response()
+                untagged.pop('FETCH', None)
+            tagged_commands.pop(tag)
+            raise
+
+        typ, data = tagged_commands.pop(tag)
+        self._checkok('fetch', typ, data)
+
+    def _fetch_args(self, messages, data, modifiers):
         args = [
             'FETCH',
             join_message_ids(messages),
@@ -971,14 +1246,7 @@ class IMAPClient(object):
         ]
         if self.use_uid:
             args.insert(0, 'UID')
-        tag = self._imap._command(*args)
-        typ, data = self._imap._command_complete('FETCH', tag)
-        self._checkok('fetch', typ, data)
-        typ, data = self._imap._untagged_response(typ, data, 'FETCH')
-
-        # return email.message_from_bytes(data[0][1])
-
-        return parse_fetch_response(data, self.normalise_times, self.use_uid)
+        return args
 
     def append(self, folder, msg, flags=(), msg_time=None):
         """Append a message to *folder*.
@@ -1016,9 +1284,20 @@ class IMAPClient(object):
         """Copy one or more messages from the current folder to
         *folder*. Returns the COPY response string returned by the
         server.
+
+        If *messages* has to be split over several COPY commands (see
+        *max_id_list_length*) the response to the last one is returned.
         """
+        batches = self._batch_message_ids(messages)
+        if len(batches) > 1:
+            folder = self._normalise_folder(folder)
+            commands = [self._uid_args('COPY', batch, folder) for batch in batches]
+            for typ, data in self._pipelined('COPY', commands):
+                pass
+            return data[0]
+
         return self._command_and_check('copy',
-                                       join_message_ids(messages),
+                                       batches[0],
                                        self._normalise_folder(folder),
                                        uid=True, unpack=True)
 
@@ -1084,16 +1363,16 @@ class IMAPClient(object):
         self._checkok(command, typ, data)
         return data[0], resps
 
-    def _raw_command_untagged(self, command, args, unpack=False):
+    def _raw_command_untagged(self, command, args, unpack=False, response_name=None, uid=True):
         # TODO: eventually this should replace _command_and_check (call it _command)
-        typ, data = self._raw_command(command, args)
-        typ, data = self._imap._untagged_response(typ, data, to_unicode(command))
+        typ, data = self._raw_command(command, args, uid=uid)
+        typ, data = self._imap._untagged_response(typ, data, to_unicode(response_name or command))
         self._checkok(to_unicode(command), typ, data)
         if unpack:
             return data[0]
         return data
 
-    def _raw_command(self, command, args):
+    def _raw_command(self, command, args, uid=True):
         """Run the specific command with the arguments given. 8-bit arguments
         are sent as literals. The return value is (typ, data).
 
@@ -1103,6 +1382,7 @@ class IMAPClient(object):
 
         *command* should be specified as bytes.
         *args* should be specified as a list of bytes.
+        *uid* sends the command as a UID command if *use_uid* is set.
         """
         if self.debug >= 4:
             self._log_ts()
@@ -1117,7 +1397,7 @@ class IMAPClient(object):
 
         tag = self._imap._new_tag()
         prefix = [to_bytes(tag)]
-        if self.use_uid:
+        if uid and self.use_uid:
             prefix.append(b'UID')
         prefix.append(command)
 
@@ -1192,6 +1472,48 @@ class IMAPClient(object):
     def _checkok(self, command, typ, data):
         self._check_resp('OK', command, typ, data)
 
+    def _batch_message_ids(self, messages):
+        return batch_message_ids(messages, self.max_id_list_length)
+
+    def _uid_args(self, command, *args):
+        if self.use_uid:
+            return ('UID', command) + args
+        return (command,) + args
+
+    def _pipelined(self, command, commands):
+        """Send each argument list in *commands* without waiting for
+        the previous one to complete, keeping at most *pipeline_depth*
+        commands in flight.
+
+        Yields the (typ, data) tagged response of each command in
+        order. Untagged responses are left in the usual imaplib
+        untagged_responses store for the caller to collect.
+        """
+        in_flight = deque()
+        try:
+            for args in commands:
+                if len(in_flight) >= max(self.pipeline_depth, 1):
+                    yield self._complete_pipelined(command, in_flight.popleft())
+                in_flight.append(self._imap._command(*args))
+            while in_flight:
+                yield self._complete_pipelined(command, in_flight.popleft())
+        except self.AbortError:
+            raise
+        except self.Error:
+            # Don't leave the responses to commands already sent on the
+            # wire for the next caller to trip over.
+            for tag in in_flight:
+                self._imap._get_tagged_response(tag)
+            # The FETCH responses to the batches drained above (and to
+            # STORE, which answers with FETCH) are no use to anyone now.
+            self._imap.untagged_responses.pop('FETCH', None)
+            raise
+
+    def _complete_pipelined(self, command, tag):
+        typ, data = self._imap._command_complete(command, tag)
+        self._checkok(command.lower(), typ, data)
+        return typ, data
+
     def _store(self, cmd, messages, flags, fetch_key):
         """Worker function for the various flag manipulation methods.
 
@@ -1199,12 +1521,27 @@ class IMAPClient(object):
         """
         if not messages:
             return {}
+
+        batches = self._batch_message_ids(messages)
+        if len(batches) > 1:
+            flags = seq_to_parenstr(flags)
+            commands = [self._uid_args('STORE', batch, cmd, flags) for batch in batches]
+            out = {}
+            for _ in self._pipelined('STORE', commands):
+                data = self._imap.untagged_responses.pop('FETCH', [])
+                stored = parse_fetch_response(data)
+                self._cache_stored_flags(stored)
+                out.update(self._filter_fetch_dict(stored, fetch_key))
+            return out
+
         data = self._command_and_check('store',
-                                       join_message_ids(messages),
+                                       batches[0],
                                        cmd,
                                        seq_to_parenstr(flags),
                                        uid=True)
-        return self._filter_fetch_dict(parse_fetch_response(data), fetch_key)
+        stored = parse_fetch_response(data)
+        self._cache_stored_flags(stored)
+        return self._filter_fetch_dict(stored, fetch_key)
 
     def _filter_fetch_dict(self, fetch_dict, key):
         return dict((msgid, data[key])
@@ -1243,11 +1580,14 @@ class IMAPClient(object):
         self._log_write(text, end=True)
 
     def _normalise_folder(self, folder_name):
+        return _quote(self._encode_folder(folder_name))
+
+    def _encode_folder(self, folder_name):
         if isinstance(folder_name, binary_type):
             folder_name = folder_name.decode('ascii')
         if self.folder_encode:
-            folder_name = encode_utf7(folder_name)
-        return _quote(folder_name)
+            folder_name = self._folder_names.encode(folder_name)
+        return folder_name
 
     def _normalise_labels(self, labels):
         if isinstance(labels, (text_type, binary_type)):
@@ -1320,6 +1660,60 @@ def _join_and_paren(items):
     return '(' + ' '.join(items) + ')'
 
 
+def process_select_response(resp):
+    """Build the dict returned by select_folder() from the untagged
+    responses to a SELECT or EXAMINE.
+    """
+    untagged = _dict_bytes_normaliser(resp)
+    out = {}
+
+    # imaplib doesn't parse these correctly (broken regex) so replace
+    # with the raw values out of the OK section
+    for line in untagged.get(b'OK', []):
+        match = re.match(br'\[(?P<key>[A-Z-]+)( \((?P<data>.*)\))?\]', line)
+        if match:
+            key = match.group('key')
+            if key == b'PERMANENTFLAGS':
+                out[key] = tuple(match.group('data').split())
+
+    for key, value in iteritems(untagged):
+        key = key.upper()
+        if key in (b'OK', b'PERMANENTFLAGS'):
+            continue  # already handled above
+        elif key in (b'EXISTS', b'RECENT', b'UIDNEXT', b'UIDVALIDITY', b'HIGHESTMODSEQ'):
+            value = int(value[0])
+        elif key == b'READ-WRITE':
+            value = True
+        elif key == b'FLAGS':
+            value = tuple(value[0][1:-1].split())
+        out[key] = value
+    return out
+
+
+def _summarise_search(ids, returning):
+    """Build an ESearchResult for *returning* from a plain SEARCH result.
+    """
+    return ESearchResult(
+        min=min(ids) if ids and b'MIN' in returning else None,
+        max=max(ids) if ids and b'MAX' in returning else None,
+        count=len(ids) if b'COUNT' in returning else None,
+        all=SequenceSet(ids) if b'ALL' in returning else None,
+        modseq=ids.modseq,
+    )
+
+
+def _normalise_cached_times(msg_data):
+    """Apply *normalise_times* to the timezone aware datetimes kept in
+    the message cache.
+    """
+    internaldate = msg_data.get(b'INTERNALDATE')
+    if internaldate is not None and internaldate.tzinfo:
+        msg_data[b'INTERNALDATE'] = datetime_to_native(internaldate)
+    envelope = msg_data.get(b'ENVELOPE')
+    if envelope is not None and envelope.date is not None and envelope.date.tzinfo:
+        msg_data[b'ENVELOPE'] = envelope._replace(date=datetime_to_native(envelope.date))
+
+
 def _normalise_text_list(items):
     if isinstance(items, (text_type, binary_type)):
         items = (items,)
@@ -1328,10 +1722,49 @@ def _normalise_text_list(items):
 def join_message_ids(messages):
     """Convert a sequence of messages ids or a single integer message id
     into an id byte string for use with IMAP commands
+
+    A sequence made up only of integers (or a SequenceSet) is sorted,
+    deduplicated and collapsed into ranges, so ``[3, 1, 2, 7]``
+    becomes ``b'1:3,7'``. Other sequences are joined as given.
     """
+    return b','.join(_message_id_parts(messages))
+
+
+def _message_id_parts(messages):
     if isinstance(messages, (text_type, binary_type, integer_types)):
-        messages = (to_bytes(messages),)
-    return b','.join(_maybe_int_to_bytes(m) for m in messages)
+        return [_maybe_int_to_bytes(to_bytes(messages))]
+    if isinstance(messages, SequenceSet):
+        return messages.parts()
+    messages = list(messages)
+    if all(isinstance(m, integer_types) for m in messages):
+        return SequenceSet(messages).parts()
+    return [_maybe_int_to_bytes(m) for m in messages]
+
+
+def batch_message_ids(messages, max_length):
+    """Split a sequence of message ids into id byte strings (see
+    join_message_ids) which are each at most *max_length* bytes long.
+
+    A single id is never split, even if it is longer than
+    *max_length*. If *max_length* is ``None`` a single id string is
+    returned.
+    """
+    if max_length is None or isinstance(messages, (text_type, binary_type, integer_types)):
+        return [join_message_ids(messages)]
+
+    batches = []
+    batch = []
+    length = -1
+    for m in _message_id_parts(messages):
+        if batch and length + 1 + len(m) > max_length:
+            batches.append(b','.join(batch))
+            batch = []
+            length = -1
+        batch.append(m)
+        length += 1 + len(m)
+    if batch:
+        batches.append(b','.join(batch))
+    return batches or [b'']
 
 
 def _maybe_int_to_bytes(val):
@@ -0,0 +1,256 @@
+# coding=utf-8
+"""
+Explicit command pipelining.
+
+A :py:class:`Pipeline` writes commands to the server back to back
+without waiting for each one to complete, so a run of small commands
+costs about one round trip instead of one per command::
+
+    with client.pipeline() as p:
+        flags = p.get_flags([1, 2, 3])
+        p.add_flags([4], ['processed'])
+        body = p.fetch([5], ['BODY.PEEK[1]'])
+    print(flags.result(), body.result())
+
+Each call returns a :py:class:`PipelineResult` straight away. Responses
+are matched to commands by tag as they are read; untagged responses
+are given to the oldest command still waiting, as IMAP servers answer
+the commands of a connection in order.
+"""
+
+from __future__ import unicode_literals
+
+from collections import deque
+
+from .imapclient import _is8bit, _normalise_search_criteria, seq_to_parenstr
+from .response_parser import parse_fetch_response, parse_message_list
+from .response_types import SearchIds
+from .util import to_unicode
+
+__all__ = ['Pipeline', 'PipelineResult']
+
+# Commands in flight before the oldest one is waited for. Commands are
+# small, but the responses to them may not be: reading them as we go
+# keeps the server from blocking on a full socket while we are still
+# writing.
+DEFAULT_DEPTH = 64
+
+
+class PipelineResult(object):
+    """The outcome of a command queued on a :py:class:`Pipeline`.
+    """
+
+    def __init__(self, pipeline, response_name, finish, commands):
+        self._pipeline = pipeline
+        self._response_name = response_name
+        self._finish = finish
+        self._remaining = commands
+        self._records = []
+        self._value = None
+        self._error = None
+        self._retrieved = False
+
+    def done(self):
+        """Return True once the server has answered the command.
+        """
+        return self._remaining == 0
+
+    def result(self):
+        """Return the value the equivalent :py:class:`IMAPClient` method
+        would have returned, waiting for the server to answer the
+        command (and those queued before it) if need be.
+
+        Raises :py:attr:`IMAPClient.Error` if the command failed.
+        """
+        while not self.done():
+            self._pipeline._complete_next()
+        self._retrieved = True
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def _add(self, records, data):
+        self._records.extend(records)
+        self._remaining -= 1
+        if self._remaining == 0 and self._error is None:
+            try:
+                self._value = self._finish(self._records, data)
+            except Exception as e:
+                self._error = e
+            self._records = None
+
+    def _fail(self, error):
+        if self._error is None:
+            self._error = error
+
+
+class Pipeline(object):
+    """Queues commands for *client*, an :py:class:`IMAPClient`. Use
+    :py:meth:`IMAPClient.pipeline` to create one.
+
+    At most *depth* commands are in flight at once. Leaving the
+    ``with`` block waits for every queued command and raises the error
+    of the first one that failed, unless its :py:class:`PipelineResult`
+    was already checked.
+
+    The client must not be used directly while commands are in flight;
+    call :py:meth:`flush` first.
+    """
+
+    def __init__(self, client, depth=DEFAULT_DEPTH):
+        self.client = client
+        self.depth = max(depth, 1)
+        self._in_flight = deque()
+        # Only failures are kept: holding on to every result would
+        # keep all the data of a long pipeline alive
+        self._failed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and issubclass(exc_type, self.client.AbortError):
+            # The connection is gone, nothing more will be answered
+            return
+        self.flush()
+        if exc_type is None:
+            for result in self._failed:
+                if not result._retrieved:
+                    raise result._error
+
+    def flush(self):
+        """Wait until the server has answered every queued command.
+        """
+        while self._in_flight:
+            self._complete_next()
+
+    def fetch(self, messages, data, modifiers=None):
+        """Queue a FETCH. See :py:meth:`IMAPClient.fetch`.
+        """
+        normalise_times = self.client.normalise_times
+        use_uid = self.client.use_uid
+        lazy = self.client.lazy_fetch
+        compact = self.client.compact_fetch
+
+        def finish(records, _):
+            return parse_fetch_response(records, normalise_times, use_uid, lazy, compact)
+
+        return self._queue('FETCH', [
+            self.client._fetch_args(batch, data, modifiers)
+            for batch in self._batches(messages)], finish, response_name='FETCH')
+
+    def get_flags(self, messages):
+        """Queue a FETCH of the flags of *messages*. See
+        :py:meth:`IMAPClient.get_flags`.
+        """
+        client = self.client
+        return self._queue('FETCH', [
+            client._fetch_args(batch, ['FLAGS'], None) for batch in self._batches(messages)],
+            lambda records, _: client._filter_fetch_dict(
+                parse_fetch_response(records, uid_is_key=client.use_uid), b'FLAGS'),
+            response_name='FETCH')
+
+    def add_flags(self, messages, flags):
+        """Queue a STORE adding *flags*. See
+        :py:meth:`IMAPClient.add_flags`.
+        """
+        return self._store(b'+FLAGS', messages, flags)
+
+    def remove_flags(self, messages, flags):
+        """Queue a STORE removing *flags*. See
+        :py:meth:`IMAPClient.remove_flags`.
+        """
+        return self._store(b'-FLAGS', messages, flags)
+
+    def set_flags(self, messages, flags):
+        """Queue a STORE replacing the flags with *flags*. See
+        :py:meth:`IMAPClient.set_flags`.
+        """
+        return self._store(b'FLAGS', messages, flags)
+
+    def delete_messages(self, messages):
+        """Queue a STORE adding ``\\Deleted``. See
+        :py:meth:`IMAPClient.delete_messages`.
+        """
+        return self.add_flags(messages, [b'\\Deleted'])
+
+    def copy(self, messages, folder):
+        """Queue a COPY. See :py:meth:`IMAPClient.copy`.
+        """
+        folder = self.client._normalise_folder(folder)
+        return self._queue('COPY', [
+            self.client._uid_args('COPY', batch, folder) for batch in self._batches(messages)],
+            lambda _, data: data[0])
+
+    def search(self, criteria='ALL'):
+        """Queue a SEARCH. See :py:meth:`IMAPClient.search`; criteria
+        can't contain 8-bit characters as those have to be sent as
+        literals, which need a round trip of their own.
+        """
+        args = _normalise_search_criteria(criteria)
+        if any(_is8bit(arg) for arg in args):
+            raise ValueError("can't pipeline a search with 8-bit criteria")
+        return self._queue('SEARCH', [self.client._uid_args('SEARCH', *args)],
+                           # No * SEARCH response at all when nothing matched
+                           lambda records, _: parse_message_list(records) if records else SearchIds(),
+                           response_name='SEARCH')
+
+    def noop(self):
+        """Queue a NOOP. The result is the server's response text.
+        """
+        return self._queue('NOOP', [('NOOP',)], lambda _, data: data[0])
+
+    def _batches(self, messages):
+        if not messages:
+            return []
+        return self.client._batch_message_ids(messages)
+
+    def _store(self, cmd, messages, flags):
+        flags = seq_to_parenstr(flags)
+        client = self.client
+        return self._queue('STORE', [
+            client._uid_args('STORE', batch, cmd, flags) for batch in self._batches(messages)],
+            lambda records, _: client._filter_fetch_dict(
+                parse_fetch_response(records), b'FLAGS'),
+            response_name='FETCH')
+
+    def _queue(self, command, commands, finish, response_name=None):
+        result = PipelineResult(self, response_name, finish, len(commands))
+        if not commands:
+            result._remaining = 1
+            result._add([], None)
+            return result
+        imap = self.client._imap
+        for args in commands:
+            while len(self._in_flight) >= self.depth:
+                self._complete_next()
+            self._in_flight.append((imap._command(*args), command, result))
+        return result
+
+    def _complete_next(self):
+        tag, command, result = self._in_flight.popleft()
+        client = self.client
+        imap = client._imap
+        try:
+            typ, data = imap._command_complete(command, tag)
+            client._checkok(command.lower(), typ, data)
+        except client.AbortError as e:
+            result._fail(e)
+            result._remaining = 0
+            self._abandon()
+            raise
+        except client.Error as e:
+            result._fail(e)
+            data = None
+        finally:
+            name = result._response_name
+            records = imap.untagged_responses.pop(to_unicode(name), []) if name else []
+        result._add(records, data)
+        if result.done() and result._error is not None:
+            self._failed.append(result)
+
+    def _abandon(self):
+        while self._in_flight:
+            _, _, result = self._in_flight.popleft()
+            result._fail(self.client.AbortError('connection lost'))
+            result._remaining = 0
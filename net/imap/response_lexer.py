@@ -11,7 +11,11 @@ external callers.
 
 from __future__ import unicode_literals
 
+import re
+from itertools import chain
+
 import six
+from six.moves import map
 
 __all__ = ["TokenSource"]
 
@@ -21,10 +25,26 @@ SPECIALS = frozenset(c for c in six.iterbytes(b' ()%"['))
 NON_SPECIALS = ALL_CHARS - SPECIALS - CTRL_CHARS
 WHITESPACE = frozenset(c for c in six.iterbytes(b' \t\r\n'))
 
-BACKSLASH = ord('\\')
-OPEN_SQUARE = ord('[')
-CLOSE_SQUARE = ord(']')
-DOUBLE_QUOTE = ord('"')
+# Regex building blocks. _ATOM_CHAR matches exactly NON_SPECIALS.
+_ATOM_CHAR = br'[^\x00-\x20()%"\[]'
+_BRACKETED = br'\[[^\]]*\]' + _ATOM_CHAR + b'*'
+_ATOM = (_ATOM_CHAR + b'+(?:' + _BRACKETED + b')*|' +
+         _BRACKETED + b'(?:' + _BRACKETED + b')*')
+_QUOTED = br'"[^"\\]*(?:\\.[^"\\]*)*"'
+_OTHER = br'[^ \t\r\n]'
+
+# A token is an atom (which may embed [...] sections), a quoted string
+# or any other single non-whitespace character. Whitespace never
+# matches so findall() skips over it. Unterminated quotes and square
+# brackets fall through to the single character case and are reported
+# by the Lexer.
+_TOKEN_RE = re.compile(_ATOM + b'|' + _QUOTED + b'|' + _OTHER, re.DOTALL)
+_ESCAPE_RE = re.compile(br'\\([\\"])')
+
+_UNTERMINATED = {
+    b'"': "No closing '\"'",
+    b'[': "No closing ']'",
+}
 
 
 class TokenSource(object):
@@ -48,75 +68,39 @@ class TokenSource(object):
 class Lexer(object):
     """
     A lexical analyzer class for IMAP
+
+    Each response record is split into tokens in a single regex pass
+    over the raw bytes rather than by walking it byte by byte.
     """
 
     def __init__(self, text):
         self.sources = (LiteralHandlingIter(self, chunk) for chunk in text)
         self.current_source = None
 
-    def read_until(self, stream_i, end_char, escape=True):
-        token = bytearray()
-        try:
-            for nextchar in stream_i:
-                if escape and nextchar == BACKSLASH:
-                    escaper = nextchar
-                    nextchar = six.next(stream_i)
-                    if nextchar != escaper and nextchar != end_char:
-                        token.append(escaper)  # Don't touch invalid escaping
-                elif nextchar == end_char:
-                    break
-                token.append(nextchar)
-            else:
-                raise ValueError("No closing '%s'" % chr(end_char))
-        except StopIteration:
-            raise ValueError("No closing '%s'" % chr(end_char))
-        token.append(end_char)
-        return token
-
-    def read_token_stream(self, stream_i):
-        whitespace = WHITESPACE
-        wordchars = NON_SPECIALS
-        read_until = self.read_until
-
-        while True:
-            # Whitespace
-            for nextchar in stream_i:
-                if nextchar not in whitespace:
-                    stream_i.push(nextchar)
-                    break    # done skipping over the whitespace
-
-            # Non-whitespace
-            token = bytearray()
-            for nextchar in stream_i:
-                if nextchar in wordchars:
-                    token.append(nextchar)
-                elif nextchar == OPEN_SQUARE:
-                    token.append(nextchar)
-                    token.extend(read_until(stream_i, CLOSE_SQUARE, escape=False))
-                else:
-                    if nextchar in whitespace:
-                        yield token
-                    elif nextchar == DOUBLE_QUOTE:
-                        assert not token
-                        token.append(nextchar)
-                        token.extend(read_until(stream_i, nextchar))
-                        yield token
-                    else:
-                        # Other punctuation, eg. "(". This ends the current token.
-                        if token:
-                            yield token
-                        yield bytearray([nextchar])
-                    break
-            else:
-                if token:
-                    yield token
-                break
+    def read_token_stream(self, text):
+        """Return the list of tokens contained in *text*.
+        """
+        tokens = _TOKEN_RE.findall(text)
+        if b'"' in tokens or b'[' in tokens:
+            for token in tokens:
+                if token in _UNTERMINATED:
+                    raise ValueError(_UNTERMINATED[token])
+        # Only \\ and \" are escapes, any other backslash is left alone.
+        if b'\\\\' in text or b'\\"' in text:
+            unescape = _ESCAPE_RE.sub
+            tokens = [unescape(br'\1', token)
+                      if token[:1] == b'"' and b'\\' in token else token
+                      for token in tokens]
+        return tokens
+
+    def _read_source(self, source):
+        self.current_source = source
+        return self.read_token_stream(source.src_text)
 
     def __iter__(self):
-        for source in self.sources:
-            self.current_source = source
-            for tok in self.read_token_stream(iter(source)):
-                yield bytes(tok)
+        # chain only pulls the next source once the tokens of the
+        # previous one are used up so current_source stays in step.
+        return chain.from_iterable(map(self._read_source, self.sources))
 
 
 # imaplib has poor handling of 'literals' - it both fails to remove the
@@ -144,29 +128,3 @@ class LiteralHandlingIter:
             # just a line with no literals.
             self.src_text = resp_record
             self.literal = None
-
-    def __iter__(self):
-        return PushableIterator(six.iterbytes(self.src_text))
-
-
-class PushableIterator(object):
-
-    NO_MORE = object()
-
-    def __init__(self, it):
-        self.it = iter(it)
-        self.pushed = []
-
-    def __iter__(self):
-        return self
-
-    def __next__(self):
-        if self.pushed:
-            return self.pushed.pop()
-        return six.next(self.it)
-
-    # For Python 2 compatibility
-    next = __next__
-
-    def push(self, item):
-        self.pushed.append(item)
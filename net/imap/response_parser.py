@@ -19,19 +19,42 @@ from collections import defaultdict
 
 import six
 
+from . import fused_parser
 from .datetime_util import parse_to_datetime
 from .response_lexer import TokenSource
-from .response_types import BodyData, Envelope, Address, SearchIds
+from .response_types import (BodyData, Envelope, Address, SearchIds, ESearchResult, FetchRecord,
+                             CompactRecord)
+from .sequence_set import SequenceSet
 
 xrange = six.moves.xrange
+map = six.moves.map
 
-__all__ = ['parse_response', 'parse_message_list', 'ParseError']
+__all__ = ['parse_response', 'parse_message_list', 'parse_esearch_response', 'ParseError',
+           'set_engine', 'ENGINES']
+
+# How responses are parsed. 'fused' goes from the raw bytes to values in
+# a single pass (see fused_parser). 'lexer' splits them into tokens
+# first (see response_lexer) and builds values from the tokens.
+ENGINES = ('fused', 'lexer')
+_engine = 'fused'
 
 
 class ParseError(ValueError):
     pass
 
 
+def set_engine(name):
+    """Select the parser behind :py:func:`parse_response`,
+    :py:func:`parse_fetch_response` and everything built on them, one
+    of :py:data:`ENGINES`. Both give the same results; the fused
+    parser is the faster one.
+    """
+    global _engine
+    if name not in ENGINES:
+        raise ValueError('unknown parser engine: %r' % (name,))
+    _engine = name
+
+
 def parse_response(data):
     """Pull apart IMAP command responses.
 
@@ -39,10 +62,12 @@ def parse_response(data):
     """
     if data == [None]:
         return []
+    if _engine == 'fused' and data:
+        return tuple(_parse_fused(data))
     return tuple(gen_parsed_response(data))
 
 
-_msg_id_pattern = re.compile("(\d+(?: +\d+)*)")
+_msg_id_pattern = re.compile(br"\d(?:[\d ,:]*\d)?")
 
 
 def parse_message_list(data):
@@ -55,6 +80,9 @@ def parse_message_list(data):
     The returned list is a SearchIds instance which has a *modseq*
     attribute which contains the MODSEQ response (if returned by the
     server).
+
+    Ids given in sequence set form (eg. ``2,5:7``), as some servers do
+    and as ESEARCH always does, are expanded.
     """
     if len(data) != 1:
         raise ValueError("unexpected message list data")
@@ -63,20 +91,28 @@ def parse_message_list(data):
     if not data:
         return SearchIds()
 
-    if six.PY3 and isinstance(data, six.binary_type):
-        data = data.decode('ascii')
+    if isinstance(data, six.text_type):
+        data = data.encode('ascii')
 
     m = _msg_id_pattern.match(data)
     if not m:
         raise ValueError("unexpected message list format")
 
-    ids = SearchIds(int(n) for n in m.group(1).split())
+    # The ids are converted straight from the raw bytes into the
+    # array backing SearchIds, without an intermediate list of ints.
+    id_text = m.group()
+    if b',' in id_text:
+        id_text = id_text.replace(b',', b' ')
+    if b':' in id_text:
+        ids = SearchIds(SequenceSet.parse(b','.join(id_text.split())))
+    else:
+        ids = SearchIds(map(int, id_text.split()))
 
     # Parse any non-numeric part on the end using parse_response (this
     # is likely to be the MODSEQ section).
-    extra = data[m.end(1):]
+    extra = data[m.end():]
     if extra:
-        for item in parse_response([extra.encode('ascii')]):
+        for item in parse_response([extra]):
             if isinstance(item, tuple) and len(item) == 2 and item[0].lower() == b'modseq':
                 ids.modseq = item[1]
             elif isinstance(item, int):
@@ -84,9 +120,51 @@ def parse_message_list(data):
     return ids
 
 
+def parse_esearch_response(data, returning):
+    """Parse the data of an ESEARCH response into an ESearchResult.
+
+    *returning* is the sequence of return options (as upper case
+    bytes) that were requested. COUNT and ALL are filled in as 0 and an
+    empty SequenceSet when the server omits them because nothing
+    matched.
+    """
+    fields = {
+        'min': None,
+        'max': None,
+        'count': 0 if b'COUNT' in returning else None,
+        'all': SequenceSet() if b'ALL' in returning else None,
+        'modseq': None,
+    }
+
+    items = iter(parse_response(data))
+    for item in items:
+        if isinstance(item, tuple):
+            # Search correlator, eg. (TAG "A282")
+            continue
+        name = item.upper()
+        if name == b'UID':
+            continue
+        try:
+            value = six.next(items)
+        except StopIteration:
+            raise ParseError('missing value for ESEARCH %s' % name.decode('ascii', 'replace'))
+        if name == b'ALL':
+            if isinstance(value, six.integer_types):
+                value = str(value).encode('ascii')
+            fields['all'] = SequenceSet.parse(value)
+        elif name in (b'MIN', b'MAX', b'COUNT', b'MODSEQ'):
+            fields[name.decode('ascii').lower()] = _int_or_error(
+                value, 'invalid ESEARCH %s value' % name.decode('ascii'))
+    return ESearchResult(**fields)
+
+
 def gen_parsed_response(text):
     if not text:
         return
+    if _engine == 'fused':
+        for value in _parse_fused(text):
+            yield value
+        return
     src = TokenSource(text)
 
     token = None
@@ -100,17 +178,47 @@ def gen_parsed_response(text):
         raise ParseError("%s: %s" % (str(err), token))
 
 
-def parse_fetch_response(text, normalise_times=True, uid_is_key=True):
+def _parse_fused(text, defer=()):
+    try:
+        return fused_parser.parse(text, defer)
+    except ValueError:
+        _, err, _ = sys.exc_info()
+        raise ParseError(str(err))
+
+
+def parse_fetch_response(text, normalise_times=True, uid_is_key=True, lazy=False, compact=False):
     """Pull apart IMAP FETCH responses as returned by imaplib.
 
     Returns a dictionary, keyed by message ID. Each value a dictionary
     keyed by FETCH field type (eg."RFC822").
+
+    If *lazy* is True each value is a
+    :py:class:`~net.imap.response_types.FetchRecord`. ENVELOPE, BODY
+    and BODYSTRUCTURE values are set aside unparsed (as raw bytes with
+    the fused engine, as tokens with the lexer) and they, and
+    INTERNALDATE, are only converted when first looked up.
+    Errors in these values are then raised on lookup.
+
+    If *compact* is True each value is a
+    :py:class:`~net.imap.response_types.CompactRecord` instead, which
+    takes less memory than a dict (and also converts lazily if *lazy*
+    is True).
+
+    Item names, FLAGS tuples and the addresses of envelopes are shared
+    between the messages which have the same ones.
     """
     if text == [None]:
         return {}
-    response = gen_parsed_response(text)
+    record_type = CompactRecord if compact else FetchRecord if lazy else dict
+    if lazy and _engine == 'lexer':
+        return _parse_fetch_lazy(text, normalise_times, uid_is_key, record_type)
+    if lazy:
+        # The tuples of the lazily converted items are left unparsed
+        response = iter(_parse_fused(text, _LAZY_CONVERTERS))
+    else:
+        response = gen_parsed_response(text)
 
-    parsed_response = defaultdict(dict)
+    parsed_response = defaultdict(record_type)
     while True:
         try:
             msg_id = seq = _int_or_error(six.next(response),
@@ -130,9 +238,10 @@ def parse_fetch_response(text, normalise_times=True, uid_is_key=True):
 
         # always return the sequence of the message, so it is available
         # even if we return keyed by UID.
-        msg_data = {b'SEQ': seq}
+        msg_data = record_type()
+        msg_data[b'SEQ'] = seq
         for i in xrange(0, len(msg_response), 2):
-            word = msg_response[i].upper()
+            word = _item_name(msg_response[i])
             value = msg_response[i + 1]
 
             if word == b'UID':
@@ -141,12 +250,16 @@ def parse_fetch_response(text, normalise_times=True, uid_is_key=True):
                     msg_id = uid
                 else:
                     msg_data[word] = uid
+            elif lazy and word in _LAZY_CONVERTERS:
+                msg_data.set_lazy(word, _convert_lazy, _LAZY_CONVERTERS[word], value, normalise_times)
             elif word == b'INTERNALDATE':
                 msg_data[word] = _convert_INTERNALDATE(value, normalise_times)
             elif word == b'ENVELOPE':
                 msg_data[word] = _convert_ENVELOPE(value, normalise_times)
             elif word in (b'BODY', b'BODYSTRUCTURE'):
                 msg_data[word] = BodyData.create(value)
+            elif word == b'FLAGS':
+                msg_data[word] = _intern_flags(value)
             else:
                 msg_data[word] = value
 
@@ -155,6 +268,159 @@ def parse_fetch_response(text, normalise_times=True, uid_is_key=True):
     return parsed_response
 
 
+def _parse_fetch_lazy(text, normalise_times, uid_is_key, record_type):
+    src = TokenSource(text)
+    tokens = iter(src)
+    parsed_response = defaultdict(record_type)
+    token = None
+    try:
+        for token in tokens:
+            msg_id = seq = _int_or_error(atom(src, token), 'invalid message ID')
+            token = next(tokens, None)
+            if token != b'(':
+                raise ParseError('bad response type: %s' % repr(token))
+
+            msg_data = record_type()
+            msg_data[b'SEQ'] = seq
+            while True:
+                token = next(tokens, None)
+                if token is None:
+                    raise ParseError('unexpected EOF')
+                if token == b')':
+                    break
+                word = _item_name(atom(src, token))
+                token = next(tokens, None)
+                if token is None or token == b')':
+                    raise ParseError('uneven number of response items: %s' % repr(word))
+
+                convert = _LAZY_CONVERTERS.get(word)
+                if convert is not None:
+                    value = _skip_tuple(src, tokens) if token == b'(' else atom(src, token)
+                    msg_data.set_lazy(word, _convert_lazy, convert, value, normalise_times)
+                    continue
+                value = atom(src, token)
+                if word == b'UID':
+                    uid = _int_or_error(value, 'invalid UID')
+                    if uid_is_key:
+                        msg_id = uid
+                    else:
+                        msg_data[word] = uid
+                elif word == b'FLAGS':
+                    msg_data[word] = _intern_flags(value)
+                else:
+                    msg_data[word] = value
+
+            parsed_response[msg_id].update(msg_data)
+    except ParseError:
+        raise
+    except ValueError:
+        _, err, _ = sys.exc_info()
+        raise ParseError("%s: %s" % (str(err), token))
+    return parsed_response
+
+
+class _TokenSpan(object):
+    """The tokens of one parenthesised value, and the literals they
+    refer to, set aside to be parsed later. While it is parsed it
+    stands in for the TokenSource.
+    """
+
+    __slots__ = ('tokens', 'literals', '_index', '_iter')
+
+    def __init__(self, tokens, literals):
+        self.tokens = tokens
+        self.literals = literals
+        self._index = 0
+        self._iter = None
+
+    @property
+    def current_literal(self):
+        return self.literals.get(self._index) if self.literals else None
+
+    def __iter__(self):
+        return self._iter
+
+    def _tokens(self):
+        for self._index, token in enumerate(self.tokens):
+            yield token
+
+    def parse(self):
+        self._iter = self._tokens() if self.literals else iter(self.tokens)
+        return atom(self, next(self._iter))
+
+
+def _skip_tuple(src, tokens):
+    # Collect the tokens up to the matching ")" without parsing them
+    span = [b'(']
+    append = span.append
+    literals = None
+    depth = 1
+    for token in tokens:
+        append(token)
+        if token == b')':
+            depth -= 1
+            if not depth:
+                return _TokenSpan(span, literals)
+        elif token == b'(':
+            depth += 1
+        elif token[-1] == 125 and (token[:1] == b'{' or token[:2] == b'~{'):   # ends with }
+            if literals is None:
+                literals = {}
+            literals[len(span) - 1] = src.current_literal
+    raise ParseError('Tuple incomplete before "(%s"' % _fmt_tuple(span[1:]))
+
+
+def _convert_lazy(convert, value, normalise_times):
+    if isinstance(value, _TokenSpan):
+        value = value.parse()
+    elif isinstance(value, fused_parser.Deferred):
+        value = _parse_fused(value.records)[0]
+    return convert(value, normalise_times)
+
+
+# The values which repeat across the messages of a folder, shared
+# rather than kept once per message: FETCH item names (keyed by the
+# name as received), FLAGS tuples, and the Address objects and address
+# lists of envelopes (keyed by the parsed tuples they are made from).
+# Each table stops growing at _INTERN_LIMIT entries.
+_INTERN_LIMIT = 65536
+_item_names = {}
+_flag_tuples = {}
+_addresses = {}
+_address_lists = {}
+
+
+def _intern(table, key, make=None):
+    try:
+        return table[key]
+    except KeyError:
+        pass
+    value = key if make is None else make(key)
+    if len(table) < _INTERN_LIMIT:
+        table[key] = value
+    return value
+
+
+def _item_name(name):
+    try:
+        return _item_names[name]
+    except (KeyError, TypeError):
+        pass
+    upper = _intern(_item_names, name.upper())
+    if len(_item_names) < _INTERN_LIMIT:
+        _item_names[name] = upper
+    return upper
+
+
+def _intern_flags(flags):
+    if type(flags) is not tuple:
+        return flags
+    try:
+        return _intern(_flag_tuples, flags)
+    except TypeError:
+        return flags
+
+
 def _int_or_error(value, error_text):
     try:
         return int(value)
@@ -183,12 +449,8 @@ def _convert_ENVELOPE(envelope_response, normalise_times=True):
     # from, sender, reply_to, to, cc, bcc headers
     addresses = []
     for addr_list in envelope_response[2:8]:
-        addrs = []
         if addr_list:
-            for addr_tuple in addr_list:
-                if addr_tuple:
-                    addrs.append(Address(*addr_tuple))
-            addresses.append(tuple(addrs))
+            addresses.append(_intern(_address_lists, addr_list, _make_addresses))
         else:
             addresses.append(None)
 
@@ -199,13 +461,31 @@ def _convert_ENVELOPE(envelope_response, normalise_times=True):
     )
 
 
+def _make_addresses(addr_list):
+    return tuple(_intern(_addresses, addr_tuple, Address._make)
+                 for addr_tuple in addr_list if addr_tuple)
+
+
+def _convert_BODY(body_response, normalise_times=True):
+    return BodyData.create(body_response)
+
+
+_LAZY_CONVERTERS = {
+    b'INTERNALDATE': _convert_INTERNALDATE,
+    b'ENVELOPE': _convert_ENVELOPE,
+    b'BODY': _convert_BODY,
+    b'BODYSTRUCTURE': _convert_BODY,
+}
+
+
 def atom(src, token):
     if token == b'(':
         return parse_tuple(src)
     elif token == b'NIL':
         return None
-    elif token[:1] == b'{':
-        literal_len = int(token[1:-1])
+    elif token[:1] == b'{' or token[:2] == b'~{':
+        # ~{n} marks a literal8 (RFC 3516), which may contain NULs
+        literal_len = int(token[token.index(b'{') + 1:-1])
         literal_text = src.current_literal
         if literal_text is None:
             raise ParseError('No literal corresponds to %r' % token)
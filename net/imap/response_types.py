@@ -4,10 +4,15 @@
 
 from __future__ import unicode_literals
 
-from collections import namedtuple
+from array import array
+from collections import OrderedDict, namedtuple
 from email.utils import formataddr
+from itertools import islice
+from operator import lt
 
 import six
+from six.moves import filter, filterfalse, map
+from six.moves.collections_abc import MutableMapping
 
 
 class Envelope(namedtuple("Envelope", "date subject from_ sender reply_to to " +
@@ -54,6 +59,25 @@ class Envelope(namedtuple("Envelope", "date subject from_ sender reply_to to " +
     """
 
 
+class ESearchResult(namedtuple("ESearchResult", "min max count all modseq")):
+    """Represents the result of a search made with *returning*
+    options. See :py:meth:`IMAPClient.search`.
+
+    :ivar min: The lowest matching message id.
+    :ivar max: The highest matching message id.
+    :ivar count: The number of matching messages.
+    :ivar all: The matching message ids as a
+      :py:class:`~net.imap.sequence_set.SequenceSet`.
+    :ivar modseq: The highest MODSEQ of the matching messages, if the
+      search involved the MODSEQ criteria.
+
+    Fields for return options which weren't requested are None, as are
+    *min* and *max* when nothing matched.
+
+    See :rfc:`4731` for more details.
+    """
+
+
 class Address(namedtuple("Address", "name route mailbox host")):
     """Represents electronic mail addresses. Used to store addresses in
     :py:class:`Envelope`.
@@ -83,19 +107,377 @@ class Address(namedtuple("Address", "name route mailbox host")):
             to_unicode(self.mailbox) + '@' + to_unicode(self.host)))
 
 
-class SearchIds(list):
+# Message ids are unsigned 32-bit integers (RFC 3501 nz-number)
+_ID_TYPECODE = 'I' if array('I').itemsize >= 4 else 'L'
+
+
+class SearchIds(array):
     """
     Contains a list of message ids as returned by IMAPClient.search().
 
     The *modseq* attribute will contain the MODSEQ value returned by
     the server (only if the SEARCH command sent involved the MODSEQ
     criteria). See :rfc:`4551` for more details.
+
+    The ids are stored as a compact array of unsigned 32-bit integers
+    rather than as a list of Python ints, but a SearchIds can be used
+    like a list: it can be indexed, sliced, iterated, sorted, extended,
+    copied, pickled and compared with lists. Use ``tolist()`` where a
+    real list is needed, e.g. for ``json.dumps()``.
+
+    The ``&``, ``|`` and ``-`` operators return a new SearchIds holding
+    the intersection, union or difference of two sets of ids, in
+    ascending order and without a *modseq*.
     """
 
+    __slots__ = ('modseq',)
+
+    def __new__(cls, *args):
+        return array.__new__(cls, _ID_TYPECODE, *args)
+
     def __init__(self, *args):
-        list.__init__(self, *args)
         self.modseq = None
 
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.__class__(array.__getitem__(self, index))
+        return array.__getitem__(self, index)
+
+    def __add__(self, other):
+        out = self.__class__(self)
+        out.extend(other)
+        return out
+
+    def __radd__(self, other):
+        out = self.__class__(other)
+        out.extend(self)
+        return out
+
+    def __iadd__(self, other):
+        # Any iterable, as for a list, not only another array
+        self.extend(other)
+        return self
+
+    def __mul__(self, count):
+        out = self.__class__(array.__mul__(self, count))
+        out.modseq = self.modseq
+        return out
+
+    __rmul__ = __mul__
+
+    def copy(self):
+        out = self.__class__(self)
+        out.modseq = self.modseq
+        return out
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __reduce__(self):
+        return self.__class__, (self.tolist(),), (None, {'modseq': self.modseq})
+
+    # array defines __reduce_ex__, which pickle would use otherwise
+    def __reduce_ex__(self, protocol):
+        return self.__reduce__()
+
+    def clear(self):
+        del self[:]
+
+    def sort(self, key=None, reverse=False):
+        self[:] = array(_ID_TYPECODE, sorted(self, key=key, reverse=reverse))
+
+    # Each works through the ids in ascending order, so the result is
+    # in order without sorting it. Pairing the ids up one by one in
+    # Python would be several times slower than these passes.
+
+    def __and__(self, other):
+        a, b = _ascending_ids(self), _ascending_ids(other)
+        if len(a) < len(b):
+            a, b = b, a
+        return self.__class__(filter(set(b).__contains__, a))
+
+    def __or__(self, other):
+        a, b = _ascending_ids(self), _ascending_ids(other)
+        merged = a.tolist()
+        merged.extend(filterfalse(set(a).__contains__, b))
+        # Two ascending runs, which sort() merges in a single pass
+        merged.sort()
+        return self.__class__(merged)
+
+    def __sub__(self, other):
+        a, b = _ascending_ids(self), _ascending_ids(other)
+        return self.__class__(filterfalse(set(b).__contains__, a))
+
+    def __eq__(self, other):
+        if isinstance(other, array):
+            return array.__eq__(self, other)
+        if isinstance(other, list):
+            return self.tolist() == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+
+def _ascending_ids(ids):
+    """Return *ids* as an ascending array without duplicates, skipping
+    the sort for ids which are already in order (as servers normally
+    return them).
+    """
+    if not isinstance(ids, array):
+        ids = array(_ID_TYPECODE, ids)
+    if all(map(lt, ids, islice(ids, 1, None))):
+        return ids
+    return array(_ID_TYPECODE, sorted(set(ids)))
+
+
+class FetchRecord(dict):
+    """
+    The data of one message in a FETCH response when it is parsed
+    lazily: a dict keyed by FETCH item, as for a normal fetch.
+
+    Items which are costly to convert (ENVELOPE, BODY, BODYSTRUCTURE
+    and INTERNALDATE) are kept as they were read from the response and
+    only converted when first looked up. The converted value replaces
+    the raw one, so each is converted at most once, and those never
+    looked up are never converted.
+    """
+
+    __slots__ = ()
+
+    def set_lazy(self, key, convert, *args):
+        """Set *key* to ``convert(*args)``, called on first access.
+        """
+        dict.__setitem__(self, key, _Lazy(convert, args))
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if type(value) is _Lazy:
+            value = value.convert(*value.args)
+            dict.__setitem__(self, key, value)
+        return value
+
+    # Defined so dict(), {**record} and dict.update() go through
+    # keys() and __getitem__() instead of copying the raw values
+    def __iter__(self):
+        return dict.__iter__(self)
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        return dict.pop(self, key, *default)
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        # Items of another FetchRecord are taken as they are, still
+        # unconverted
+        if len(args) == 1 and isinstance(args[0], FetchRecord) and not kwargs:
+            for key, value in dict.items(args[0]):
+                dict.__setitem__(self, key, value)
+        else:
+            dict.update(self, *args, **kwargs)
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def values(self):
+        return [self[key] for key in self]
+
+    if six.PY2:
+        iteritems = items
+        itervalues = values
+
+    def copy(self):
+        out = FetchRecord()
+        out.update(self)
+        return out
+
+    def __eq__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+        return dict(self) == dict(other)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    __hash__ = None
+
+    def __reduce__(self):
+        # Pickled converted
+        return FetchRecord, (), None, None, iter(self.items())
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+# The FETCH items a CompactRecord holds in slots, in iteration order
+_COMPACT_SLOTS = OrderedDict([
+    (b'SEQ', '_seq'),
+    (b'UID', '_uid'),
+    (b'FLAGS', '_flags'),
+    (b'MODSEQ', '_modseq'),
+    (b'INTERNALDATE', '_internaldate'),
+    (b'RFC822.SIZE', '_size'),
+    (b'ENVELOPE', '_envelope'),
+    (b'BODYSTRUCTURE', '_bodystructure'),
+])
+
+
+class CompactRecord(MutableMapping):
+    """
+    The data of one message in a FETCH response, keyed by FETCH item
+    as for a normal fetch, in less memory than a dict: SEQ, UID, FLAGS,
+    MODSEQ, INTERNALDATE, RFC822.SIZE, ENVELOPE and BODYSTRUCTURE are
+    held in slots, and any other items in a tuple. Meant for the data of
+    large folders kept in memory.
+
+    Values set with :py:meth:`set_lazy` are converted on first access,
+    as for :py:class:`FetchRecord`. The slotted items are iterated in
+    the order above, followed by the others in the order they were
+    set.
+    """
+
+    # _extra is None or a (key, value, key, value, ...) tuple of the
+    # other items: there are rarely more than a few of them
+    __slots__ = tuple(_COMPACT_SLOTS.values()) + ('_extra',)
+
+    def __init__(self, *args, **kwargs):
+        self._extra = None
+        if args or kwargs:
+            self.update(*args, **kwargs)
+
+    def set_lazy(self, key, convert, *args):
+        """Set *key* to ``convert(*args)``, called on first access.
+        """
+        self._set(key, _Lazy(convert, args))
+
+    def _get(self, key):
+        # The value of *key* as it is stored, maybe still unconverted
+        slot = _COMPACT_SLOTS.get(key)
+        if slot is not None:
+            try:
+                return getattr(self, slot)
+            except AttributeError:
+                raise KeyError(key)
+        return self._extra[self._extra_index(key) + 1]
+
+    def _set(self, key, value):
+        slot = _COMPACT_SLOTS.get(key)
+        if slot is not None:
+            setattr(self, slot, value)
+            return
+        try:
+            i = self._extra_index(key)
+        except KeyError:
+            self._extra = (self._extra or ()) + (key, value)
+        else:
+            self._extra = self._extra[:i + 1] + (value,) + self._extra[i + 2:]
+
+    def _extra_index(self, key):
+        extra = self._extra
+        if extra:
+            for i in range(0, len(extra), 2):
+                if extra[i] == key:
+                    return i
+        raise KeyError(key)
+
+    def __getitem__(self, key):
+        value = self._get(key)
+        if type(value) is _Lazy:
+            value = value.convert(*value.args)
+            self._set(key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        self._set(key, value)
+
+    def __delitem__(self, key):
+        slot = _COMPACT_SLOTS.get(key)
+        if slot is not None:
+            try:
+                delattr(self, slot)
+            except AttributeError:
+                raise KeyError(key)
+        else:
+            i = self._extra_index(key)
+            self._extra = self._extra[:i] + self._extra[i + 2:] or None
+
+    def __contains__(self, key):
+        try:
+            self._get(key)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        for key, slot in six.iteritems(_COMPACT_SLOTS):
+            if hasattr(self, slot):
+                yield key
+        if self._extra:
+            for key in self._extra[::2]:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def update(self, *args, **kwargs):
+        # Items of another CompactRecord or FetchRecord are taken as
+        # they are, still unconverted
+        if len(args) == 1 and not kwargs and isinstance(args[0], CompactRecord):
+            other = args[0]
+            for key in other:
+                self._set(key, other._get(key))
+        elif len(args) == 1 and not kwargs and isinstance(args[0], FetchRecord):
+            for key, value in dict.items(args[0]):
+                self._set(key, value)
+        else:
+            MutableMapping.update(self, *args, **kwargs)
+
+    def copy(self):
+        out = CompactRecord()
+        out.update(self)
+        return out
+
+    def __reduce__(self):
+        # Pickled converted
+        return CompactRecord, (), None, None, iter(self.items())
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class _Lazy(object):
+    __slots__ = ('convert', 'args')
+
+    def __init__(self, convert, args):
+        self.convert = convert
+        self.args = args
+
 
 class BodyData(tuple):
     """
@@ -117,10 +499,65 @@ class BodyData(tuple):
         else:
             return cls(response)
 
+    def __reduce__(self):
+        # Leave the part index out of pickles, it is rebuilt on demand
+        return self.__class__, (tuple(self),)
+
     @property
     def is_multipart(self):
         return isinstance(self[0], list)
 
+    @property
+    def parts(self):
+        """
+        An ordered dict mapping the section number of every leaf part
+        (``'1'``, ``'2.1'``, ...) to its :py:class:`Part`, in message
+        order. Built on first use and cached.
+        """
+        try:
+            return self.__dict__['_parts']
+        except KeyError:
+            parts = self.__dict__['_parts'] = OrderedDict(
+                (part.section, part) for part in _leaf_parts(self, ''))
+            return parts
+
+    def part(self, section):
+        """
+        Return the :py:class:`Part` for *section*, e.g. ``'1.2'``.
+        Raises KeyError if there is no such leaf part.
+        """
+        return self.parts[section]
+
+    def find_text_part(self, subtypes=('plain', 'html')):
+        """
+        Return the first part of the message body proper (section 1 and
+        below) that isn't an attachment and is text of one of
+        *subtypes*, or None.
+        """
+        found = self.__dict__.setdefault('_text', {})
+        if subtypes not in found:
+            found[subtypes] = next(
+                (part for part in self.parts.values()
+                 if part.filename is None and part.type == 'text' and part.subtype in subtypes
+                 and part.section.split('.', 1)[0] == '1'), None)
+        return found[subtypes]
+
+    def attachments(self):
+        """
+        Return the :py:class:`Part` of every attachment (every part with
+        a filename in its Content-Disposition), in message order.
+        """
+        try:
+            return self.__dict__['_attachments']
+        except KeyError:
+            found = self.__dict__['_attachments'] = [
+                part for part in self.parts.values() if part.filename is not None]
+            return found
+
+    @property
+    def encoding(self):
+        return self[5]
+
     @property
     def dtypes(self):
 
@@ -141,4 +578,103 @@ class BodyData(tuple):
 
     @property
     def size(self):
-        return self[6]
\ No newline at end of file
+        return self[6]
+
+
+class Part(object):
+    """
+    A leaf part of a message, as indexed by :py:attr:`BodyData.parts`.
+
+    :ivar section: The section number of the part, e.g. ``'1.2'``.
+    :ivar type: The lower-cased MIME type, e.g. ``'application'``.
+    :ivar subtype: The lower-cased MIME subtype, e.g. ``'pdf'``.
+    :ivar content_type: ``'type/subtype'``, e.g. ``'application/pdf'``.
+    :ivar params: A dict of the Content-Type parameters, with
+      lower-cased names and byte string values.
+    :ivar encoding: The content transfer encoding, lower-cased bytes.
+    :ivar size: The size of the encoded part in bytes.
+    :ivar disposition: The lower-cased Content-Disposition, e.g.
+      ``'attachment'``, or None.
+    :ivar filename: The filename given in the Content-Disposition of an
+      attachment or inline part, or None.
+    :ivar body: The :py:class:`BodyData` of the part.
+    """
+
+    __slots__ = ('section', 'type', 'subtype', 'content_type', 'params', 'encoding',
+                 'size', 'disposition', 'filename', 'body')
+
+    def __init__(self, section, body):
+        self.section = section
+        self.body = body
+        self.type = _lower_str(body[0])
+        self.subtype = _lower_str(body[1])
+        self.content_type = self.type + '/' + self.subtype
+        self.params = _param_dict(body[2])
+        self.encoding = (body[5] or b'').lower()
+        self.size = body[6]
+
+        # The extension data (MD5, disposition, ...) follows the type
+        # specific fields: the line count of text parts, and the
+        # envelope, body and line count of message/rfc822 parts
+        if self.type == 'text':
+            md5 = 8
+        elif self.type == 'message' and self.subtype == 'rfc822':
+            md5 = 10
+        else:
+            md5 = 7
+        disposition = body[md5 + 1] if len(body) > md5 + 1 else None
+        self.disposition = None
+        self.filename = None
+        if isinstance(disposition, tuple) and disposition:
+            self.disposition = _lower_str(disposition[0])
+            if self.disposition in ('attachment', 'inline'):
+                filename = _param_dict(disposition[1] if len(disposition) > 1 else None).get('filename')
+                if filename is not None:
+                    self.filename = filename.decode('utf8')
+
+    @property
+    def charset(self):
+        charset = self.params.get('charset')
+        return charset.decode('ascii').lower() if charset else None
+
+    def __repr__(self):
+        return 'Part(section=%r, content_type=%r, filename=%r, size=%r)' % (
+            self.section, self.content_type, self.filename, self.size)
+
+
+def _leaf_parts(body, section):
+    if not body.is_multipart:
+        yield Part(section or '1', body)
+        return
+    for n, child in enumerate(body[0], 1):
+        child_section = '%s.%d' % (section, n) if section else str(n)
+        if child.is_multipart:
+            for part in _leaf_parts(child, child_section):
+                yield part
+        else:
+            yield Part(child_section, child)
+
+
+# MIME types, encodings and parameter names come from a small set, so
+# their lower-cased forms are kept rather than recomputed for each part
+_lowered = {}
+
+
+def _lower_str(value):
+    try:
+        return _lowered[value]
+    except KeyError:
+        pass
+    lowered = value
+    if isinstance(lowered, six.binary_type):
+        lowered = lowered.decode('ascii', 'replace')
+    lowered = (lowered or '').lower()
+    if len(_lowered) < 1024:
+        _lowered[value] = lowered
+    return lowered
+
+
+def _param_dict(params):
+    if not params:
+        return {}
+    return {_lower_str(params[i]): params[i + 1] for i in range(0, len(params) - 1, 2)}
@@ -0,0 +1,209 @@
+# coding=utf-8
+"""
+IMAP sequence sets (see :rfc:`3501#section-9`, ``sequence-set``).
+
+A SequenceSet holds message ids as sorted, non-overlapping ranges so
+that large contiguous runs of ids cost one range instead of one
+Python int each, both in memory and on the wire.
+"""
+
+from __future__ import unicode_literals
+
+from bisect import bisect_right
+
+from six import binary_type, PY3
+
+__all__ = ['SequenceSet']
+
+
+class SequenceSet(object):
+    """An immutable set of message ids.
+
+    *ids* may be any iterable of integers (in any order, duplicates
+    allowed) or another SequenceSet. Use :py:meth:`parse` to build a
+    SequenceSet from its IMAP representation::
+
+        >>> s = SequenceSet([5, 1, 2, 3, 3, 9, 10])
+        >>> bytes(s)
+        b'1:3,5,9:10'
+        >>> SequenceSet.parse(b'1:3,5') | SequenceSet([4])
+        SequenceSet('1:5')
+
+    Iterating yields the ids in ascending order. The ``|``, ``&`` and
+    ``-`` operators work range by range so their cost depends on the
+    number of ranges rather than the number of ids.
+    """
+
+    __slots__ = ('_ranges',)
+
+    def __init__(self, ids=()):
+        if isinstance(ids, SequenceSet):
+            self._ranges = ids._ranges
+            return
+        ranges = []
+        start = end = None
+        for i in sorted(set(ids)):
+            if end is not None and i == end + 1:
+                end = i
+                continue
+            if end is not None:
+                ranges.append((start, end))
+            start = end = i
+        if end is not None:
+            ranges.append((start, end))
+        self._ranges = ranges
+
+    @classmethod
+    def from_ranges(cls, ranges):
+        """Create a SequenceSet from an iterable of inclusive
+        ``(start, end)`` pairs which may overlap or be unordered.
+        """
+        out = cls()
+        out._ranges = _collapse(sorted((min(r), max(r)) for r in ranges))
+        return out
+
+    @classmethod
+    def parse(cls, text):
+        """Parse an IMAP sequence set such as ``b'1:3,5,9:10'``.
+
+        Ranges may be given in either order (``5:3``). ``*`` is not
+        supported because its meaning depends on the mailbox; a
+        ValueError is raised for it and for any other malformed input.
+        """
+        if isinstance(text, binary_type):
+            text = text.decode('ascii')
+        ranges = []
+        for part in text.split(','):
+            start, _, end = part.partition(':')
+            try:
+                start = int(start)
+                end = int(end) if end else start
+            except ValueError:
+                raise ValueError('invalid sequence set: %r' % text)
+            if start <= 0 or end <= 0:
+                raise ValueError('invalid sequence set: %r' % text)
+            ranges.append((start, end))
+        return cls.from_ranges(ranges)
+
+    @property
+    def ranges(self):
+        """The inclusive ``(start, end)`` ranges making up the set.
+        """
+        return list(self._ranges)
+
+    def parts(self):
+        """Return the encoded ranges as a list of bytes, for example
+        ``[b'1:3', b'5']``.
+        """
+        return [_encode_range(start, end) for start, end in self._ranges]
+
+    def to_bytes(self):
+        return b','.join(self.parts())
+
+    def union(self, other):
+        return self.from_ranges(self._ranges + _as_set(other)._ranges)
+
+    def intersection(self, other):
+        a = self._ranges
+        b = _as_set(other)._ranges
+        out = []
+        i = j = 0
+        while i < len(a) and j < len(b):
+            start = max(a[i][0], b[j][0])
+            end = min(a[i][1], b[j][1])
+            if start <= end:
+                out.append((start, end))
+            if a[i][1] < b[j][1]:
+                i += 1
+            else:
+                j += 1
+        return self._new(out)
+
+    def difference(self, other):
+        b = _as_set(other)._ranges
+        out = []
+        j = 0
+        for start, end in self._ranges:
+            while j < len(b) and b[j][1] < start:
+                j += 1
+            k = j
+            while k < len(b) and b[k][0] <= end:
+                if b[k][0] > start:
+                    out.append((start, b[k][0] - 1))
+                start = b[k][1] + 1
+                k += 1
+            if start <= end:
+                out.append((start, end))
+        return self._new(out)
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+
+    def _new(self, ranges):
+        out = self.__class__()
+        out._ranges = ranges
+        return out
+
+    def __iter__(self):
+        for start, end in self._ranges:
+            for i in range(start, end + 1):
+                yield i
+
+    def __len__(self):
+        return sum(end - start + 1 for start, end in self._ranges)
+
+    def __bool__(self):
+        return bool(self._ranges)
+
+    __nonzero__ = __bool__
+
+    def __contains__(self, i):
+        pos = bisect_right(self._ranges, (i, float('inf'))) - 1
+        return pos >= 0 and self._ranges[pos][0] <= i <= self._ranges[pos][1]
+
+    def __eq__(self, other):
+        if isinstance(other, SequenceSet):
+            return self._ranges == other._ranges
+        return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, SequenceSet):
+            return self._ranges != other._ranges
+        return NotImplemented
+
+    __hash__ = None
+
+    if PY3:
+        __bytes__ = to_bytes
+
+        def __str__(self):
+            return self.to_bytes().decode('ascii')
+    else:
+        __str__ = to_bytes
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.to_bytes().decode('ascii'))
+
+
+def _as_set(other):
+    if isinstance(other, SequenceSet):
+        return other
+    return SequenceSet(other)
+
+
+def _collapse(ranges):
+    out = []
+    for start, end in ranges:
+        if out and start <= out[-1][1] + 1:
+            if end > out[-1][1]:
+                out[-1] = (out[-1][0], end)
+        else:
+            out.append((start, end))
+    return out
+
+
+def _encode_range(start, end):
+    if start == end:
+        return str(start).encode('ascii')
+    return ('%d:%d' % (start, end)).encode('ascii')
@@ -0,0 +1,225 @@
+# coding=utf-8
+"""
+Logged in IMAP connections kept open from one use to the next.
+
+Connecting to an IMAP server costs a TCP handshake, a TLS handshake,
+LOGIN and whatever is set up afterwards (ENABLE, SELECT) before the
+first real command. A :py:class:`Session` keeps its connection open
+between uses, so an account checked every minute pays for that once::
+
+    sessions = SessionManager(timeout=60)
+    session = sessions.get('imap.example.com', user, password)
+    session.run(lambda client: client.select_folder('INBOX'))
+    ...
+    sessions.close()
+
+A connection unused for a while is checked with NOOP before it is
+handed out. A connection found dead, or lost with an
+:py:exc:`~net.imap.imapclient.IMAPClient.AbortError`, is replaced by a
+new one that selects the folder the old one had selected. New
+connections resume the TLS session of the previous one where the
+server allows it, which saves the full handshake.
+"""
+
+from __future__ import unicode_literals
+
+import socket
+import threading
+import time
+
+from . import tls
+from .imapclient import IMAPClient
+
+__all__ = ['Session', 'SessionManager']
+
+
+class Session(object):
+    """A logged in connection to *host* for *username*, (re)opened as
+    needed. *ssl*, *port* and *client_args* are passed on to
+    :py:class:`~net.imap.imapclient.IMAPClient`. The same *ssl_context*
+    (a default one if not given) is used for every connection, as TLS
+    sessions can only be resumed with the context they were made with.
+
+    *on_connect* is called with each new client once it is logged in,
+    before any folder is selected again, and what it returns is kept as
+    :py:attr:`state`. Connections unused for more than *check_after*
+    seconds are checked with NOOP first.
+
+    :py:attr:`connects` counts the connections made and
+    :py:attr:`resumed` those that resumed a TLS session.
+
+    A session is used by one thread at a time.
+    """
+
+    def __init__(self, host, username, password, ssl=True, port=None, ssl_context=None,
+                 check_after=30, on_connect=None, **client_args):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.ssl = ssl
+        self.port = port
+        if ssl and ssl_context is None:
+            ssl_context = tls.create_default_context()
+        self.ssl_context = ssl_context
+        self.check_after = check_after
+        self.on_connect = on_connect
+        self.client_args = client_args
+        self.state = None
+        self.connects = 0
+        self.resumed = 0
+        self._lock = threading.RLock()
+        self._client = None
+        self._last_used = 0
+        self._tls_session = None
+        # The (folder, select info) of the last connection lost
+        self._reselect = None
+
+    @property
+    def client(self):
+        """The logged in :py:class:`~net.imap.imapclient.IMAPClient`,
+        connecting first if there is no usable connection.
+        """
+        with self._lock:
+            client = self._client
+            if client is not None and time.monotonic() - self._last_used > self.check_after:
+                if not _alive(client):
+                    self._drop()
+                    client = None
+            if client is None:
+                client = self._client = self._connect()
+            self._last_used = time.monotonic()
+            return client
+
+    def run(self, func, retries=1):
+        """Return ``func(client)``. If the connection is lost on the
+        way it is replaced and *func* called again, up to *retries*
+        times, so *func* should be safe to repeat.
+
+        The connection is kept if *func* raises
+        :py:exc:`~net.imap.imapclient.IMAPClient.Error` (the server
+        refused a command), and dropped for any other exception as it
+        may be left in the middle of a command.
+        """
+        with self._lock:
+            while True:
+                client = self.client
+                try:
+                    result = func(client)
+                except (IMAPClient.AbortError, socket.error):
+                    self._drop()
+                    if retries <= 0:
+                        raise
+                    retries -= 1
+                    continue
+                except IMAPClient.Error:
+                    self._last_used = time.monotonic()
+                    raise
+                except BaseException:
+                    self._drop()
+                    raise
+                self._last_used = time.monotonic()
+                return result
+
+    def close(self):
+        """Log out, if connected.
+        """
+        with self._lock:
+            client, self._client = self._client, None
+            self._reselect = None
+            self.state = None
+        if client is not None:
+            try:
+                client.logout()
+            except (IMAPClient.Error, socket.error):
+                _shutdown(client)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _connect(self):
+        client = IMAPClient(self.host, self.port, ssl=self.ssl, ssl_context=self.ssl_context,
+                            ssl_session=self._tls_session, **self.client_args)
+        try:
+            client.login(self.username, self.password)
+            if self.ssl:
+                if getattr(client._sock, 'session_reused', False):
+                    self.resumed += 1
+                # Taken after the first exchange, as TLS 1.3 servers
+                # send their session tickets after the handshake
+                self._tls_session = client.ssl_session or self._tls_session
+            self.state = self.on_connect(client) if self.on_connect else None
+            if self._reselect is not None:
+                folder, info = self._reselect
+                client.select_folder(folder, readonly=not info.get(b'READ-WRITE', True))
+                self._reselect = None
+        except BaseException:
+            _shutdown(client)
+            raise
+        self.connects += 1
+        return client
+
+    def _drop(self):
+        client, self._client = self._client, None
+        if client is not None:
+            self._reselect = client._selected or self._reselect
+            _shutdown(client)
+
+
+class SessionManager(object):
+    """The :py:class:`Session` of each account, created on first use
+    with *defaults* as the keyword arguments. Safe to share between
+    threads.
+    """
+
+    def __init__(self, **defaults):
+        self.defaults = defaults
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def get(self, host, username, password, **kwargs):
+        """The session for *username* at *host*, created with
+        *kwargs* on top of the defaults if there isn't one. A session
+        with an old *password* is closed and replaced.
+        """
+        key = (host, username)
+        with self._lock:
+            old = self._sessions.get(key)
+            if old is not None and old.password == password:
+                return old
+            args = dict(self.defaults, **kwargs)
+            session = self._sessions[key] = Session(host, username, password, **args)
+        if old is not None:
+            old.close()
+        return session
+
+    def close(self):
+        """Log out of every session.
+        """
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def _alive(client):
+    try:
+        client.noop()
+        return True
+    except (IMAPClient.Error, socket.error):
+        return False
+
+
+def _shutdown(client):
+    try:
+        client.shutdown()
+    except (IMAPClient.Error, socket.error):
+        pass
@@ -0,0 +1,206 @@
+# coding=utf-8
+"""
+Incremental folder synchronisation using CONDSTORE and QRESYNC
+(:rfc:`7162`).
+
+After a first full pass, each sync asks the server only for what has
+changed since the HIGHESTMODSEQ seen last time: the flags of changed
+messages, new messages and (with QRESYNC) the UIDs of expunged
+messages. The cost of a sync therefore depends on the size of the
+change rather than the size of the folder::
+
+    client.login(user, password)
+    sync = MailboxSync(client, SyncStateStore('sync_state.json'), user)
+    changes = sync.sync('INBOX')
+    for uid, flags in changes.flags.items():
+        ...
+
+Servers without CONDSTORE are supported too, but every sync is then a
+full one.
+"""
+
+from __future__ import unicode_literals
+
+import json
+import os
+import threading
+from collections import namedtuple
+
+from six import iteritems
+
+from .sequence_set import SequenceSet
+from .util import to_bytes
+
+__all__ = ['FolderState', 'SyncResult', 'SyncStateStore', 'MailboxSync']
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+class FolderState(namedtuple('FolderState', 'uidvalidity highestmodseq uidnext uids')):
+    """What was known about a folder at the end of a sync.
+
+    :ivar uidvalidity: The folder's UIDVALIDITY.
+    :ivar highestmodseq: The folder's HIGHESTMODSEQ, or None if the
+      server doesn't support CONDSTORE.
+    :ivar uidnext: The folder's UIDNEXT.
+    :ivar uids: The UIDs in the folder as a
+      :py:class:`~net.imap.sequence_set.SequenceSet`.
+    """
+
+
+class SyncResult(namedtuple('SyncResult', 'flags new vanished reset state')):
+    """The changes found by :py:meth:`MailboxSync.sync`.
+
+    :ivar flags: A dict mapping the UID of each new or changed message
+      to its flags.
+    :ivar new: The UIDs of new messages as a SequenceSet.
+    :ivar vanished: The UIDs of expunged messages as a SequenceSet.
+    :ivar reset: True if there was no usable state to sync from (the
+      first sync, or UIDVALIDITY changed). *flags* then covers every
+      message in the folder and anything cached about the folder
+      should be thrown away.
+    :ivar state: The :py:class:`FolderState` to record once the changes
+      have been handled.
+    """
+
+
+class SyncStateStore(object):
+    """Keeps the :py:class:`FolderState` of each account and folder
+    in a JSON file at *path*, or only in memory if *path* is None.
+
+    A store can be shared by threads syncing different accounts.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._states = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self._states = json.load(f)
+
+    def get(self, account, folder):
+        with self._lock:
+            raw = self._states.get(account, {}).get(folder)
+        if raw is None:
+            return None
+        uids = raw['uids']
+        return FolderState(
+            uidvalidity=raw['uidvalidity'],
+            highestmodseq=raw['highestmodseq'],
+            uidnext=raw['uidnext'],
+            uids=SequenceSet.parse(uids) if uids else SequenceSet(),
+        )
+
+    def put(self, account, folder, state):
+        raw = {
+            'uidvalidity': state.uidvalidity,
+            'highestmodseq': state.highestmodseq,
+            'uidnext': state.uidnext,
+            'uids': str(state.uids),
+        }
+        with self._lock:
+            self._states.setdefault(account, {})[folder] = raw
+            if self.path:
+                tmp = self.path + '.tmp'
+                with open(tmp, 'w') as f:
+                    json.dump(self._states, f)
+                _replace(tmp, self.path)
+
+
+class MailboxSync(object):
+    """Synchronises the folders of one *account* through *client*,
+    recording progress in *store* (a :py:class:`SyncStateStore`).
+
+    *client* must be logged in, use UIDs and not have a folder
+    selected yet, as QRESYNC and CONDSTORE are enabled on creation.
+    """
+
+    def __init__(self, client, store, account):
+        if not client.use_uid:
+            raise ValueError('MailboxSync requires a client with use_uid set')
+        self.client = client
+        self.store = store
+        self.account = account
+
+        wanted = [c for c in ('QRESYNC', 'CONDSTORE') if client.has_capability(c)]
+        enabled = []
+        if wanted and client.has_capability('ENABLE'):
+            enabled = client.enable(*wanted)
+        self.qresync = b'QRESYNC' in enabled
+
+    def sync(self, folder, readonly=False, commit=True):
+        """Select *folder* and return a :py:class:`SyncResult` with
+        the changes since the last sync.
+
+        With *commit* set to False the new state isn't recorded until
+        :py:meth:`commit` is called, so a crash while handling the
+        changes means they are reported again by the next sync.
+        """
+        info = self.client.select_folder(folder, readonly)
+        old = self.store.get(self.account, folder)
+        highest = info.get(b'HIGHESTMODSEQ')
+
+        if (old is None or highest is None or old.highestmodseq is None or
+                old.uidvalidity != info.get(b'UIDVALIDITY')):
+            result = self._full_sync(info)
+        elif (highest == old.highestmodseq and info[b'EXISTS'] == len(old.uids) and
+              info.get(b'UIDNEXT') == old.uidnext):
+            result = SyncResult({}, SequenceSet(), SequenceSet(), False, old)
+        else:
+            result = self._changed_since(info, old)
+
+        if commit:
+            self.commit(folder, result)
+        return result
+
+    def commit(self, folder, result):
+        """Record the state from *result*, a :py:class:`SyncResult`
+        returned by ``sync(folder, commit=False)``.
+        """
+        self.store.put(self.account, folder, result.state)
+
+    def _full_sync(self, info):
+        flags = {}
+        if info[b'EXISTS']:
+            flags = self._fetch_flags()
+        uids = SequenceSet(flags)
+        return SyncResult(flags, uids, SequenceSet(), True, self._state(info, uids))
+
+    def _changed_since(self, info, old):
+        modifiers = ['CHANGEDSINCE %d' % old.highestmodseq]
+        if self.qresync:
+            modifiers.append('VANISHED')
+        flags = self._fetch_flags(modifiers)
+        vanished = self._pop_vanished()
+
+        changed = SequenceSet(flags)
+        uids = (old.uids - vanished) | changed
+        if len(uids) != info[b'EXISTS']:
+            # Messages were expunged without VANISHED telling us which
+            current = self.client.search('ALL', returning=['ALL']).all
+            vanished = vanished | (uids - current)
+            uids = current
+        new = (changed - old.uids) & uids
+        return SyncResult(flags, new, vanished & old.uids, False, self._state(info, uids))
+
+    def _fetch_flags(self, modifiers=None):
+        response = self.client.fetch('1:*', ['FLAGS'], modifiers)
+        return dict((uid, data[b'FLAGS']) for uid, data in iteritems(response))
+
+    def _pop_vanished(self):
+        # FETCH ... (VANISHED) leaves "* VANISHED (EARLIER) 41,43:116"
+        # responses with the rest of imaplib's untagged responses.
+        vanished = SequenceSet()
+        for data in self.client._imap.untagged_responses.pop('VANISHED', []):
+            id_set = to_bytes(data).split()[-1]
+            vanished = vanished | SequenceSet.parse(id_set)
+        return vanished
+
+    def _state(self, info, uids):
+        return FolderState(
+            uidvalidity=info.get(b'UIDVALIDITY'),
+            highestmodseq=info.get(b'HIGHESTMODSEQ'),
+            uidnext=info.get(b'UIDNEXT'),
+            uids=uids,
+        )
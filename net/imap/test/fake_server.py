@@ -0,0 +1,408 @@
+# coding=utf-8
+"""
+A minimal in-process IMAP server for tests and benchmarks.
+
+It knows just enough of the protocol to drive IMAPClient through
+LOGIN, ENABLE, LIST, SELECT, EXAMINE, IDLE, APPEND, SEARCH (including
+ESEARCH's RETURN options), FETCH (of FLAGS, UID, MODSEQ, RFC822.SIZE and ENVELOPE,
+including CONDSTORE/QRESYNC's CHANGEDSINCE and VANISHED), STORE and
+COPY against a mailbox of *message_count* messages where each UID
+equals its sequence number. deliver() and expunge() change the mailbox
+behind the client's back. LIST returns every name (bytes, as sent)
+in *folders*, whatever the pattern.
+
+Messages with an entry in *bodies* (UID -> (BODYSTRUCTURE text, dict
+of section number -> section contents)) can also have their
+BODYSTRUCTURE and BODY[n] sections fetched, including partial
+BODY[n]<offset.length> fetches. Sections with an entry in *binary*
+(UID -> dict of section number -> decoded contents) can be fetched
+with BINARY[n] and BINARY.SIZE[n] once BINARY is added to
+*capabilities*; other sections are refused with UNKNOWN-CTE.
+
+Connections are wrapped with *ssl_context* (a server side context) if
+it is given. drop_connections() closes every client connection, as a
+server does to clients idle for too long.
+
+Responses to a command are delayed by *latency* seconds after the
+command arrives, without holding up the reading of the commands that
+follow it. This mimics the round trip of a real network connection,
+so pipelined commands overlap just like they would against a remote
+server.
+"""
+
+from __future__ import unicode_literals
+
+import re
+import socket
+import ssl
+import threading
+import time
+
+from six.moves import queue
+
+from ..sequence_set import SequenceSet
+
+_LITERAL_RE = re.compile(br'\{(\d+)\}\r\n$')
+_ENVELOPE = (
+    b'ENVELOPE ("Tue, 16 Mar 2010 16:45:32 +0000" "Message %d" '
+    b'(("Bob Smith" NIL "bob" "smith.com")) (("Bob Smith" NIL "bob" "smith.com")) '
+    b'(("Bob Smith" NIL "bob" "smith.com")) ((NIL NIL "foo" "foo.com")) '
+    b'NIL NIL NIL "<1234.5678@smith.com>")'
+)
+_FETCH_RE = re.compile(br'(\S+) (\([^)]*\)|\S+)(?: \(([^)]*)\))?$')
+_SECTION_RE = re.compile(br'BODY(?:\.PEEK)?\[([\d.]*)\](?:<(\d+)\.(\d+)>)?$')
+_BINARY_RE = re.compile(br'BINARY(\.PEEK|\.SIZE)?\[([\d.]*)\](?:<(\d+)\.(\d+)>)?$')
+_FETCH_ITEMS = (b'FLAGS', b'UID', b'MODSEQ', b'RFC822.SIZE', b'ENVELOPE', b'BODYSTRUCTURE')
+
+
+class _Refused(Exception):
+    """Raised by command handlers to answer NO.
+    """
+
+
+def expand_id_set(id_set, largest):
+    """Return the message ids in an IMAP sequence set as a list.
+    """
+    ids = []
+    for part in id_set.split(b','):
+        if b':' in part:
+            start, end = part.split(b':')
+            start = largest if start == b'*' else int(start)
+            end = largest if end == b'*' else int(end)
+            if start > end:
+                start, end = end, start
+            ids.extend(range(start, end + 1))
+        elif part == b'*':
+            ids.append(largest)
+        else:
+            ids.append(int(part))
+    return ids
+
+
+class FakeIMAPServer(object):
+
+    capabilities = b'IMAP4rev1 UIDPLUS IDLE ESEARCH ENABLE CONDSTORE QRESYNC'
+
+    def __init__(self, message_count=100, latency=0.0, ssl_context=None):
+        self.message_count = message_count
+        self.latency = latency
+        self.ssl_context = ssl_context
+        self.connections = 0
+        self.tls_resumed = 0
+        self._conns = []
+        self.flags = {}
+        self.uidvalidity = 1
+        self.highest_modseq = 1
+        self.modseqs = {}
+        self.expunged = {}
+        self.commands = []
+        self.appended = []
+        self.bodies = {}
+        self.binary = {}
+        self.folders = [b'INBOX']
+        self._idlers = []
+        self._local = threading.local()
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(('127.0.0.1', 0))
+        self._listener.listen(128)
+        self.host, self.port = self._listener.getsockname()
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._listener.close()
+
+    def drop_connections(self):
+        conns, self._conns = self._conns, []
+        for conn in conns:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except (socket.error, OSError):
+                pass
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._listener.accept()
+            except (socket.error, OSError):
+                return
+            self.connections += 1
+            handler = threading.Thread(target=self._handle, args=(conn,))
+            handler.daemon = True
+            handler.start()
+
+    def _handle(self, conn):
+        if self.ssl_context is not None:
+            try:
+                conn = self.ssl_context.wrap_socket(conn, server_side=True)
+            except (ssl.SSLError, OSError):
+                conn.close()
+                return
+            if conn.session_reused:
+                self.tls_resumed += 1
+        self._conns.append(conn)
+        rfile = conn.makefile('rb')
+        pending = queue.Queue()
+        writer = threading.Thread(target=self._write_responses, args=(conn, pending))
+        writer.daemon = True
+        writer.start()
+
+        pending.put((0, [b'* OK fake IMAP server ready']))
+        try:
+            while True:
+                line = self._read_command(rfile, conn)
+                if line is None:
+                    break
+                self.commands.append(line)
+                if line.split(b' ')[1:2] == [b'IDLE']:
+                    self._idle(line.split(b' ')[0], rfile, pending)
+                    continue
+                responses = self._dispatch(line)
+                pending.put((time.time() + self.latency, responses))
+                if line.split(b' ')[1:2] == [b'LOGOUT']:
+                    break
+        finally:
+            pending.put(None)
+            writer.join()
+            rfile.close()
+            conn.close()
+
+    def _read_command(self, rfile, conn):
+        line = rfile.readline()
+        if not line:
+            return None
+        while True:
+            m = _LITERAL_RE.search(line)
+            if not m:
+                return line.rstrip(b'\r\n')
+            conn.sendall(b'+ go ahead\r\n')
+            literal = rfile.read(int(m.group(1)))
+            line = line[:m.start()] + literal + rfile.readline()
+
+    def _idle(self, tag, rfile, pending):
+        pending.put((0, [b'+ idling']))
+        self._idlers.append(pending)
+        try:
+            done = rfile.readline()
+        finally:
+            self._idlers.remove(pending)
+        self.commands.append(done.rstrip(b'\r\n'))
+        pending.put((0, [tag + b' OK IDLE terminated']))
+
+    def _write_responses(self, conn, pending):
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            due, responses = item
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            conn.sendall(b''.join(r + b'\r\n' for r in responses))
+
+    def _dispatch(self, line):
+        tag, _, rest = line.partition(b' ')
+        command, _, args = rest.partition(b' ')
+        command = command.upper()
+        uid = command == b'UID'
+        if uid:
+            command, _, args = args.partition(b' ')
+            command = command.upper()
+        self._local.tag = tag
+        handler = getattr(self, '_do_' + command.decode('ascii').lower(), None)
+        if handler is None:
+            return [tag + b' BAD unknown command']
+        try:
+            untagged = handler(args, uid)
+        except ValueError as err:
+            return [tag + b' BAD ' + str(err).encode('ascii')]
+        except _Refused as err:
+            return [tag + b' NO ' + str(err).encode('ascii')]
+        return [b'* ' + r for r in untagged] + [tag + b' OK ' + command + b' completed']
+
+    def _do_capability(self, args, uid):
+        return [b'CAPABILITY ' + self.capabilities]
+
+    def _do_login(self, args, uid):
+        return []
+
+    def _do_logout(self, args, uid):
+        return [b'BYE logging out']
+
+    def _do_noop(self, args, uid):
+        return []
+
+    def _do_enable(self, args, uid):
+        return [b'ENABLED ' + args]
+
+    def _do_list(self, args, uid):
+        return [b'LIST (\\HasNoChildren) "/" "%s"' % name for name in self.folders]
+
+    def _do_select(self, args, uid):
+        return [
+            b'%d EXISTS' % len(self._ids(b'1:*')),
+            b'0 RECENT',
+            b'FLAGS (\\Seen \\Deleted)',
+            b'OK [UIDVALIDITY %d]' % self.uidvalidity,
+            b'OK [UIDNEXT %d]' % (self.message_count + 1),
+            b'OK [HIGHESTMODSEQ %d]' % self.highest_modseq,
+        ]
+
+    def _do_examine(self, args, uid):
+        return self._do_select(args, uid)
+
+    def _do_search(self, args, uid):
+        ids = self._ids(b'1:*')
+        if not args.upper().startswith(b'RETURN '):
+            return [b'SEARCH ' + b' '.join(b'%d' % i for i in ids)]
+
+        options = args[len(b'RETURN '):].partition(b')')[0].strip(b'(').upper().split()
+        result = [b'(TAG "%s")' % self._local.tag]
+        if uid:
+            result.append(b'UID')
+        if ids and b'MIN' in options:
+            result.append(b'MIN %d' % ids[0])
+        if ids and b'MAX' in options:
+            result.append(b'MAX %d' % ids[-1])
+        if b'COUNT' in options:
+            result.append(b'COUNT %d' % len(ids))
+        if ids and b'ALL' in options:
+            result.append(b'ALL ' + SequenceSet(ids).to_bytes())
+        return [b'ESEARCH ' + b' '.join(result)]
+
+    def _do_fetch(self, args, uid):
+        m = _FETCH_RE.match(args)
+        if not m:
+            raise ValueError('bad fetch arguments')
+        id_set, items, modifiers = m.groups()
+        items = items.strip(b'()').upper().split()
+        for item in items:
+            if item not in _FETCH_ITEMS and not _SECTION_RE.match(item):
+                m = _BINARY_RE.match(item)
+                if not m:
+                    raise ValueError('unsupported fetch item')
+                for i in self._ids(id_set):
+                    if m.group(2).decode('ascii') not in self.binary.get(i, {}):
+                        raise _Refused('[UNKNOWN-CTE] can\'t decode section')
+
+        changed_since = None
+        vanished = False
+        if modifiers:
+            modifiers = modifiers.upper().split()
+            if b'CHANGEDSINCE' in modifiers:
+                changed_since = int(modifiers[modifiers.index(b'CHANGEDSINCE') + 1])
+            vanished = b'VANISHED' in modifiers
+
+        out = []
+        if vanished:
+            requested = set(expand_id_set(id_set, self.message_count))
+            gone = [i for i, modseq in sorted(self.expunged.items())
+                    if i in requested and modseq > changed_since]
+            if gone:
+                out.append(b'VANISHED (EARLIER) ' + SequenceSet(gone).to_bytes())
+        for i in self._ids(id_set):
+            if changed_since is None:
+                out.append(self._fetch_response(i, uid, items))
+            elif self.modseqs.get(i, 1) > changed_since:
+                out.append(self._fetch_response(i, uid, items + [b'MODSEQ']))
+        return out
+
+    def _do_store(self, args, uid):
+        id_set, op, flags = args.split(b' ', 2)
+        flags = tuple(flags.strip(b'()').split())
+        for i in self._ids(id_set):
+            current = self.flags.get(i, ())
+            if op.startswith(b'+'):
+                current = current + tuple(f for f in flags if f not in current)
+            elif op.startswith(b'-'):
+                current = tuple(f for f in current if f not in flags)
+            else:
+                current = flags
+            self.flags[i] = current
+            self.modseqs[i] = self._next_modseq()
+        return [self._fetch_response(i, uid, [b'FLAGS']) for i in self._ids(id_set)]
+
+    def _do_copy(self, args, uid):
+        return []
+
+    def _do_append(self, args, uid):
+        self.appended.append(args)
+        self.deliver()
+        return []
+
+    def _section_response(self, i, item):
+        section, offset, length = _SECTION_RE.match(item).groups()
+        name = b'BODY[' + section + b']'
+        data = self.bodies.get(i, (None, {}))[1].get(section.decode('ascii'))
+        if data is None:
+            return name + b' NIL'
+        if offset is not None:
+            name += b'<' + offset + b'>'
+            data = data[int(offset):int(offset) + int(length)]
+        return name + b' {%d}\r\n' % len(data) + data
+
+    def _binary_response(self, i, item):
+        kind, section, offset, length = _BINARY_RE.match(item).groups()
+        data = self.binary[i][section.decode('ascii')]
+        if kind == b'.SIZE':
+            return b'BINARY.SIZE[' + section + b'] %d' % len(data)
+        name = b'BINARY[' + section + b']'
+        if offset is not None:
+            name += b'<' + offset + b'>'
+            data = data[int(offset):int(offset) + int(length)]
+        return name + b' ~{%d}\r\n' % len(data) + data
+
+    def deliver(self, count=1):
+        """Add *count* new messages to the mailbox.
+        """
+        for _ in range(count):
+            self.message_count += 1
+            self.modseqs[self.message_count] = self._next_modseq()
+        for pending in list(self._idlers):
+            pending.put((0, [b'* %d EXISTS' % len(self._ids(b'1:*'))]))
+
+    def expunge(self, ids):
+        """Remove the messages with the UIDs in *ids*.
+        """
+        for i in ids:
+            self.expunged[i] = self._next_modseq()
+
+    def _next_modseq(self):
+        self.highest_modseq += 1
+        return self.highest_modseq
+
+    def _ids(self, id_set):
+        return [i for i in expand_id_set(id_set, self.message_count)
+                if 1 <= i <= self.message_count and i not in self.expunged]
+
+    def _fetch_response(self, i, uid, items):
+        out = []
+        if uid:
+            out.append(b'UID %d' % i)
+        for item in items:
+            if item == b'FLAGS':
+                out.append(b'FLAGS (%s)' % b' '.join(self.flags.get(i, ())))
+            elif item == b'MODSEQ':
+                out.append(b'MODSEQ (%d)' % self.modseqs.get(i, 1))
+            elif item == b'RFC822.SIZE':
+                out.append(b'RFC822.SIZE %d' % (1000 + i))
+            elif item == b'ENVELOPE':
+                out.append(_ENVELOPE % i)
+            elif item == b'BODYSTRUCTURE':
+                out.append(b'BODYSTRUCTURE ' + self.bodies[i][0])
+            elif _SECTION_RE.match(item):
+                out.append(self._section_response(i, item))
+            elif _BINARY_RE.match(item):
+                out.append(self._binary_response(i, item))
+        return b'%d FETCH (%s)' % (i, b' '.join(out))
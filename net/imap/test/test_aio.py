@@ -0,0 +1,117 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+import asyncio
+
+from imapclient.aio import AsyncIMAPClient
+from imapclient.sequence_set import SequenceSet
+from imapclient.test.util import unittest
+
+from .fake_server import FakeIMAPServer
+
+
+class TestAsyncIMAPClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeIMAPServer(5)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def run_with_client(self, func):
+        async def run():
+            async with AsyncIMAPClient(self.server.host, self.server.port) as client:
+                await client.login('user', 'pass')
+                await client.select_folder('INBOX')
+                return await func(client)
+        return asyncio.run(run())
+
+    def test_select(self):
+        async def select(client):
+            return await client.select_folder('INBOX')
+
+        info = self.run_with_client(select)
+
+        self.assertEqual(info[b'EXISTS'], 5)
+        self.assertEqual(info[b'UIDVALIDITY'], 1)
+        self.assertEqual(info[b'FLAGS'], (b'\\Seen', b'\\Deleted'))
+
+    def test_capabilities(self):
+        async def capabilities(client):
+            return await client.capabilities()
+
+        self.assertIn(b'IDLE', self.run_with_client(capabilities))
+
+    def test_no_capability_response(self):
+        self.server._do_capability = lambda args, uid: []
+
+        async def capabilities(client):
+            with self.assertRaises(client.Error):
+                await client.capabilities()
+
+        self.run_with_client(capabilities)
+
+    def test_search(self):
+        async def search(client):
+            return (await client.search(['ALL']),
+                    await client.search(['ALL'], returning=['COUNT', 'ALL']))
+
+        ids, summary = self.run_with_client(search)
+
+        self.assertEqual(ids, [1, 2, 3, 4, 5])
+        self.assertEqual(summary.count, 5)
+        self.assertEqual(summary.all, SequenceSet.parse('1:5'))
+        self.assertIn(b'UID SEARCH ALL', self.server.commands[-4])
+
+    def test_fetch_and_store(self):
+        async def fetch_and_store(client):
+            stored = await client.add_flags([2, 3], ['foo'])
+            return stored, await client.fetch([2, 3], ['FLAGS', 'RFC822.SIZE'])
+
+        stored, fetched = self.run_with_client(fetch_and_store)
+
+        self.assertEqual(stored, {2: (b'foo',), 3: (b'foo',)})
+        self.assertEqual(fetched, {
+            2: {b'SEQ': 2, b'FLAGS': (b'foo',), b'RFC822.SIZE': 1002},
+            3: {b'SEQ': 3, b'FLAGS': (b'foo',), b'RFC822.SIZE': 1003},
+        })
+
+    def test_append_sends_literal(self):
+        async def append(client):
+            return await client.append('INBOX', b'Subject: hi\r\n\r\nbody', flags=['\\Seen'])
+
+        self.run_with_client(append)
+
+        self.assertEqual(self.server.appended, [b'"INBOX" (\\Seen) Subject: hi\r\n\r\nbody'])
+        self.assertEqual(self.server.message_count, 6)
+
+    def test_idle(self):
+        async def idle(client):
+            await client.idle()
+            nothing = await client.idle_check(0.05)
+            self.server.deliver()
+            got = await client.idle_check(5)
+            return nothing, got, await client.idle_done()
+
+        nothing, got, done = self.run_with_client(idle)
+
+        self.assertEqual(nothing, [])
+        self.assertEqual(got, [(6, b'EXISTS')])
+        self.assertEqual(done, (b'IDLE terminated', []))
+
+    def test_failed_command(self):
+        async def bad_fetch(client):
+            await client.fetch([1], ['BOGUS'])
+
+        self.assertRaises(AsyncIMAPClient.Error, self.run_with_client, bad_fetch)
+
+    def test_concurrent_clients(self):
+        async def count(n):
+            async with AsyncIMAPClient(self.server.host, self.server.port) as client:
+                await client.login('user%d' % n, 'pass')
+                await client.select_folder('INBOX')
+                return len(await client.search())
+
+        async def run():
+            return await asyncio.gather(*[count(n) for n in range(10)])
+
+        self.assertEqual(asyncio.run(run()), [5] * 10)
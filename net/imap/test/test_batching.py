@@ -0,0 +1,85 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+from imapclient.imapclient import IMAPClient
+from imapclient.test.util import unittest
+
+from .fake_server import FakeIMAPServer
+
+
+class TestBatching(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeIMAPServer(300)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.client = IMAPClient(self.server.host, self.server.port)
+        self.client.login('user', 'pass')
+        self.client.select_folder('INBOX')
+        self.client.max_id_list_length = 100
+        self.client.pipeline_depth = 3
+        del self.server.commands[:]
+
+    def tearDown(self):
+        self.client.logout()
+
+    def sent(self, command):
+        # Commands sent by the client, without their tags
+        commands = [c.split(b' ', 1)[1] for c in self.server.commands]
+        return [c for c in commands if c.startswith(command)]
+
+    def test_fetch(self):
+        ids = list(range(1, 301, 2))
+
+        out = self.client.fetch(ids, ['FLAGS'])
+
+        self.assertEqual(sorted(out), ids)
+        self.assertEqual(out[251], {b'SEQ': 251, b'FLAGS': ()})
+        batches = self.sent(b'UID FETCH')
+        self.assertGreater(len(batches), 1)
+        self.assertTrue(all(len(c) < 150 for c in batches))
+
+    def test_fetch_without_limit(self):
+        self.client.max_id_list_length = None
+
+        out = self.client.fetch(list(range(1, 301, 2)), ['FLAGS'])
+
+        self.assertEqual(len(out), 150)
+        self.assertEqual(len(self.sent(b'UID FETCH')), 1)
+
+    def test_store(self):
+        out = self.client.add_flags(list(range(1, 301, 2)), [b'processed'])
+
+        self.assertEqual(len(out), 150)
+        self.assertEqual(out[123], (b'processed',))
+        self.assertGreater(len(self.sent(b'UID STORE')), 1)
+
+    def test_copy(self):
+        out = self.client.copy(list(range(1, 301, 2)), 'Archive')
+
+        self.assertEqual(out, b'COPY completed')
+        self.assertGreater(len(self.sent(b'UID COPY')), 1)
+
+    def test_ranges_need_no_batching(self):
+        out = self.client.fetch(list(range(1, 301)), ['FLAGS'])
+
+        self.assertEqual(len(out), 300)
+        self.assertEqual(self.sent(b'UID FETCH'), [b'UID FETCH 1:300 (FLAGS)'])
+
+    def test_failure_leaves_connection_usable(self):
+        self.client.pipeline_depth = 10
+        self.client.max_id_list_length = 5
+        self.assertRaises(IMAPClient.Error, self.client.fetch, [1, 2, 3, 4], ['FLAGS', 'BOGUS'])
+        self.assertEqual(self.client._imap.tagged_commands, {})
+        self.assertEqual(self.client.fetch([5], ['FLAGS']), {5: {b'SEQ': 5, b'FLAGS': ()}})
+
+    def test_failure_discards_responses_to_later_batches(self):
+        self.client.pipeline_depth = 10
+        self.client.max_id_list_length = 5
+        ids = list(range(1, 31, 2))
+        for i in ids[1:]:
+            self.server.binary[i] = {'1': b'text'}
+        self.assertRaises(IMAPClient.Error, self.client.fetch, ids, ['BINARY.PEEK[1]'])
+        self.assertGreater(len(self.sent(b'UID FETCH')), 1)
+        self.assertNotIn('FETCH', self.client._imap.untagged_responses)
+        self.assertEqual(self.client.fetch([5], ['FLAGS']), {5: {b'SEQ': 5, b'FLAGS': ()}})
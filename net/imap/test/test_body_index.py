@@ -0,0 +1,84 @@
+# coding=utf-8
+
+from __future__ import unicode_literals
+
+import pickle
+
+from imapclient.response_parser import parse_fetch_response
+from imapclient.response_types import BodyData, Part
+from imapclient.test.util import unittest
+
+
+def bodystructure(text):
+    return parse_fetch_response([b'1 (BODYSTRUCTURE ' + text + b')'])[1][b'BODYSTRUCTURE']
+
+
+# multipart/mixed: an alternative text body, a PDF, an inline text
+# attachment and a forwarded message
+MIXED = bodystructure(
+    b'((("TEXT" "PLAIN" ("CHARSET" "UTF-8") NIL NIL "QUOTED-PRINTABLE" 120 4 NIL NIL NIL NIL)'
+    b'("TEXT" "HTML" ("CHARSET" "UTF-8") NIL NIL "7BIT" 300 8 NIL NIL NIL NIL)'
+    b' "ALTERNATIVE" ("BOUNDARY" "b2") NIL NIL NIL)'
+    b'("APPLICATION" "PDF" ("NAME" "a.pdf") NIL NIL "BASE64" 4000 NIL'
+    b' ("ATTACHMENT" ("FILENAME" "a.pdf")) NIL NIL)'
+    b'("TEXT" "CSV" ("CHARSET" "us-ascii") NIL NIL "7BIT" 50 2 NIL'
+    b' ("inline" ("filename" "b.csv")) NIL NIL)'
+    b'("MESSAGE" "RFC822" NIL NIL NIL "7BIT" 500'
+    b' (NIL "fwd" NIL NIL NIL NIL NIL NIL NIL NIL)'
+    b' ("TEXT" "PLAIN" ("CHARSET" "us-ascii") NIL NIL "7BIT" 10 1 NIL NIL NIL NIL) 20 NIL'
+    b' ("ATTACHMENT" ("FILENAME" "fwd.eml")) NIL NIL)'
+    b' "MIXED" ("BOUNDARY" "b1") NIL NIL NIL)')
+
+
+class TestBodyIndex(unittest.TestCase):
+
+    def test_sections(self):
+        self.assertEqual(list(MIXED.parts), ['1.1', '1.2', '2', '3', '4'])
+        part = MIXED.part('1.2')
+        self.assertIsInstance(part, Part)
+        self.assertEqual(part.content_type, 'text/html')
+        self.assertEqual(part.size, 300)
+        self.assertRaises(KeyError, MIXED.part, '1')
+
+    def test_single_part(self):
+        body = bodystructure(b'("TEXT" "PLAIN" ("CHARSET" "us-ascii") NIL NIL "7BIT" 16 1)')
+        self.assertEqual(list(body.parts), ['1'])
+        self.assertEqual(body.find_text_part().section, '1')
+        self.assertEqual(body.attachments(), [])
+
+    def test_part_fields(self):
+        part = MIXED.part('1.1')
+        self.assertEqual((part.type, part.subtype), ('text', 'plain'))
+        self.assertEqual(part.params, {'charset': b'UTF-8'})
+        self.assertEqual(part.charset, 'utf-8')
+        self.assertEqual(part.encoding, b'quoted-printable')
+        self.assertIsNone(part.disposition)
+        self.assertIsNone(part.filename)
+        self.assertIs(part.body, MIXED[0][0][0][0])
+
+    def test_text_part(self):
+        self.assertEqual(MIXED.find_text_part().section, '1.1')
+        self.assertEqual(MIXED.find_text_part(('html',)).section, '1.2')
+        self.assertIsNone(MIXED.find_text_part(('csv',)))
+
+    def test_attachments(self):
+        # Dispositions follow the line count of text parts and the
+        # encapsulated message of message/rfc822 parts
+        attachments = MIXED.attachments()
+        self.assertEqual([(p.section, p.filename, p.disposition) for p in attachments],
+                         [('2', 'a.pdf', 'attachment'),
+                          ('3', 'b.csv', 'inline'),
+                          ('4', 'fwd.eml', 'attachment')])
+        self.assertEqual(attachments[0].content_type, 'application/pdf')
+
+    def test_cached(self):
+        body = BodyData.create(tuple(MIXED))
+        self.assertIs(body.parts, body.parts)
+        self.assertIs(body.attachments(), body.attachments())
+
+    def test_pickle(self):
+        MIXED.parts
+        body = pickle.loads(pickle.dumps(MIXED, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(body, MIXED)
+        self.assertNotIn('_parts', body.__dict__)
+        self.assertEqual(list(body.parts), list(MIXED.parts))
@@ -0,0 +1,152 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+from imapclient.cache import MessageCache
+from imapclient.fixed_offset import FixedOffset
+from imapclient.imapclient import IMAPClient
+from imapclient.response_types import Envelope
+from imapclient.test.util import unittest
+
+from .fake_server import FakeIMAPServer
+
+
+class TestMessageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = MessageCache(':memory:', 'user')
+        self.addCleanup(self.cache.close)
+
+    def test_round_trip(self):
+        date = datetime(2010, 3, 16, 16, 45, 32, tzinfo=FixedOffset(60))
+        envelope = Envelope(date, b'subject', None, None, None, None, None, None, None, b'<id>')
+        self.cache.put('INBOX', {1: {b'ENVELOPE': envelope, b'RFC822.SIZE': 10, b'SEQ': 1}})
+
+        out = self.cache.get('INBOX', [1, 2], [b'ENVELOPE', b'RFC822.SIZE', b'FLAGS'])
+
+        self.assertEqual(out, {1: {b'ENVELOPE': envelope, b'RFC822.SIZE': 10}})
+        self.assertEqual(out[1][b'ENVELOPE'].date.utcoffset(), date.utcoffset())
+
+    def test_folders_and_accounts_are_separate(self):
+        self.cache.put('INBOX', {1: {b'RFC822.SIZE': 10}})
+        other = MessageCache(':memory:', 'other')
+
+        self.assertEqual(self.cache.get('Sent', [1], [b'RFC822.SIZE']), {})
+        self.assertEqual(other.get('INBOX', [1], [b'RFC822.SIZE']), {})
+
+    def test_uidvalidity_change_drops_folder(self):
+        self.cache.set_folder_state('INBOX', 1, 100)
+        self.cache.put('INBOX', {1: {b'RFC822.SIZE': 10}})
+        self.cache.set_folder_state('INBOX', 1, 200)
+        self.assertEqual(self.cache.folder_state('INBOX'), (1, 200))
+        self.assertTrue(self.cache.get('INBOX', [1], [b'RFC822.SIZE']))
+
+        self.cache.set_folder_state('INBOX', 2, 5)
+
+        self.assertEqual(self.cache.get('INBOX', [1], [b'RFC822.SIZE']), {})
+        self.assertEqual(self.cache.folder_state('INBOX'), (2, 5))
+
+    def test_many_uids(self):
+        self.cache.put('INBOX', dict((i, {b'RFC822.SIZE': i}) for i in range(1, 2001)))
+        self.assertEqual(len(self.cache.get('INBOX', range(1, 3001), [b'RFC822.SIZE'])), 2000)
+
+        self.cache.discard('INBOX', range(1, 1501))
+        self.assertEqual(len(self.cache.get('INBOX', range(1, 3001), [b'RFC822.SIZE'])), 500)
+
+
+class TestCachedFetch(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeIMAPServer(10)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.client = IMAPClient(self.server.host, self.server.port)
+        self.client.login('user', 'pass')
+        self.client.cache = MessageCache(':memory:', 'user')
+        self.client.select_folder('INBOX')
+
+    def sent_since(self, count):
+        return [line.split(b' ', 1)[1] for line in self.server.commands[count:]]
+
+    def test_flags_refreshed_by_changedsince(self):
+        self.client.fetch([1, 2, 3], ['FLAGS'])
+        self.server.flags[2] = (b'foo',)
+        self.server.modseqs[2] = self.server._next_modseq()
+        self.client.select_folder('INBOX')
+        sent = len(self.server.commands)
+
+        out = self.client.fetch([1, 2, 3, 4], ['FLAGS'])
+
+        self.assertEqual(dict((uid, d[b'FLAGS']) for uid, d in out.items()),
+                         {1: (), 2: (b'foo',), 3: (), 4: ()})
+        self.assertEqual(self.sent_since(sent), [
+            b'UID FETCH 1:* (FLAGS) (CHANGEDSINCE 1)',
+            b'UID FETCH 4 (FLAGS)',
+        ])
+
+    def test_no_refresh_when_up_to_date(self):
+        self.client.fetch([1, 2, 3], ['FLAGS'])
+        sent = len(self.server.commands)
+
+        out = self.client.fetch([1, 2, 3], ['FLAGS'])
+
+        self.assertEqual(sorted(out), [1, 2, 3])
+        self.assertEqual(self.sent_since(sent), [])
+
+    def test_stored_flags_cached(self):
+        self.client.fetch([1, 2, 3], ['FLAGS'])
+        self.client.add_flags([2], ['foo'])
+        sent = len(self.server.commands)
+
+        out = self.client.fetch([1, 2, 3], ['FLAGS'])
+
+        self.assertEqual(out[2][b'FLAGS'], (b'foo',))
+        self.assertEqual(self.sent_since(sent), [])
+
+    def test_folder_name_types_share_cache(self):
+        self.client.fetch([1], ['FLAGS', 'RFC822.SIZE'])
+        self.client.select_folder(b'INBOX')
+        sent = len(self.server.commands)
+
+        self.client.fetch([1], ['FLAGS', 'RFC822.SIZE'])
+
+        self.assertEqual(self.sent_since(sent), [])
+        self.assertEqual(self.client._selected[0], b'INBOX')
+
+    def test_uncached_items_always_fetched(self):
+        self.client.fetch([1, 2], ['FLAGS'])
+        sent = len(self.server.commands)
+
+        self.client.fetch([1, 2], ['FLAGS', 'UID'])
+
+        self.assertEqual(self.sent_since(sent)[-1], b'UID FETCH 1:2 (UID)')
+
+    def test_expunged_messages_dropped(self):
+        self.client.fetch([1, 2], ['FLAGS'])
+        self.server.expunge([2])
+
+        self.assertEqual(sorted(self.client.fetch([1, 2], ['FLAGS', 'UID'])), [1])
+
+    def test_flags_not_cached_without_condstore(self):
+        self.client.select_folder('INBOX')
+        del self.client._selected[1][b'HIGHESTMODSEQ']
+        self.client.fetch([1, 2], ['FLAGS'])
+        sent = len(self.server.commands)
+
+        self.client.fetch([1, 2], ['FLAGS'])
+
+        self.assertEqual(self.sent_since(sent), [b'UID FETCH 1:2 (FLAGS)'])
+
+    def test_bypassed_for_sequence_set_strings(self):
+        self.client.fetch('1:2', ['FLAGS'])
+        self.assertEqual(self.client.cache.get('INBOX', [1, 2], [b'FLAGS']), {})
+
+    def test_new_folder_selected(self):
+        self.client.fetch([1], ['FLAGS'])
+        self.client.select_folder('Other')
+        sent = len(self.server.commands)
+
+        self.client.fetch([1], ['FLAGS'])
+
+        self.assertEqual(self.sent_since(sent), [b'UID FETCH 1 (FLAGS)'])
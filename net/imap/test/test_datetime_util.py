@@ -6,12 +6,15 @@ from __future__ import unicode_literals
 
 from datetime import datetime, date
 
-from mock import patch
+from mock import Mock, patch
 
 from ..datetime_util import (
+    _next_dst_change,
+    _system_offset,
     datetime_to_INTERNALDATE,
     datetime_to_native,
     format_criteria_date,
+    parse_datetimes,
     parse_to_datetime,
 )
 from ..fixed_offset import FixedOffset
@@ -61,8 +64,60 @@ class TestParsing(unittest.TestCase):
             datetime(2010, 8, 18, 16, 3, 9, 0, FixedOffset(-120))
         )
 
+    def test_rfc822_with_comment(self):
+        self.check_normalised_and_not(
+            b'Tue, 16 Mar 2010 16:45:32 +0000 (UTC)',
+            datetime(2010, 3, 16, 16, 45, 32, 0, FixedOffset(0))
+        )
+
     def test_invalid(self):
         self.assertRaises(ValueError, parse_to_datetime, b'ABC')
+        self.assertRaises(ValueError, parse_to_datetime, b'31-Feb-2007 17:08:08 +0000')
+
+    def test_offsets_shared(self):
+        first = parse_to_datetime(b' 9-Feb-2007 17:08:08 +0100', normalise=False)
+        second = parse_to_datetime(b'Sun, 24 Mar 2013 22:06:10 +0100', normalise=False)
+        self.assertIs(first.tzinfo, second.tzinfo)
+
+    def test_cached(self):
+        self.assertIs(parse_to_datetime(b' 9-Feb-2007 17:08:08 +0100'),
+                      parse_to_datetime(b' 9-Feb-2007 17:08:08 +0100'))
+
+    def test_column(self):
+        dates = [b' 9-Feb-2007 17:08:08 +0100', b'ABC', None, b' 9-Feb-2007 17:08:08 +0100']
+
+        out = parse_datetimes(dates, normalise=False)
+
+        self.assertEqual(out, [datetime(2007, 2, 9, 17, 8, 8, 0, FixedOffset(60)), None, None, out[0]])
+        native = parse_to_datetime(dates[0])
+        self.assertEqual(parse_datetimes(dates), [native, None, None, native])
+
+
+class TestSystemOffset(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch('imapclient.datetime_util._system', (None, 0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('imapclient.datetime_util.time')
+    def test_next_dst_change(self, time_mock):
+        time_mock.localtime.side_effect = lambda t: Mock(tm_isdst=t >= 5000.5)
+        self.assertTrue(5000.5 <= _next_dst_change(0) <= 5001.5)
+        self.assertEqual(_next_dst_change(10000), 10000 + 86400)
+
+    @patch('imapclient.datetime_util.FixedOffset.for_system')
+    @patch('imapclient.datetime_util.time')
+    def test_refreshed_after_dst_change(self, time_mock, for_system):
+        time_mock.localtime.side_effect = lambda t: Mock(tm_isdst=t >= 100)
+        for_system.side_effect = [FixedOffset(0), FixedOffset(60)]
+
+        offsets = []
+        for now in (0, 50, 99, 150):
+            time_mock.time.return_value = now
+            offsets.append(_system_offset().tzname(None))
+
+        self.assertEqual(offsets, ['+0000', '+0000', '+0000', '+0100'])
 
 
 class TestDatetimeToINTERNALDATE(unittest.TestCase):
@@ -0,0 +1,165 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+import base64
+import io
+import quopri
+import random
+
+from imapclient.download import (Base64Decoder, QuotedPrintableDecoder, decoder_for,
+                                 download_part, download_parts)
+from imapclient.imapclient import IMAPClient
+from imapclient.test.util import unittest
+
+from .fake_server import FakeIMAPServer
+
+CONTENT = bytes(bytearray(random.Random(1).getrandbits(8) for _ in range(10000)))
+TEXT = ('Gr\xfc\xdfe = greetings, ' * 300).encode('latin-1')
+
+
+def pieces(data, seed=2):
+    rnd = random.Random(seed)
+    start = 0
+    while start < len(data):
+        end = start + rnd.randint(1, 100)
+        yield data[start:end]
+        start = end
+
+
+def feed(decoder, data):
+    return b''.join(decoder.decode(piece) for piece in pieces(data)) + decoder.flush()
+
+
+def structure(encoding, size):
+    return ('("application" "octet-stream" NIL NIL NIL "%s" %d NIL '
+            '("attachment" ("filename" "x.bin")) NIL NIL)' % (encoding, size)).encode('ascii')
+
+
+class TestDecoders(unittest.TestCase):
+
+    def test_base64(self):
+        encoded = base64.encodebytes(CONTENT)
+        self.assertEqual(feed(Base64Decoder(), encoded), CONTENT)
+
+    def test_base64_missing_padding(self):
+        self.assertEqual(feed(Base64Decoder(), b'aGk'), b'hi')
+
+    def test_quoted_printable(self):
+        encoded = quopri.encodestring(TEXT).replace(b'\n', b'\r\n')
+        self.assertGreater(encoded.count(b'=\r\n'), 10)
+        self.assertEqual(feed(QuotedPrintableDecoder(), encoded), TEXT.replace(b'\n', b'\r\n'))
+
+    def test_decoder_for(self):
+        self.assertIsInstance(decoder_for(b'BASE64'), Base64Decoder)
+        self.assertIsInstance(decoder_for('quoted-printable'), QuotedPrintableDecoder)
+        self.assertEqual(decoder_for(b'8bit').decode(b'\xff'), b'\xff')
+        self.assertEqual(decoder_for(None).decode(b'x'), b'x')
+
+
+class TestDownload(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeIMAPServer(5)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.client = IMAPClient(self.server.host, self.server.port)
+        self.client.login('user', 'pass')
+        self.client.select_folder('INBOX')
+        self.client.capabilities()
+
+    def tearDown(self):
+        self.client.logout()
+
+    def add(self, msgid, encoding, encoded, size=None):
+        self.server.bodies[msgid] = (structure(encoding, size or len(encoded)), {'1': encoded})
+        return self.client.fetch([msgid], ['BODYSTRUCTURE'])[msgid][b'BODYSTRUCTURE']
+
+    def test_base64_to_file(self):
+        part = self.add(1, 'base64', base64.encodebytes(CONTENT).replace(b'\n', b'\r\n'))
+        del self.server.commands[:]
+        out = io.BytesIO()
+
+        written = download_part(self.client, 1, part, '1', out, chunk_size=1000, window=3)
+
+        self.assertEqual(out.getvalue(), CONTENT)
+        self.assertEqual(written, len(CONTENT))
+        self.assertEqual(len(self.server.commands), 14)
+        self.assertIn(b'UID FETCH 1 (BODY.PEEK[1]<1000.1000>)', self.server.commands[1])
+
+    def test_quoted_printable_to_buffer(self):
+        encoded = quopri.encodestring(TEXT)
+        part = self.add(1, 'quoted-printable', encoded)
+        buf = bytearray(len(TEXT) + 10)
+
+        written = download_part(self.client, 1, part, '1', buf, chunk_size=100)
+
+        self.assertEqual(bytes(buf[:written]), TEXT)
+
+    def test_buffer_too_small(self):
+        part = self.add(1, '8bit', CONTENT)
+        self.assertRaises(ValueError, download_part, self.client, 1, part, '1',
+                          bytearray(100), chunk_size=1000)
+
+    def test_size_understated(self):
+        part = self.add(1, '8bit', CONTENT, size=2000)
+        out = io.BytesIO()
+
+        download_part(self.client, 1, part, '1', out, chunk_size=1000)
+
+        self.assertEqual(out.getvalue(), CONTENT)
+
+    def test_several_parts(self):
+        parts = [self.add(i, '7bit', b'part %d' % i) for i in (1, 2, 3)]
+        sinks = [io.BytesIO() for _ in parts]
+
+        written = download_parts(self.client, [
+            (i, part, '1', sink) for i, part, sink in zip((1, 2, 3), parts, sinks)])
+
+        self.assertEqual([s.getvalue() for s in sinks], [b'part 1', b'part 2', b'part 3'])
+        self.assertEqual(written, [6, 6, 6])
+
+
+class TestBinaryDownload(TestDownload):
+
+    decoders = {'base64': base64.decodebytes, 'quoted-printable': quopri.decodestring}
+
+    def setUp(self):
+        super(TestBinaryDownload, self).setUp()
+        self.server.capabilities += b' BINARY'
+        self.client._cached_capabilities = None
+        self.client.capabilities()
+
+    def add(self, msgid, encoding, encoded, size=None):
+        decode = self.decoders.get(encoding, lambda data: data)
+        self.server.binary[msgid] = {'1': decode(encoded)}
+        return super(TestBinaryDownload, self).add(msgid, encoding, encoded, size)
+
+    def test_base64_to_file(self):
+        part = self.add(1, 'base64', base64.encodebytes(CONTENT))
+        del self.server.commands[:]
+        out = io.BytesIO()
+
+        download_part(self.client, 1, part, '1', out, chunk_size=1000)
+
+        self.assertEqual(out.getvalue(), CONTENT)
+        self.assertIn(b'UID FETCH 1 (BINARY.SIZE[1])', self.server.commands[0])
+        # 10 decoded chunks rather than 14 encoded ones
+        self.assertEqual(len(self.server.commands), 11)
+        self.assertIn(b'BINARY.PEEK[1]<9000.1000>', self.server.commands[-1])
+
+    def test_buffer_too_small(self):
+        part = self.add(1, '8bit', CONTENT)
+        del self.server.commands[:]
+        self.assertRaises(ValueError, download_part, self.client, 1, part, '1',
+                          bytearray(100), chunk_size=1000)
+        # Refused before any of the part was fetched
+        self.assertEqual(len(self.server.commands), 1)
+
+    def test_unknown_cte_falls_back(self):
+        part = self.add(1, 'base64', base64.encodebytes(CONTENT))
+        del self.server.binary[1]
+        out = io.BytesIO()
+
+        download_part(self.client, 1, part, '1', out, chunk_size=1000)
+
+        self.assertEqual(out.getvalue(), CONTENT)
@@ -4,6 +4,7 @@
 
 from __future__ import unicode_literals
 
+import pickle
 from datetime import timedelta
 from mock import Mock, patch, DEFAULT
 from imapclient.test.util import unittest
@@ -21,6 +22,11 @@ class TestFixedOffset(unittest.TestCase):
         self._check(FixedOffset(0),
                     timedelta(0), '+0000')
 
+    def test_pickle(self):
+        for minutes in (0, 90, -330):
+            offset = pickle.loads(pickle.dumps(FixedOffset(minutes)))
+            self._check(offset, timedelta(minutes=minutes), FixedOffset(minutes).tzname(None))
+
     def test_positive(self):
         self._check(FixedOffset(30),
                     timedelta(minutes=30), '+0030')
@@ -37,6 +43,10 @@ class TestFixedOffset(unittest.TestCase):
         self._check(FixedOffset(-11 * 60 - 30),
                     timedelta(minutes=(-11 * 60) - 30), '-1130')
 
+    def test_for_minutes(self):
+        self._check(FixedOffset.for_minutes(-90), timedelta(minutes=-90), '-0130')
+        self.assertIs(FixedOffset.for_minutes(-90), FixedOffset.for_minutes(-90))
+
     @patch.multiple('imapclient.fixed_offset.time',
                     daylight=True, timezone=15 * 60 * 60, localtime=DEFAULT)
     def test_for_system_DST_not_active(self, localtime):
@@ -6,9 +6,12 @@ from __future__ import unicode_literals
 
 from six import text_type, binary_type, int2byte, unichr
 
-from imapclient.imap_utf7 import decode, encode
+from imapclient.imap_utf7 import FolderNameCache, decode, encode
+from imapclient.imapclient import IMAPClient
 from imapclient.test.util import unittest
 
+from .fake_server import FakeIMAPServer
+
 
 class IMAP4UTF7TestCase(unittest.TestCase):
     tests = [
@@ -22,6 +25,8 @@ class IMAP4UTF7TestCase(unittest.TestCase):
         ['~peter/mail/\u65e5\u672c\u8a9e/\u53f0\u5317',
          b'~peter/mail/&ZeVnLIqe-/&U,BTFw-'],  # example from RFC 2060
         ['\x00foo', b'&AAA-foo'],
+        ['\xe9t\xe9 & hiver', b'&AOk-t&AOk- &- hiver'],
+        ['&&\xe9', b'&-&-&AOk-'],
     ]
 
     def test_encode(self):
@@ -48,3 +53,83 @@ class IMAP4UTF7TestCase(unittest.TestCase):
         self.assertEqual(encode('&'), b'&-')
         self.assertEqual(encode('&'), b'&-')
         self.assertEqual(decode(b'&-'), '&')
+
+    def test_control_characters(self):
+        # Python's utf-7 codec leaves these unencoded
+        self.assertEqual(encode('\t'), b'&AAk-')
+        self.assertEqual(encode('a\r\nb'), b'a&AA0ACg-b')
+        self.assertEqual(encode('\t\xe9'), b'&AAkA6Q-')
+        for name in ['\t', '\n', '\r', '&', 'a\tb&c']:
+            self.assertEqual(decode(encode(name)), name)
+
+    def test_unterminated(self):
+        self.assertEqual(decode(b'a&AOk'), 'a\xe9')
+        self.assertEqual(decode(b'\xff'), '\xff')
+
+
+class TestFolderNameCache(unittest.TestCase):
+
+    def test_same_as_functions(self):
+        cache = FolderNameCache()
+        for (name, encoded) in IMAP4UTF7TestCase.tests:
+            self.assertEqual(cache.encode(name), encoded)
+            self.assertEqual(cache.decode(encoded), name)
+            self.assertEqual(cache.encode(name), encoded)
+
+    def test_plain_names_not_kept(self):
+        cache = FolderNameCache()
+        cache.encode('INBOX')
+        cache.decode(b'Sent')
+        self.assertEqual(cache._encoded, {})
+
+    def test_both_directions(self):
+        cache = FolderNameCache()
+        self.assertEqual(cache.decode(b'&AOk-t&AOk-'), '\xe9t\xe9')
+        self.assertEqual(cache._encoded, {'\xe9t\xe9': b'&AOk-t&AOk-'})
+
+    def test_encoding_one_to_one(self):
+        cache = FolderNameCache()
+        for name in ['\t', '\n', '\r']:
+            cache.encode(name)
+        self.assertEqual(cache.decode(b'&-'), '&')
+        self.assertEqual(cache.decode(b'&AAk-'), '\t')
+
+    def test_names_not_round_tripping_not_kept(self):
+        cache = FolderNameCache()
+        # A surrogate pair given as two code points encodes like the
+        # character it stands for
+        self.assertEqual(cache.encode('\ud83d\ude00'), b'&2D3eAA-')
+        self.assertEqual(cache._encoded, {})
+        self.assertEqual(cache.decode(b'&2D3eAA-'), '\U0001f600')
+
+    def test_bounded(self):
+        cache = FolderNameCache(size=2)
+        for name in ['\xe9', '\xe8', '\xe7']:
+            cache.encode(name)
+
+        self.assertEqual(list(cache._encoded), ['\xe8', '\xe7'])
+        self.assertEqual(sorted(cache._decoded.values()), ['\xe7', '\xe8'])
+
+    def test_other_spelling_replaces(self):
+        cache = FolderNameCache()
+        cache.encode('\xe9')
+        cache.decode(b'&AOk')
+
+        self.assertEqual(cache._encoded, {'\xe9': b'&AOk'})
+        self.assertEqual(cache._decoded, {b'&AOk': '\xe9'})
+
+
+class TestListFolders(unittest.TestCase):
+
+    def test_names_decoded(self):
+        with FakeIMAPServer() as server:
+            server.folders = [b'INBOX', b'&AOk-t&AOk-', b'Stuff &- Things']
+            client = IMAPClient(server.host, server.port)
+            client.login('user', 'pass')
+
+            names = [name for _, _, name in client.list_folders()]
+            client.select_folder(names[1])
+            client.logout()
+
+            self.assertEqual(names, ['INBOX', '\xe9t\xe9', 'Stuff & Things'])
+            self.assertEqual(server.commands[-2].split(b' ', 2)[2], b'"&AOk-t&AOk-"')
@@ -380,7 +380,9 @@ class TestTimeNormalisation(IMAPClientTest):
             self.client.fetch(22, ['SOMETHING'])
             parse_fetch_response.assert_called_with(sentinel.fetch_data,
                                                     expected,
-                                                    sentinel.use_uid)
+                                                    sentinel.use_uid,
+                                                    False,
+                                                    False)
 
         self.client.normalise_times = True
         check(True)
@@ -548,6 +550,32 @@ class TestId(IMAPClientTest):
         self.assertRaises(TypeError, self.client.id_, 'bananarama')
 
 
+class TestEnable(IMAPClientTest):
+
+    def setUp(self):
+        super(TestEnable, self).setUp()
+        self.client._cached_capabilities = (b'ENABLE',)
+        self.client._raw_command_untagged = Mock()
+
+    def test_enable(self):
+        self.client._raw_command_untagged.return_value = b'CONDSTORE qresync'
+
+        enabled = self.client.enable('CONDSTORE', 'QRESYNC')
+
+        self.client._raw_command_untagged.assert_called_once_with(
+            b'ENABLE', [b'CONDSTORE', b'QRESYNC'],
+            unpack=True, response_name=b'ENABLED', uid=False)
+        self.assertEqual(enabled, [b'CONDSTORE', b'QRESYNC'])
+
+    def test_nothing_enabled(self):
+        self.client._raw_command_untagged.return_value = None
+        self.assertEqual(self.client.enable('FOO'), [])
+
+    def test_no_support(self):
+        self.client._cached_capabilities = (b'IMAP4rev1',)
+        self.assertRaises(ValueError, self.client.enable, 'QRESYNC')
+
+
 class TestFlags(IMAPClientTest):
 
     def test_flags_are_bytes(self):
@@ -580,6 +608,10 @@ class TestRawCommand(IMAPClientTest):
                    b'tag SEARCH ALL\r\n',
                    )
 
+    def test_uid_not_wanted(self):
+        typ, data = self.client._raw_command(b'enable', [b'QRESYNC'], uid=False)
+        self.assertEqual(self.client._imap.sent, b'tag ENABLE QRESYNC\r\n')
+
     def test_literal_at_end(self):
         self.check(b'search', [b'TEXT', b'\xfe\xff'],
                    b'tag UID SEARCH TEXT {2}\r\n'
@@ -50,13 +50,23 @@ class TestInit(unittest.TestCase):
         self.assertEqual(imap._imap, fakeIMAP4_TLS)
         self.tls.IMAP4_TLS.assert_called_with(
             '1.2.3.4', 993,
-            sentinel.context, sentinel.timeout)
+            sentinel.context, sentinel.timeout, None)
         self.assertEqual(imap.host, '1.2.3.4')
         self.assertEqual(imap.port, 993)
         self.assertEqual(imap.ssl, True)
         self.assertEqual(imap.ssl_context, sentinel.context)
         self.assertEqual(imap.stream, False)
 
+    def test_SSL_session(self):
+        self.tls.IMAP4_TLS.return_value = Mock()
+
+        IMAPClient('1.2.3.4', ssl=True, ssl_context=sentinel.context,
+                   ssl_session=sentinel.session)
+
+        self.tls.IMAP4_TLS.assert_called_with(
+            '1.2.3.4', 993,
+            sentinel.context, None, sentinel.session)
+
     def test_stream(self):
         self.imaplib.IMAP4_stream.return_value = sentinel.IMAP4_stream
 
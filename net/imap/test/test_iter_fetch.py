@@ -0,0 +1,84 @@
+# Copyright (c) 2015, Menno Smits
+# Released subject to the New BSD License
+# Please see http://en.wikipedia.org/wiki/BSD_licenses
+
+from __future__ import unicode_literals
+
+from imapclient.response_types import FetchRecord
+
+from .imapclient_test import IMAPClientTest
+
+
+class TestIterFetch(IMAPClientTest):
+
+    def setUp(self):
+        super(TestIterFetch, self).setUp()
+        self.client._imap._command.return_value = 'tag'
+        self.client._imap.tagged_commands = {'tag': None}
+        self.client._imap.untagged_responses = {}
+
+    def set_responses(self, responses, result=('OK', [b'done'])):
+        imap = self.client._imap
+        responses = list(responses)
+        self.reads = 0
+
+        def fake_get_response():
+            self.reads += 1
+            if responses:
+                imap.untagged_responses.setdefault('FETCH', []).extend(responses.pop(0))
+            else:
+                imap.tagged_commands['tag'] = result
+        imap._get_response = fake_get_response
+
+    def test_yields_per_message(self):
+        self.set_responses([
+            [b'1 (UID 11 FLAGS (\\Seen))'],
+            [(b'2 (UID 22 BODY[] {3}', b'abc'), b')'],
+        ])
+
+        out = self.client.iter_fetch([11, 22], ['FLAGS', 'BODY[]'])
+
+        self.assertEqual(next(out), (11, {b'SEQ': 1, b'FLAGS': (b'\\Seen',)}))
+        self.assertEqual(self.reads, 1)
+        self.assertEqual(next(out), (22, {b'SEQ': 2, b'BODY[]': b'abc'}))
+        self.assertRaises(StopIteration, next, out)
+        self.client._imap._command.assert_called_once_with(
+            'UID', 'FETCH', b'11,22', '(FLAGS BODY[])', None)
+        self.assertEqual(self.client._imap.tagged_commands, {})
+        self.assertEqual(self.client._imap.untagged_responses, {})
+
+    def test_lazy(self):
+        self.client.lazy_fetch = True
+        self.set_responses([
+            [b'1 (UID 11 INTERNALDATE " 9-Feb-2007 17:08:08 +0100")'],
+        ])
+
+        (msgid, data), = list(self.client.iter_fetch([11], ['INTERNALDATE']))
+
+        self.assertIsInstance(data, FetchRecord)
+        self.assertEqual(data[b'INTERNALDATE'].year, 2007)
+
+    def test_no_messages(self):
+        self.assertEqual(list(self.client.iter_fetch([], ['FLAGS'])), [])
+        self.assertFalse(self.client._imap._command.called)
+
+    def test_failure(self):
+        self.set_responses([], result=('NO', [b'badness']))
+
+        out = self.client.iter_fetch([1], ['FLAGS'])
+        self.assertRaises(self.client.Error, list, out)
+
+    def test_close_early_discards_rest(self):
+        self.set_responses([
+            [b'1 (UID 11 FLAGS ())'],
+            [b'2 (UID 22 FLAGS ())'],
+            [b'3 (UID 33 FLAGS ())'],
+        ])
+
+        out = self.client.iter_fetch([11, 22, 33], ['FLAGS'])
+        next(out)
+        out.close()
+
+        self.assertEqual(self.reads, 4)
+        self.assertEqual(self.client._imap.tagged_commands, {})
+        self.assertEqual(self.client._imap.untagged_responses, {})
@@ -0,0 +1,110 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+import time
+
+from imapclient.imapclient import IMAPClient
+from imapclient.pipeline import PipelineResult
+from imapclient.test.util import unittest
+
+from .fake_server import FakeIMAPServer
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeIMAPServer(20)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.client = IMAPClient(self.server.host, self.server.port)
+        self.client.login('user', 'pass')
+        self.client.select_folder('INBOX')
+        del self.server.commands[:]
+
+    def tearDown(self):
+        self.client.logout()
+
+    def test_results(self):
+        with self.client.pipeline() as p:
+            fetched = p.fetch([3], ['RFC822.SIZE'])
+            stored = p.add_flags([3, 4], ['processed'])
+            flags = p.get_flags([4, 5])
+            found = p.search(['ALL'])
+            copied = p.copy([1], 'Archive')
+            noop = p.noop()
+            self.assertIsInstance(fetched, PipelineResult)
+
+        self.assertEqual(fetched.result(), {3: {b'SEQ': 3, b'RFC822.SIZE': 1003}})
+        self.assertEqual(stored.result(), {3: (b'processed',), 4: (b'processed',)})
+        self.assertEqual(flags.result(), {4: (b'processed',), 5: ()})
+        self.assertEqual(found.result(), list(range(1, 21)))
+        self.assertEqual(copied.result(), b'COPY completed')
+        self.assertEqual(noop.result(), b'NOOP completed')
+
+    def test_commands_are_sent_before_responses_are_read(self):
+        self.server.latency = 0.5
+        with self.client.pipeline() as p:
+            results = [p.fetch([i], ['FLAGS']) for i in range(1, 11)]
+            deadline = time.time() + 0.4
+            while len(self.server.commands) < 10 and time.time() < deadline:
+                time.sleep(0.01)
+            # All ten reached the server before the first was answered
+            self.assertEqual(len(self.server.commands), 10)
+            self.assertFalse(results[0].done())
+
+        self.assertTrue(all(r.done() for r in results))
+        self.assertEqual(results[6].result(), {7: {b'SEQ': 7, b'FLAGS': ()}})
+
+    def test_result_waits_for_its_command(self):
+        with self.client.pipeline() as p:
+            first = p.fetch([1], ['FLAGS'])
+            second = p.fetch([2], ['FLAGS'])
+            self.assertEqual(first.result(), {1: {b'SEQ': 1, b'FLAGS': ()}})
+            self.assertFalse(second.done())
+
+    def test_depth(self):
+        self.server.latency = 0.05
+        with self.client.pipeline(depth=2) as p:
+            first = p.noop()
+            p.noop()
+            p.noop()
+            self.assertTrue(first.done())
+
+    def test_batches(self):
+        self.client.max_id_list_length = 10
+        with self.client.pipeline() as p:
+            out = p.fetch(list(range(1, 21, 2)), ['FLAGS'])
+
+        self.assertEqual(sorted(out.result()), list(range(1, 21, 2)))
+        self.assertGreater(len(self.server.commands), 1)
+
+    def test_empty(self):
+        with self.client.pipeline() as p:
+            out = p.fetch([], ['FLAGS'])
+        self.assertEqual(out.result(), {})
+        self.assertEqual(self.server.commands, [])
+
+    def test_failure_raised_on_exit(self):
+        def run():
+            with self.client.pipeline() as p:
+                p.fetch([1], ['BOGUS'])
+                self.ok = p.fetch([2], ['FLAGS'])
+
+        self.assertRaises(IMAPClient.Error, run)
+        self.assertEqual(self.ok.result(), {2: {b'SEQ': 2, b'FLAGS': ()}})
+        self.assertEqual(self.client._imap.tagged_commands, {})
+
+    def test_checked_failure_not_raised_again(self):
+        with self.client.pipeline() as p:
+            bad = p.fetch([1], ['BOGUS'])
+            self.assertRaises(IMAPClient.Error, bad.result)
+
+    def test_search_without_response(self):
+        self.server._do_search = lambda args, uid: []
+        with self.client.pipeline() as p:
+            found = p.search(['ALL'])
+        self.assertEqual(found.result(), [])
+
+    def test_8bit_search(self):
+        with self.client.pipeline() as p:
+            self.assertRaises(ValueError, p.search, ['SUBJECT', 'caf\xe9'])
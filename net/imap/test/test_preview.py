@@ -0,0 +1,66 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+import base64
+
+from imapclient.imapclient import IMAPClient
+from imapclient.test.util import unittest
+from imapclient.util import PREVIEW_SIZE, process_bodies, process_body
+
+from .fake_server import FakeIMAPServer
+
+MIXED_BODYSTRUCTURE = (
+    b'(("text" "plain" ("charset" "utf-8") NIL NIL "base64" 8 1 NIL NIL NIL NIL)'
+    b'("application" "pdf" ("name" "a.pdf") NIL NIL "base64" 8 NIL '
+    b'("attachment" ("filename" "a.pdf")) NIL NIL) '
+    b'"mixed" ("boundary" "x") NIL NIL NIL)'
+)
+
+PLAIN_BODYSTRUCTURE = b'("text" "plain" ("charset" "utf-8") NIL NIL "base64" 5 1 NIL NIL NIL NIL)'
+
+
+class TestPreview(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeIMAPServer(5)
+        # Long enough for the preview, with its line breaks, to end one
+        # character into a base64 quantum, which can't be padded
+        self.long_text = 'word ' * 100
+        encoded = base64.encodebytes(self.long_text.encode('ascii'))
+        self.assertEqual(len(encoded[:PREVIEW_SIZE].replace(b'\n', b'')) % 4, 1)
+        self.server.bodies[1] = (PLAIN_BODYSTRUCTURE, {'1': encoded})
+        self.server.bodies[2] = (MIXED_BODYSTRUCTURE, {
+            '1': base64.b64encode(b'caf\xc3\xa9')[:-1],  # missing padding
+            '2': base64.b64encode(b'%PDF'),
+        })
+        self.server.bodies[3] = (PLAIN_BODYSTRUCTURE, {'1': base64.b64encode(b'three')})
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.client = IMAPClient(self.server.host, self.server.port)
+        self.client.login('user', 'pass')
+        self.client.select_folder('INBOX')
+        fetched = self.client.fetch([1, 2, 3], ['BODYSTRUCTURE'])
+        self.structures = dict((msgid, data[b'BODYSTRUCTURE']) for msgid, data in fetched.items())
+        del self.server.commands[:]
+
+    def tearDown(self):
+        self.client.logout()
+
+    def sent(self):
+        return [c.split(b' ', 1)[1] for c in self.server.commands]
+
+    def test_truncated_base64(self):
+        preview = process_body(self.client, 1, self.structures[1])
+
+        self.assertTrue(preview.startswith('word word'))
+        self.assertTrue(self.long_text.startswith(preview))
+
+    def test_short_body_flushed(self):
+        self.assertEqual(process_body(self.client, 2, self.structures[2]), 'caf\xe9 [a.pdf]')
+
+    def test_fetched_together(self):
+        previews = process_bodies(self.client, self.structures)
+
+        self.assertEqual(previews[2], 'caf\xe9 [a.pdf]')
+        self.assertEqual(previews[3], 'three')
+        self.assertEqual(self.sent(), [b'UID FETCH 1:3 (BODY.PEEK[1]<0.%d>)' % PREVIEW_SIZE])
@@ -81,6 +81,22 @@ class TestTokenSource(unittest.TestCase):
         self.check([br'[aaa\\bbb]'],
                    [br'[aaa\\bbb]'])
 
+    def test_specials_in_square_brackets(self):
+        self.check([b'BODY[HEADER.FIELDS (FROM "TO")] NIL'],
+                   [b'BODY[HEADER.FIELDS (FROM "TO")]', b'NIL'])
+        self.check([b'aaa[bbb]ccc[ddd]'],
+                   [b'aaa[bbb]ccc[ddd]'])
+
+    def test_adjacent_tokens(self):
+        self.check([b'"abc"def'],
+                   [b'"abc"', b'def'])
+        self.check([b'abc%def'],
+                   [b'abc', b'%', b'def'])
+
+    def test_control_chars(self):
+        self.check([b'abc\x00def'],
+                   [b'abc', b'\x00', b'def'])
+
     def test_unmatched_square_brackets(self):
         message = "No closing ']'"
         self.check_error([b'['], message)
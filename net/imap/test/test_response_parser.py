@@ -10,6 +10,9 @@ from __future__ import unicode_literals
 
 from datetime import datetime
 
+from six.moves import cPickle as pickle
+
+from imapclient import response_parser
 from imapclient.datetime_util import datetime_to_native
 from imapclient.fixed_offset import FixedOffset
 from imapclient.response_parser import (
@@ -17,8 +20,9 @@ from imapclient.response_parser import (
     parse_message_list,
     parse_fetch_response,
     ParseError,
+    set_engine,
 )
-from imapclient.response_types import Envelope, Address
+from imapclient.response_types import Address, BodyData, CompactRecord, Envelope, FetchRecord
 from imapclient.test.util import unittest
 
 # TODO: test invalid dates and times
@@ -27,7 +31,20 @@ from imapclient.test.util import unittest
 CRLF = b'\r\n'
 
 
-class TestParseResponse(unittest.TestCase):
+class EngineTestCase(unittest.TestCase):
+    """Runs its tests with *engine* as the parser engine, or the
+    default one if it is None.
+    """
+
+    engine = None
+
+    def setUp(self):
+        if self.engine is not None:
+            self.addCleanup(set_engine, response_parser._engine)
+            set_engine(self.engine)
+
+
+class TestParseResponse(EngineTestCase):
 
     def test_unquoted(self):
         self._test(b'FOO', b'FOO')
@@ -140,6 +157,9 @@ class TestParseResponse(unittest.TestCase):
     def test_incomplete_tuple(self):
         self._test_parse_error(b'abc (1 2', 'Tuple incomplete before "\(1 2"')
 
+    def test_literal8(self):
+        self._test([(b'~{3}', b'a\x00b')], b'a\x00b')
+
     def test_bad_literal(self):
         self._test_parse_error([(b'{99}', b'abc')],
                                'Expecting literal of size 99, got 3')
@@ -163,7 +183,7 @@ class TestParseResponse(unittest.TestCase):
                                parse_response, to_parse)
 
 
-class TestParseMessageList(unittest.TestCase):
+class TestParseMessageList(EngineTestCase):
 
     def test_basic(self):
         out = parse_message_list([b'1 2 3'])
@@ -183,6 +203,16 @@ class TestParseMessageList(unittest.TestCase):
         self.assertSequenceEqual(out, [1, 2, 3])
         self.assertEqual(out.modseq, 999)
 
+    def test_sequence_set(self):
+        out = parse_message_list([b'2,5:7,10 12'])
+        self.assertSequenceEqual(out, [2, 5, 6, 7, 10, 12])
+        self.assertEqual(out.modseq, None)
+
+    def test_sequence_set_with_modseq(self):
+        out = parse_message_list([b'1:3 (MODSEQ 999)'])
+        self.assertSequenceEqual(out, [1, 2, 3])
+        self.assertEqual(out.modseq, 999)
+
     def test_modseq_interleaved(self):
         # Unlikely but test it anyway.
         out = parse_message_list([b'1 2 (modseq 9) 3 4'])
@@ -190,7 +220,7 @@ class TestParseMessageList(unittest.TestCase):
         self.assertEqual(out.modseq, 9)
 
 
-class TestParseFetchResponse(unittest.TestCase):
+class TestParseFetchResponse(EngineTestCase):
 
     def test_basic(self):
         self.assertEqual(parse_fetch_response([b'4 ()']), {4: {b'SEQ': 4}})
@@ -346,6 +376,14 @@ class TestParseFetchResponse(unittest.TestCase):
             {367: {b'BODY[]<0>': body,
                    b'SEQ': 123}})
 
+    def test_BINARY(self):
+        data = b'\x00\x01\xff binary'
+        self.assertEqual(parse_fetch_response(
+            [(b'12 (UID 34 BINARY[2]<0> ~{10}', data), b' BINARY.SIZE[2] 10)']),
+            {34: {b'BINARY[2]<0>': data,
+                  b'BINARY.SIZE[2]': 10,
+                  b'SEQ': 12}})
+
     def test_ENVELOPE(self):
         envelope_str = (b'1 (ENVELOPE ( '
                         b'"Sun, 24 Mar 2013 22:06:10 +0200" '
@@ -484,6 +522,21 @@ class TestParseFetchResponse(unittest.TestCase):
             }
         })
 
+    def test_shared_values(self):
+        address = b'(("name" NIL "address1" "domain1.com"))'
+        response = [
+            b'1 (FLAGS (\\Seen) ENVELOPE (NIL NIL %s %s NIL NIL NIL NIL NIL NIL))' % (address, address),
+            b'2 (flags (\\Seen) ENVELOPE (NIL NIL %s NIL NIL NIL NIL NIL NIL NIL))' % address,
+        ]
+        out = parse_fetch_response(response)
+
+        self.assertIs(out[1][b'FLAGS'], out[2][b'FLAGS'])
+        self.assertIs(list(out[1])[1], list(out[2])[1])
+        envelopes = [out[1][b'ENVELOPE'], out[2][b'ENVELOPE']]
+        self.assertIs(envelopes[0].from_, envelopes[0].sender)
+        self.assertIs(envelopes[0].from_, envelopes[1].from_)
+        self.assertEqual(envelopes[1].from_, (Address(b'name', None, b'address1', b'domain1.com'),))
+
     def test_Address_str(self):
         self.assertEqual(str(Address(b"Mary Jane", None, b"mary", b"jane.org")),
                          "Mary Jane <mary@jane.org>")
@@ -492,6 +545,169 @@ class TestParseFetchResponse(unittest.TestCase):
                          "Mary Jane <mary@jane.org>")
 
 
+class TestLazyFetchResponse(EngineTestCase):
+
+    response = [
+        (b'1 (UID 10 FLAGS (\\Seen) INTERNALDATE " 9-Feb-2007 17:08:08 +0100" '
+         b'ENVELOPE ("Sun, 24 Mar 2013 22:06:10 +0200" "subject" '
+         b'(("name" NIL "address1" "domain1.com")) NIL NIL NIL NIL NIL NIL "<msg_id>") '
+         b'BODYSTRUCTURE ("text" "plain" ("charset" "us-ascii") NIL NIL "7bit" 5 1 NIL NIL NIL) '
+         b'RFC822 {4}', b'body'),
+        b')',
+    ]
+
+    def test_same_as_eager(self):
+        eager = parse_fetch_response(self.response)
+        lazy = parse_fetch_response(self.response, lazy=True)
+
+        self.assertEqual(lazy, eager)
+        self.assertIsInstance(lazy[10], FetchRecord)
+        self.assertEqual(lazy[10][b'ENVELOPE'], eager[10][b'ENVELOPE'])
+        self.assertEqual(lazy[10][b'BODYSTRUCTURE'].content_type, 'text/plain')
+
+    def test_converted_on_access(self):
+        calls = []
+
+        def convert(value, normalise_times):
+            calls.append(value)
+            return 'converted'
+
+        record = FetchRecord()
+        record.set_lazy(b'ENVELOPE', convert, b'raw', True)
+        self.assertEqual(calls, [])
+
+        self.assertEqual(record[b'ENVELOPE'], 'converted')
+        self.assertEqual(record.get(b'ENVELOPE'), 'converted')
+        self.assertEqual(calls, [b'raw'])
+
+    def test_untouched_items_not_converted(self):
+        record = parse_fetch_response(self.response, lazy=True)[10]
+
+        self.assertEqual(record[b'FLAGS'], (b'\\Seen',))
+        raw = dict.__getitem__(record, b'ENVELOPE')
+        self.assertNotIsInstance(raw, Envelope)
+
+    def test_copies_are_converted(self):
+        record = parse_fetch_response(self.response, lazy=True)[10]
+        self.assertIsInstance(dict(record)[b'ENVELOPE'], Envelope)
+        self.assertIsInstance(record.copy()[b'ENVELOPE'], Envelope)
+        merged = {}
+        merged.update(record)
+        self.assertIsInstance(merged[b'BODYSTRUCTURE'], BodyData)
+
+    def test_literal_in_lazy_value(self):
+        response = [
+            (b'1 (ENVELOPE (NIL {7}', b'subject'),
+            b' NIL NIL NIL NIL NIL NIL NIL NIL) FLAGS ())',
+        ]
+
+        record = parse_fetch_response(response, lazy=True)[1]
+
+        self.assertEqual(record[b'ENVELOPE'].subject, b'subject')
+        self.assertEqual(record[b'FLAGS'], ())
+
+    def test_errors(self):
+        self.assertRaises(ParseError, parse_fetch_response, [b'1 (FLAGS)'], lazy=True)
+        self.assertRaises(ParseError, parse_fetch_response, [b'1 FLAGS'], lazy=True)
+        self.assertRaises(ParseError, parse_fetch_response, [b'1 (ENVELOPE (NIL'], lazy=True)
+        record = parse_fetch_response([b'1 (ENVELOPE ("date"))'], lazy=True)[1]
+        self.assertRaises(IndexError, record.__getitem__, b'ENVELOPE')
+
+    def test_pickled_converted(self):
+        record = parse_fetch_response(self.response, lazy=True)[10]
+        unpickled = pickle.loads(pickle.dumps(record, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(unpickled, record)
+        self.assertIsInstance(dict.__getitem__(unpickled, b'ENVELOPE'), Envelope)
+
+
+class TestCompactFetchResponse(EngineTestCase):
+
+    response = TestLazyFetchResponse.response
+
+    def test_same_as_dict(self):
+        out = parse_fetch_response(self.response, compact=True)
+
+        self.assertIsInstance(out[10], CompactRecord)
+        self.assertEqual(out, parse_fetch_response(self.response))
+        self.assertEqual(list(out[10]), [b'SEQ', b'FLAGS', b'INTERNALDATE', b'ENVELOPE',
+                                         b'BODYSTRUCTURE', b'RFC822'])
+        self.assertEqual(out[10][b'RFC822'], b'body')
+
+    def test_lazy(self):
+        record = parse_fetch_response(self.response, lazy=True, compact=True)[10]
+
+        self.assertIsInstance(record, CompactRecord)
+        self.assertNotIsInstance(record._envelope, Envelope)
+        self.assertIn(b'ENVELOPE', record)
+        self.assertNotIsInstance(record._envelope, Envelope)
+        self.assertEqual(record[b'ENVELOPE'].subject, b'subject')
+        self.assertIsInstance(record._envelope, Envelope)
+
+    def test_mapping(self):
+        record = CompactRecord({b'UID': 3, b'X-GM-LABELS': ()})
+        record[b'FLAGS'] = ()
+
+        self.assertEqual(len(record), 3)
+        self.assertEqual(record.get(b'MODSEQ'), None)
+        self.assertNotIn(b'MODSEQ', record)
+        self.assertRaises(KeyError, record.__getitem__, b'BODY[]')
+        self.assertEqual(record.pop(b'X-GM-LABELS'), ())
+        del record[b'UID']
+        self.assertRaises(KeyError, record.__delitem__, b'UID')
+        self.assertEqual(record, {b'FLAGS': ()})
+        self.assertEqual(record.copy(), record)
+
+    def test_update_keeps_lazy_values(self):
+        record = CompactRecord()
+        record.update(parse_fetch_response(self.response, lazy=True)[10])
+
+        self.assertNotIsInstance(record._envelope, Envelope)
+        self.assertEqual(record[b'ENVELOPE'], parse_fetch_response(self.response)[10][b'ENVELOPE'])
+
+    def test_pickled_converted(self):
+        record = parse_fetch_response(self.response, lazy=True, compact=True)[10]
+        unpickled = pickle.loads(pickle.dumps(record, pickle.HIGHEST_PROTOCOL))
+
+        self.assertEqual(unpickled, record)
+        self.assertIsInstance(unpickled._envelope, Envelope)
+
+    def test_no_instance_dict(self):
+        self.assertFalse(hasattr(CompactRecord(), '__dict__'))
+
+
+class TestParseResponseLexer(TestParseResponse):
+    engine = 'lexer'
+
+
+class TestParseMessageListLexer(TestParseMessageList):
+    engine = 'lexer'
+
+
+class TestParseFetchResponseLexer(TestParseFetchResponse):
+    engine = 'lexer'
+
+
+class TestLazyFetchResponseLexer(TestLazyFetchResponse):
+    engine = 'lexer'
+
+
+class TestCompactFetchResponseLexer(TestCompactFetchResponse):
+    engine = 'lexer'
+
+
+class TestEngines(unittest.TestCase):
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, set_engine, 'regex')
+
+    def test_deferred_tuple_spans_records(self):
+        response = [(b'1 (BODYSTRUCTURE ("text" {5}', b'plain'),
+                    (b' NIL NIL NIL "7bit" {1}', b'4'), b' 1 NIL NIL NIL) UID 7)']
+        record = parse_fetch_response(response, lazy=True)[7]
+
+        self.assertEqual(record[b'BODYSTRUCTURE'].content_type, 'text/plain')
+        self.assertEqual(record, parse_fetch_response(response)[7])
+
 
 def add_crlf(text):
     return CRLF.join(text.splitlines()) + CRLF
@@ -8,6 +8,7 @@ from datetime import date, datetime
 
 from mock import Mock
 
+from imapclient.sequence_set import SequenceSet
 from .imapclient_test import IMAPClientTest
 
 
@@ -80,6 +81,82 @@ class TestSearch(TestSearchBase):
         self.assertEqual(result.modseq, 51101)
 
 
+class TestSearchReturning(TestSearchBase):
+
+    def setUp(self):
+        super(TestSearchReturning, self).setUp()
+        self.client._cached_capabilities = (b'IMAP4REV1', b'ESEARCH')
+
+    def test_esearch(self):
+        self.client._raw_command_untagged.return_value = [
+            b'(TAG "A1") UID MIN 2 MAX 44 COUNT 3 ALL 2,10:11']
+
+        result = self.client.search(['UNSEEN'], returning=['min', 'MAX', 'COUNT', 'ALL'])
+
+        self.client._raw_command_untagged.assert_called_once_with(
+            b'SEARCH', [b'RETURN', b'(MIN MAX COUNT ALL)', b'UNSEEN'],
+            response_name=b'ESEARCH')
+        self.assertEqual(result.min, 2)
+        self.assertEqual(result.max, 44)
+        self.assertEqual(result.count, 3)
+        self.assertEqual(result.all, SequenceSet([2, 10, 11]))
+        self.assertIsNone(result.modseq)
+
+    def test_esearch_with_charset(self):
+        self.client._raw_command_untagged.return_value = [b'(TAG "A1") COUNT 1']
+
+        self.client.search(['FOO'], 'utf-8', returning='COUNT')
+
+        self.client._raw_command_untagged.assert_called_once_with(
+            b'SEARCH', [b'RETURN', b'(COUNT)', b'CHARSET', b'utf-8', b'FOO'],
+            response_name=b'ESEARCH')
+
+    def test_esearch_no_matches(self):
+        self.client._raw_command_untagged.return_value = [b'(TAG "A1") UID COUNT 0']
+
+        result = self.client.search(['FOO'], returning=['MIN', 'COUNT', 'ALL'])
+
+        self.assertEqual(result.count, 0)
+        self.assertIsNone(result.min)
+        self.assertIsNone(result.max)
+        self.assertEqual(result.all, SequenceSet())
+
+    def test_esearch_single_id_and_modseq(self):
+        self.client._raw_command_untagged.return_value = [
+            b'(TAG "A1") ALL 7 MODSEQ 1234']
+
+        result = self.client.search(['MODSEQ', 1000], returning=['ALL'])
+
+        self.assertEqual(result.all, SequenceSet([7]))
+        self.assertEqual(result.modseq, 1234)
+        self.assertIsNone(result.count)
+
+    def test_fallback(self):
+        self.client._cached_capabilities = (b'IMAP4REV1',)
+
+        result = self.client.search(['FOO'], returning=['MIN', 'MAX', 'COUNT', 'ALL'])
+
+        self.check_call([b'FOO'])
+        self.assertEqual(result.min, 1)
+        self.assertEqual(result.max, 44)
+        self.assertEqual(result.count, 3)
+        self.assertEqual(result.all, SequenceSet([1, 2, 44]))
+
+    def test_fallback_no_matches(self):
+        self.client._cached_capabilities = (b'IMAP4REV1',)
+        self.client._raw_command_untagged.return_value = [None]
+
+        result = self.client.search(['FOO'], returning=['MIN', 'COUNT'])
+
+        self.assertIsNone(result.min)
+        self.assertEqual(result.count, 0)
+        self.assertIsNone(result.all)
+
+    def test_bad_option(self):
+        self.assertRaises(ValueError, self.client.search, ['FOO'], returning=['SAVE'])
+        self.assertFalse(self.client._raw_command_untagged.called)
+
+
 class TestGmailSearch(TestSearchBase):
 
     def test_bytes_query(self):
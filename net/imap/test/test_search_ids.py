@@ -0,0 +1,127 @@
+# coding=utf-8
+
+from __future__ import unicode_literals
+
+import copy
+import json
+import pickle
+
+from imapclient.response_types import SearchIds
+from imapclient.test.util import unittest
+
+
+class TestSearchIds(unittest.TestCase):
+
+    def test_list_compatible(self):
+        ids = SearchIds([3, 1, 2])
+        self.assertEqual(ids, [3, 1, 2])
+        self.assertNotEqual(ids, [1, 2, 3])
+        self.assertEqual(ids[0], 3)
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(repr(ids), '[3, 1, 2]')
+
+        ids.sort()
+        self.assertEqual(ids, [1, 2, 3])
+        ids.sort(reverse=True)
+        self.assertEqual(ids, [3, 2, 1])
+
+    def test_slice_and_add(self):
+        ids = SearchIds([1, 2, 3, 4])
+        ids.modseq = 5
+        self.assertIsInstance(ids[1:3], SearchIds)
+        self.assertEqual(ids[1:3], [2, 3])
+        self.assertEqual(ids + [9], [1, 2, 3, 4, 9])
+        self.assertEqual(ids.modseq, 5)
+
+    def test_modseq(self):
+        ids = SearchIds([1])
+        self.assertIsNone(ids.modseq)
+        ids.modseq = 99
+        self.assertEqual(ids.modseq, 99)
+
+    def test_large_ids(self):
+        ids = SearchIds([4294967295])
+        self.assertEqual(ids, [4294967295])
+        self.assertRaises(OverflowError, SearchIds, [-1])
+
+    def test_set_operations(self):
+        a = SearchIds([5, 1, 3, 7])
+        a.modseq = 10
+        b = SearchIds([3, 4, 5])
+
+        self.assertEqual(a & b, [3, 5])
+        self.assertEqual(a | b, [1, 3, 4, 5, 7])
+        self.assertEqual(a - b, [1, 7])
+        self.assertEqual(a & [7, 8], [7])
+        self.assertIsInstance(a | b, SearchIds)
+        self.assertIsNone((a | b).modseq)
+
+    def test_set_operations_on_unsorted_ids(self):
+        a = SearchIds([9, 2, 2, 5])
+        b = [5, 1, 9, 9]
+
+        self.assertEqual(a & b, [5, 9])
+        self.assertEqual(a | b, [1, 2, 5, 9])
+        self.assertEqual(a - b, [2])
+        self.assertEqual(SearchIds() | b, [1, 5, 9])
+        self.assertEqual(a - [], [2, 5, 9])
+        self.assertEqual(a, [9, 2, 2, 5])
+
+    def test_list_methods(self):
+        ids = SearchIds([1, 2])
+        ids.modseq = 7
+
+        joined = [5] + ids
+        self.assertIsInstance(joined, SearchIds)
+        self.assertEqual(joined, [5, 1, 2])
+
+        copied = ids.copy()
+        self.assertIsInstance(copied, SearchIds)
+        self.assertEqual(copied, [1, 2])
+        self.assertEqual(copied.modseq, 7)
+        copied.append(3)
+        self.assertEqual(ids, [1, 2])
+
+        ids.clear()
+        self.assertEqual(ids, [])
+        self.assertEqual(copied, [1, 2, 3])
+
+    def test_pickle(self):
+        ids = SearchIds([1, 5])
+        ids.modseq = 9
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            out = pickle.loads(pickle.dumps(ids, protocol))
+            self.assertIsInstance(out, SearchIds)
+            self.assertEqual(out, [1, 5])
+            self.assertEqual(out.modseq, 9)
+
+    def test_copy_module(self):
+        ids = SearchIds([1, 5])
+        ids.modseq = 9
+        for out in copy.copy(ids), copy.deepcopy(ids):
+            self.assertIsInstance(out, SearchIds)
+            self.assertEqual(out, [1, 5])
+            self.assertEqual(out.modseq, 9)
+            out.append(6)
+            self.assertEqual(ids, [1, 5])
+
+    def test_in_place_add(self):
+        ids = SearchIds([1])
+        ids.modseq = 9
+        ids += [2, 3]
+        ids += (4,)
+        ids += SearchIds([5])
+        self.assertIsInstance(ids, SearchIds)
+        self.assertEqual(ids, [1, 2, 3, 4, 5])
+        self.assertEqual(ids.modseq, 9)
+
+    def test_multiply(self):
+        ids = SearchIds([1, 2])
+        ids.modseq = 9
+        for out in ids * 2, 2 * ids:
+            self.assertIsInstance(out, SearchIds)
+            self.assertEqual(out, [1, 2, 1, 2])
+            self.assertEqual(out.modseq, 9)
+
+    def test_json(self):
+        self.assertEqual(json.dumps(SearchIds([1, 2]).tolist()), '[1, 2]')
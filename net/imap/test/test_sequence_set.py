@@ -0,0 +1,75 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+from imapclient.sequence_set import SequenceSet
+from imapclient.test.util import unittest
+
+
+class TestSequenceSet(unittest.TestCase):
+
+    def test_encode(self):
+        self.assertEqual(SequenceSet([5, 1, 2, 3, 3, 9, 10]).to_bytes(), b'1:3,5,9:10')
+        self.assertEqual(SequenceSet([7]).to_bytes(), b'7')
+        self.assertEqual(SequenceSet().to_bytes(), b'')
+
+    def test_parse(self):
+        s = SequenceSet.parse(b'9:10,1:3,5,2')
+        self.assertEqual(s.ranges, [(1, 3), (5, 5), (9, 10)])
+        self.assertEqual(list(s), [1, 2, 3, 5, 9, 10])
+        self.assertEqual(SequenceSet.parse('5:3'), SequenceSet([3, 4, 5]))
+
+    def test_parse_merges_adjacent(self):
+        self.assertEqual(SequenceSet.parse(b'1:3,4,5:6').ranges, [(1, 6)])
+
+    def test_parse_invalid(self):
+        for text in [b'', b'1:*', b'a', b'1,,2', b'0:3']:
+            self.assertRaises(ValueError, SequenceSet.parse, text)
+
+    def test_round_trip(self):
+        text = b'1:100,200,300:301'
+        self.assertEqual(SequenceSet.parse(text).to_bytes(), text)
+
+    def test_len_and_contains(self):
+        s = SequenceSet.parse(b'1:100,200')
+        self.assertEqual(len(s), 101)
+        self.assertIn(1, s)
+        self.assertIn(100, s)
+        self.assertIn(200, s)
+        self.assertNotIn(101, s)
+        self.assertNotIn(0, s)
+        self.assertNotIn(201, s)
+        self.assertFalse(SequenceSet())
+        self.assertTrue(s)
+
+    def test_union(self):
+        a = SequenceSet.parse(b'1:5,10:20')
+        b = SequenceSet.parse(b'6:8,15:30,40')
+        self.assertEqual((a | b).to_bytes(), b'1:8,10:30,40')
+        self.assertEqual(a.union([6, 7, 8, 9]).to_bytes(), b'1:20')
+
+    def test_intersection(self):
+        a = SequenceSet.parse(b'1:5,10:20')
+        b = SequenceSet.parse(b'4:12,18,25')
+        self.assertEqual((a & b).to_bytes(), b'4:5,10:12,18')
+        self.assertEqual((a & SequenceSet()).to_bytes(), b'')
+
+    def test_difference(self):
+        a = SequenceSet.parse(b'1:20')
+        b = SequenceSet.parse(b'1,5:7,20,30')
+        self.assertEqual((a - b).to_bytes(), b'2:4,8:19')
+        self.assertEqual((b - a).to_bytes(), b'30')
+        self.assertEqual(a.difference([]).to_bytes(), b'1:20')
+
+    def test_set_ops_match_python_sets(self):
+        import random
+        rand = random.Random(42)
+        for _ in range(200):
+            x = set(rand.sample(range(1, 60), rand.randint(0, 40)))
+            y = set(rand.sample(range(1, 60), rand.randint(0, 40)))
+            a, b = SequenceSet(x), SequenceSet(y)
+            self.assertEqual(list(a | b), sorted(x | y))
+            self.assertEqual(list(a & b), sorted(x & y))
+            self.assertEqual(list(a - b), sorted(x - y))
+
+    def test_repr(self):
+        self.assertEqual(repr(SequenceSet([1, 2, 4])), "SequenceSet('1:2,4')")
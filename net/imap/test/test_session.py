@@ -0,0 +1,156 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+import os
+import ssl
+import time
+
+from imapclient import tls
+from imapclient.imapclient import IMAPClient
+from imapclient.session import Session, SessionManager
+from imapclient.test.util import unittest
+
+from .fake_server import FakeIMAPServer
+
+KEYCERT = os.path.join(os.path.dirname(__file__), 'keycert.pem')
+
+
+class TestSession(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeIMAPServer(5)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.session = self.new_session()
+        self.addCleanup(self.session.close)
+
+    def new_session(self, **kwargs):
+        return Session(self.server.host, 'user', 'pass', ssl=False, port=self.server.port, **kwargs)
+
+    def count(self, command):
+        return sum(1 for line in self.server.commands if line.split(b' ')[1:2] == [command])
+
+    def drop(self):
+        self.server.drop_connections()
+        time.sleep(0.05)
+
+    def test_connection_kept_between_runs(self):
+        for _ in range(3):
+            self.assertEqual(self.session.run(lambda client: client.search()), [1, 2, 3, 4, 5])
+
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.count(b'LOGIN'), 1)
+        self.assertEqual(self.session.connects, 1)
+        self.assertEqual(self.count(b'NOOP'), 0)
+
+    def test_noop_check_after_idle(self):
+        self.session.check_after = 0
+        self.session.run(lambda client: None)
+        time.sleep(0.01)
+        self.session.run(lambda client: None)
+
+        self.assertEqual(self.count(b'NOOP'), 1)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_dead_connection_replaced_by_check(self):
+        self.session.run(lambda client: client.select_folder('INBOX'))
+        self.drop()
+        self.session.check_after = 0
+
+        client = self.session.client
+
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(client._selected[0], 'INBOX')
+
+    def test_reconnect_and_reselect_on_abort(self):
+        self.session.run(lambda client: client.select_folder('INBOX'))
+        self.drop()
+
+        self.assertEqual(self.session.run(lambda client: client.search()), [1, 2, 3, 4, 5])
+
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(self.count(b'SELECT'), 2)
+
+    def test_abort_retried_once(self):
+        def abort(client):
+            raise IMAPClient.AbortError('connection lost')
+
+        self.assertRaises(IMAPClient.AbortError, self.session.run, abort)
+        self.assertEqual(self.server.connections, 2)
+
+    def test_refused_command_keeps_connection(self):
+        def refused(client):
+            raise IMAPClient.Error('NO')
+
+        self.assertRaises(IMAPClient.Error, self.session.run, refused)
+        self.session.run(lambda client: None)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_other_error_drops_connection(self):
+        def broken(client):
+            raise KeyError('oops')
+
+        self.assertRaises(KeyError, self.session.run, broken)
+        self.session.run(lambda client: None)
+        self.assertEqual(self.server.connections, 2)
+
+    def test_on_connect_before_reselect(self):
+        session = self.new_session(on_connect=lambda client: client.enable('CONDSTORE'))
+        self.addCleanup(session.close)
+        session.run(lambda client: client.select_folder('INBOX'))
+        self.assertEqual(session.state, [b'CONDSTORE'])
+        self.drop()
+
+        session.run(lambda client: client.noop())
+
+        commands = [line.split(b' ')[1] for line in self.server.commands]
+        self.assertEqual(commands[-3:], [b'ENABLE', b'SELECT', b'NOOP'])
+        self.assertEqual(session.connects, 2)
+
+    def test_close_logs_out(self):
+        self.session.run(lambda client: None)
+        self.session.close()
+        self.assertEqual(self.count(b'LOGOUT'), 1)
+
+
+class TestSessionTLS(unittest.TestCase):
+
+    def setUp(self):
+        server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        server_context.load_cert_chain(KEYCERT)
+        self.server = FakeIMAPServer(5, ssl_context=server_context)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def test_session_resumed_on_reconnect(self):
+        session = Session(self.server.host, 'user', 'pass', port=self.server.port,
+                          ssl_context=tls.create_default_context(cafile=KEYCERT))
+        self.addCleanup(session.close)
+        session.run(lambda client: client.select_folder('INBOX'))
+        self.server.drop_connections()
+        time.sleep(0.05)
+
+        session.run(lambda client: client.search())
+
+        self.assertEqual(session.connects, 2)
+        self.assertEqual(session.resumed, 1)
+        self.assertEqual(self.server.tls_resumed, 1)
+
+
+class TestSessionManager(unittest.TestCase):
+
+    def test_one_session_per_account(self):
+        manager = SessionManager(ssl=False, check_after=10)
+        session = manager.get('imap.example.com', 'user', 'pass')
+
+        self.assertIs(manager.get('imap.example.com', 'user', 'pass'), session)
+        self.assertIsNot(manager.get('imap.example.com', 'other', 'pass'), session)
+        self.assertEqual(session.check_after, 10)
+        self.assertFalse(session.ssl)
+
+    def test_new_password_replaces_session(self):
+        manager = SessionManager(ssl=False)
+        session = manager.get('imap.example.com', 'user', 'pass')
+
+        self.assertIsNot(manager.get('imap.example.com', 'user', 'new'), session)
+        self.assertEqual(manager.get('imap.example.com', 'user', 'new').password, 'new')
@@ -0,0 +1,172 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import threading
+
+from imapclient.imapclient import IMAPClient
+from imapclient.sequence_set import SequenceSet
+from imapclient.sync import FolderState, MailboxSync, SyncStateStore
+from imapclient.test.util import unittest
+
+from .fake_server import FakeIMAPServer
+
+
+class TestMailboxSync(unittest.TestCase):
+
+    capabilities = FakeIMAPServer.capabilities
+
+    def setUp(self):
+        self.server = FakeIMAPServer(20)
+        self.server.capabilities = self.capabilities
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.store = SyncStateStore()
+        self.client = self.connect()
+
+    def connect(self):
+        client = IMAPClient(self.server.host, self.server.port)
+        client.login('user', 'pass')
+        return client
+
+    def new_sync(self):
+        return MailboxSync(self.client, self.store, 'user')
+
+    def test_first_sync_is_full(self):
+        result = self.new_sync().sync('INBOX')
+
+        self.assertTrue(result.reset)
+        self.assertEqual(result.new, SequenceSet.parse('1:20'))
+        self.assertEqual(sorted(result.flags), list(range(1, 21)))
+        self.assertEqual(result.state.uids, SequenceSet.parse('1:20'))
+
+    def test_unchanged(self):
+        sync = self.new_sync()
+        sync.sync('INBOX')
+        sent = len(self.server.commands)
+
+        result = sync.sync('INBOX')
+
+        self.assertFalse(result.reset)
+        self.assertEqual(result.flags, {})
+        self.assertFalse(result.new)
+        self.assertFalse(result.vanished)
+        # Just the SELECT
+        self.assertEqual(len(self.server.commands), sent + 1)
+
+    def test_changes(self):
+        sync = self.new_sync()
+        sync.sync('INBOX')
+        self.client.add_flags([5], ['foo'])
+        self.server.deliver(2)
+        self.server.expunge([7, 8])
+
+        result = sync.sync('INBOX')
+
+        self.assertFalse(result.reset)
+        self.assertEqual(result.flags, {5: (b'foo',), 21: (), 22: ()})
+        self.assertEqual(result.new, SequenceSet([21, 22]))
+        self.assertEqual(result.vanished, SequenceSet([7, 8]))
+        self.assertEqual(result.state.uids, SequenceSet.parse('1:6,9:22'))
+        self.assertIn(b'(CHANGEDSINCE 1 VANISHED)', self.server.commands[-1])
+
+    def test_uidvalidity_change(self):
+        sync = self.new_sync()
+        sync.sync('INBOX')
+        self.server.uidvalidity = 2
+
+        result = sync.sync('INBOX')
+
+        self.assertTrue(result.reset)
+        self.assertEqual(result.state.uidvalidity, 2)
+
+    def test_no_commit(self):
+        sync = self.new_sync()
+        sync.sync('INBOX')
+        self.server.deliver()
+
+        result = sync.sync('INBOX', commit=False)
+        self.assertEqual(result.new, SequenceSet([21]))
+        self.assertEqual(sync.sync('INBOX', commit=False).new, SequenceSet([21]))
+
+        sync.commit('INBOX', result)
+        self.assertFalse(sync.sync('INBOX').new)
+
+    def test_state_file(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'state.json')
+        self.store = SyncStateStore(path)
+        self.new_sync().sync('INBOX')
+        self.client.logout()
+
+        self.server.expunge([3])
+        self.store = SyncStateStore(path)
+        self.client = self.connect()
+        result = self.new_sync().sync('INBOX')
+
+        self.assertFalse(result.reset)
+        self.assertEqual(result.vanished, SequenceSet([3]))
+
+
+class TestMailboxSyncCondstoreOnly(TestMailboxSync):
+
+    capabilities = b'IMAP4rev1 ENABLE CONDSTORE ESEARCH'
+
+    def test_changes(self):
+        sync = self.new_sync()
+        self.assertFalse(sync.qresync)
+        sync.sync('INBOX')
+        self.server.deliver(1)
+        self.server.expunge([2, 3])
+
+        result = sync.sync('INBOX')
+
+        self.assertEqual(result.flags, {21: ()})
+        self.assertEqual(result.new, SequenceSet([21]))
+        self.assertEqual(result.vanished, SequenceSet([2, 3]))
+        self.assertEqual(result.state.uids, SequenceSet.parse('1,4:21'))
+
+
+class TestMailboxSyncNoCondstore(unittest.TestCase):
+
+    def test_every_sync_is_full(self):
+        with FakeIMAPServer(5) as server:
+            server.capabilities = b'IMAP4rev1'
+            server._do_select = lambda args, uid: [b'5 EXISTS', b'OK [UIDVALIDITY 1]']
+            client = IMAPClient(server.host, server.port)
+            client.login('user', 'pass')
+            sync = MailboxSync(client, SyncStateStore(), 'user')
+
+            self.assertTrue(sync.sync('INBOX').reset)
+            result = sync.sync('INBOX')
+
+            self.assertTrue(result.reset)
+            self.assertEqual(sorted(result.flags), [1, 2, 3, 4, 5])
+
+
+class TestSyncStateStore(unittest.TestCase):
+
+    def test_shared_by_threads(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'state.json')
+        store = SyncStateStore(path)
+
+        def put(account):
+            for n in range(1, 51):
+                store.put(account, 'INBOX', FolderState(1, n, n + 1, SequenceSet(range(1, n + 1))))
+
+        threads = [threading.Thread(target=put, args=('user%d' % i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        reloaded = SyncStateStore(path)
+        for i in range(8):
+            state = reloaded.get('user%d' % i, 'INBOX')
+            self.assertEqual(state.highestmodseq, 50)
+            self.assertEqual(state.uids, SequenceSet.parse('1:50'))
@@ -5,12 +5,14 @@
 from __future__ import unicode_literals
 
 from imapclient.imapclient import (
+    batch_message_ids,
     join_message_ids,
     _normalise_search_criteria,
     normalise_text_list,
     seq_to_parenstr,
     seq_to_parenstr_upper,
 )
+from imapclient.sequence_set import SequenceSet
 from imapclient.test.util import unittest
 
 
@@ -107,13 +109,56 @@ class Test_join_message_ids(unittest.TestCase):
         self.check(b'2:*', b'2:*')
 
     def test_tuple(self):
-        self.check((123, 99), b'123,99')
+        self.check((123, 99), b'99,123')
 
     def test_mixed_list(self):
         self.check(['2:3', 123, b'44'], b'2:3,123,44')
 
     def test_iter(self):
-        self.check(iter([123, 99]), b'123,99')
+        self.check(iter([123, 99]), b'99,123')
+
+    def test_ranges(self):
+        self.check([1, 2, 3, 4, 7, 9, 10], b'1:4,7,9:10')
+
+    def test_unsorted_with_duplicates(self):
+        self.check([10, 3, 2, 2, 1, 9], b'1:3,9:10')
+
+    def test_sequence_set(self):
+        self.check(SequenceSet([5, 6, 7]), b'5:7')
+
+
+class Test_batch_message_ids(unittest.TestCase):
+
+    def check(self, items, max_length, expected):
+        self.assertEqual(batch_message_ids(items, max_length), expected)
+
+    def test_fits(self):
+        self.check([1, 22, 333], 20, [b'1,22,333'])
+
+    def test_split(self):
+        self.check([1, 22, 333, 4, 55], 6, [b'1,4,22', b'55,333'])
+
+    def test_ranges(self):
+        self.check([1, 2, 3, 10, 11, 12, 20], 8, [b'1:3', b'10:12,20'])
+
+    def test_exact_fit(self):
+        self.check([1, 22, 333], 8, [b'1,22,333'])
+
+    def test_long_id_not_split(self):
+        self.check([1, 123456], 3, [b'1', b'123456'])
+
+    def test_no_limit(self):
+        self.check([1, 3, 5], None, [b'1,3,5'])
+
+    def test_single(self):
+        self.check(123, 1, [b'123'])
+        self.check('2:*', 1, [b'2:*'])
+
+    def test_iter(self):
+        self.check(iter([123, 99]), 4, [b'99', b'123'])
+
+    def test_empty(self):
+        self.check([], 10, [b''])
 
 
 class Test_normalise_search_criteria(unittest.TestCase):
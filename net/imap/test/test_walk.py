@@ -0,0 +1,147 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+import base64
+
+from imapclient.imapclient import IMAPClient
+from imapclient.test.util import unittest
+from imapclient.walk import plan_parts, walk_messages, walk_parts
+
+from .fake_server import FakeIMAPServer
+
+BODYSTRUCTURE = (
+    b'(("text" "plain" ("charset" "utf-8") NIL NIL "base64" 8 1 NIL NIL NIL NIL)'
+    b'("application" "pdf" ("name" "a.pdf") NIL NIL "base64" 8 NIL '
+    b'("attachment" ("filename" "a.pdf")) NIL NIL)'
+    b'("image" "jpeg" ("name" "b.jpg") NIL NIL "base64" 4 NIL '
+    b'("attachment" ("filename" "b.jpg")) NIL NIL) '
+    b'"mixed" ("boundary" "x") NIL NIL NIL)'
+)
+
+PLAIN_BODYSTRUCTURE = b'("text" "plain" ("charset" "utf-8") NIL NIL "7bit" 5 1 NIL NIL NIL NIL)'
+
+
+def is_pdf(filename, content_type):
+    return content_type == 'application/pdf'
+
+
+class TestWalk(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeIMAPServer(5)
+        for i in 1, 2, 3:
+            self.server.bodies[i] = (BODYSTRUCTURE, {
+                '1': base64.b64encode('caf\xe9 %d'.encode('utf-8') % i),
+                '2': base64.b64encode(b'%%PDF %d' % i),
+                '3': base64.b64encode(b'JPEG'),
+            })
+        self.server.bodies[4] = (PLAIN_BODYSTRUCTURE, {'1': b'plain'})
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.client = IMAPClient(self.server.host, self.server.port)
+        self.client.login('user', 'pass')
+        self.client.select_folder('INBOX')
+        self.client.capabilities()
+        fetched = self.client.fetch([1, 2, 3, 4], ['BODYSTRUCTURE'])
+        self.structures = dict((msgid, data[b'BODYSTRUCTURE']) for msgid, data in fetched.items())
+        del self.server.commands[:]
+
+    def tearDown(self):
+        self.client.logout()
+
+    def sent(self):
+        return [c.split(b' ', 1)[1] for c in self.server.commands]
+
+    def test_plan(self):
+        plan = plan_parts(self.structures[1], is_pdf)
+
+        self.assertEqual(plan.text[1], '1')
+        self.assertEqual([(name, section) for name, _, section in plan.attachments],
+                         [('a.pdf', '2'), ('b.jpg', None)])
+        self.assertEqual(plan.sections, [b'BODY.PEEK[1]', b'BODY.PEEK[2]'])
+
+    def test_walk_parts_fetches_once(self):
+        text, attachments = walk_parts(self.structures[1], 1, self.client, ['a.pdf', 'b.jpg'])
+
+        self.assertEqual(text, 'caf\xe9 1')
+        self.assertEqual(attachments, {
+            'a.pdf': ('application/pdf', 8, b'%PDF 1'),
+            'b.jpg': ('image/jpeg', 4, b'JPEG'),
+        })
+        self.assertEqual(self.sent(), [b'UID FETCH 1 (BODY.PEEK[1] BODY.PEEK[2] BODY.PEEK[3])'])
+
+    def test_walk_parts_listing_only(self):
+        text, attachments = walk_parts(self.structures[2], 2, self.client)
+
+        self.assertEqual(text, 'caf\xe9 2')
+        self.assertEqual(attachments['a.pdf'], ('application/pdf', 8, None))
+        self.assertEqual(self.sent(), [b'UID FETCH 2 (BODY.PEEK[1])'])
+
+    def test_walk_messages(self):
+        out = walk_messages(self.structures, self.client, is_pdf)
+
+        self.assertEqual(out[3], ('caf\xe9 3', {
+            'a.pdf': ('application/pdf', 8, b'%PDF 3'),
+            'b.jpg': ('image/jpeg', 4, None),
+        }))
+        self.assertEqual(out[4], ('plain', {}))
+        # One command per distinct set of sections
+        self.assertEqual(sorted(self.sent()), [
+            b'UID FETCH 1:3 (BODY.PEEK[1] BODY.PEEK[2])',
+            b'UID FETCH 4 (BODY.PEEK[1])',
+        ])
+
+
+class TestWalkBinary(TestWalk):
+
+    def setUp(self):
+        super(TestWalkBinary, self).setUp()
+        self.server.capabilities += b' BINARY'
+        self.client._cached_capabilities = None
+        self.client.capabilities()
+        for i in 1, 2, 3:
+            self.server.binary[i] = {
+                '1': 'caf\xe9 %d'.encode('utf-8') % i,
+                '2': b'%%PDF %d' % i,
+                '3': b'JPEG',
+            }
+        self.server.binary[4] = {'1': b'plain'}
+        del self.server.commands[:]
+
+    def sent(self):
+        return [c.replace(b'BINARY', b'BODY') for c in super(TestWalkBinary, self).sent()]
+
+    def test_plan(self):
+        plan = plan_parts(self.structures[1], is_pdf, binary=True)
+        self.assertEqual(plan.sections, [b'BINARY.PEEK[1]', b'BINARY.PEEK[2]'])
+
+    def test_unknown_cte_falls_back(self):
+        del self.server.binary[2]['2']
+
+        out = walk_messages(self.structures, self.client, is_pdf)
+
+        self.assertEqual(out[2][1]['a.pdf'][2], b'%PDF 2')
+        self.assertEqual(out[3][1]['a.pdf'][2], b'%PDF 3')
+        self.assertEqual(super(TestWalkBinary, self).sent()[-1],
+                         b'UID FETCH 1:3 (BODY.PEEK[1] BODY.PEEK[2])')
+
+
+class TestWalkEncodings(unittest.TestCase):
+
+    def test_quoted_printable_and_8bit(self):
+        structure = (
+            b'(("text" "plain" ("charset" "iso-8859-1") NIL NIL "quoted-printable" 12 1 NIL NIL NIL NIL)'
+            b'("application" "csv" ("name" "a.csv") NIL NIL "8bit" 3 NIL '
+            b'("attachment" ("filename" "a.csv")) NIL NIL) "mixed" ("boundary" "x") NIL NIL NIL)')
+        with FakeIMAPServer(1) as server:
+            server.bodies[1] = (structure, {'1': b'Gr=FC=DFe=\r\n!', '2': b'\xe4,1'})
+            client = IMAPClient(server.host, server.port)
+            client.login('user', 'pass')
+            client.select_folder('INBOX')
+            msg = client.fetch([1], ['BODYSTRUCTURE'])[1][b'BODYSTRUCTURE']
+
+            text, attachments = walk_parts(msg, 1, client, ['a.csv'])
+            client.logout()
+
+        self.assertEqual(text, 'Gr\xfc\xdfe!')
+        self.assertEqual(attachments['a.csv'][2], b'\xe4,1')
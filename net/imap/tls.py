@@ -132,16 +132,21 @@ class IMAP4_TLS(imaplib.IMAP4):
     Adapted from imaplib.IMAP4_SSL.
     """
 
-    def __init__(self, host, port, ssl_context, timeout):
+    def __init__(self, host, port, ssl_context, timeout, ssl_session=None):
         self.ssl_context = ssl_context
+        self.ssl_session = ssl_session
         self._timeout = timeout
         imaplib.IMAP4.__init__(self, host, port)
 
-    def open(self, host, port):
+    def open(self, host, port, timeout=None):
+        # Python 3.9+ passes imaplib's own timeout, ours takes precedence
         self.host = host
         self.port = port
         sock = socket.create_connection((host, port), self._timeout)
-        self.sock = ssl.wrap_socket(sock)
+        context = self.ssl_context or create_default_context()
+        # A session from an earlier connection made with the same
+        # context is resumed, skipping the full handshake
+        self.sock = context.wrap_socket(sock, server_hostname=host, session=self.ssl_session)
         self.file = self.sock.makefile('rb')
 
     def read(self, size):
@@ -3,7 +3,11 @@
 # Released subject to the New BSD License
 # Please see http://en.wikipedia.org/wiki/BSD_licenses
 
+from collections import defaultdict
 from email.header import make_header, decode_header
+from typing import Dict
+
+from net.imap.decoders import decoder_for
 from net.imap.response_types import Address, BodyData
 
 
@@ -34,16 +38,55 @@ def process_subject(data: bytes) -> str:
     return name
 
 
-def process_body(server, k: int, data: BodyData) -> str:
-    content = ''
-    if data.is_multipart:
+PREVIEW_SIZE = 256
 
-        for part in data[0]:
-            # for typ, subtyp, charset_and_encoding, body_id, body_description, body_encoding, body_size, nmd5 in part:
-            pass
-    else:
-        body_1 = server.fetch([k], data=['BODY[1]'])[k]
 
+def process_body(server, k: int, data: BodyData) -> str:
+    """A one line preview of the text of message *k*, from the start of
+    its text part, followed by the filenames of its attachments.
+    """
+    return process_bodies(server, {k: data})[k]
+
+
+def process_bodies(server, structures: Dict[int, BodyData]) -> Dict[int, str]:
+    """The :py:func:`process_body` previews of the messages whose body
+    structures are in *structures*, keyed by message id. The text of
+    all of them is fetched at once, with one FETCH for each distinct
+    text section.
+    """
+    by_section = defaultdict(list)
+    for k, data in structures.items():
+        text = data.find_text_part()
+        if text is not None:
+            by_section[text.section].append(k)
+
+    fetched = {}
+    if by_section:
+        with server.pipeline() as p:
+            results = [p.fetch(ids, ['BODY.PEEK[{}]<0.{}>'.format(section, PREVIEW_SIZE)])
+                       for section, ids in by_section.items()]
+            for result in results:
+                fetched.update(result.result())
+
+    return {k: _preview(data, fetched.get(k, {})) for k, data in structures.items()}
+
+
+def _preview(data: BodyData, fetched: dict) -> str:
+    content = ''
+    text = data.find_text_part()
+    if text is not None:
+        raw = fetched.get('BODY[{}]<0>'.format(text.section).encode('utf8')) or b''
+        decoder = decoder_for(text.encoding)
+        decoded = decoder.decode(raw)
+        # A preview cut short may end part way through a base64 quantum,
+        # which is dropped rather than flushed
+        if len(raw) < PREVIEW_SIZE:
+            decoded += decoder.flush()
+        content = ' '.join(decoded.decode(text.charset or 'us-ascii', 'replace').split())
+
+    filenames = [part.filename for part in data.attachments()]
+    if filenames:
+        content = '{} [{}]'.format(content, ', '.join(filenames)).strip()
     return content
 
 
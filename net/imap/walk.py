@@ -1,92 +1,166 @@
 # coding=utf-8
-import base64
-from typing import Iterable, Tuple, Dict
-
-from net.imap.response_types import BodyData
+from collections import defaultdict, namedtuple
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from net.imap.decoders import decoder_for
+from net.imap.response_types import BodyData, Part
+
+# Subtypes of the text/* parts taken as the text of a message
+TEXT_SUBTYPES = ('plain', 'html')
+
+# A collection of filenames, or a callable taking a filename and a
+# content type and returning True for attachments to download
+AttachmentFilter = Union[Iterable[str], Callable[[str, str], bool], None]
+
+
+class PartPlan(namedtuple('PartPlan', 'text attachments binary')):
+    """The body parts of a message that :py:func:`walk_parts` reads.
+
+    *text* is a ``(part, section)`` tuple for the text part of the
+    message, or None. *attachments* is a list of ``(filename, part,
+    section)`` tuples. The parts are
+    :py:class:`~net.imap.response_types.Part` records from the message's
+    part index; *section* is None for attachments that aren't
+    downloaded. If *binary* is set the sections are fetched with
+    BINARY (:rfc:`3516`) so the server decodes them.
+    """
+
+    @property
+    def sections(self) -> List[bytes]:
+        """The FETCH items needed for the plan.
+        """
+        sections = []
+        if self.text:
+            sections.append(self.item(self.text[1]))
+        for _, _, section in self.attachments:
+            if section is not None and self.item(section) not in sections:
+                sections.append(self.item(section))
+        return sections
+
+    def item(self, section: str) -> bytes:
+        """The FETCH item for *section*.
+        """
+        return '{}.PEEK[{}]'.format('BINARY' if self.binary else 'BODY', section).encode('utf8')
+
+    def key(self, section: str) -> bytes:
+        """The key of *section* in FETCH responses.
+        """
+        return '{}[{}]'.format('BINARY' if self.binary else 'BODY', section).encode('utf8')
 
 
 def flatten_message(msg: BodyData) -> Iterable[Tuple[BodyData, str]]:
-    if not msg.is_multipart:
-        stack = [(msg, '1')]
-    else:
-        stack = [(m, str(n)) for n, m in enumerate(msg[0], 1)]
-    flattened_parts = []
-    while stack:  # flatten message parts and enumerate them
-        part, body_number = stack.pop()
-        if part and part.is_multipart:
-            for subpart in part:
-                if type(subpart) == list:
-                    for i, s in enumerate(subpart, 1):
-                        stack.append((s, body_number + '.' + str(i)))
-            continue
-        flattened_parts.append((part, body_number))
-    return reversed(flattened_parts)
-
-
-def walk_parts(msg: BodyData, msgid, server, download_attachments=None) -> Tuple[str, Dict[str, str]]:
-
+    return ((part.body, section) for section, part in msg.parts.items())
+
+
+def plan_parts(msg: BodyData, download_attachments: AttachmentFilter = None,
+               binary: bool = False) -> PartPlan:
+    """Decide which parts of the message with body structure *msg* to
+    fetch: the first text part, and the attachments selected by
+    *download_attachments*. Set *binary* if the server supports
+    BINARY.
+    """
+    text_part = msg.find_text_part(TEXT_SUBTYPES)
+    text = (text_part, text_part.section) if text_part is not None else None
+    attachments = [
+        (part.filename, part,
+         part.section if _wanted(download_attachments, part.filename, part.content_type) else None)
+        for part in msg.attachments()]
+    return PartPlan(text, attachments, binary)
+
+
+def decode_parts(plan: PartPlan, fetched: Dict[bytes, bytes]) -> Tuple[str, Dict[str, tuple]]:
+    """Decode the sections of *plan* in *fetched*, the FETCH response
+    data for one message. Returns the same ``(text, attachments)``
+    tuple as :py:func:`walk_parts`.
+    """
     text = ''
-    attachments = {}
+    if plan.text:
+        part, body_number = plan.text
+        data = _decoded(plan, part, fetched.get(plan.key(body_number)))
+        if data is not None:
+            text = data.decode(part.charset or 'us-ascii')
 
-    if download_attachments is None:
-        download_attachments = []
-
-    for part, body_number in flatten_message(msg):
-
-        dtypes = part.dtypes
-        content_type = part.content_type
-
-        if dtypes:
-            for key, filename in dtypes.items():
-                key = key.lower()
-                decoded_data = None
-                if key == b'filename':
-                    if filename.decode('utf8') in download_attachments:
-                        BODY = 'BODY[{}]'.format(body_number).encode('utf8')
-                        data = server.fetch([msgid], data=[BODY])[msgid][BODY]
-                        decoder = part[5]
-
-                        if decoder == b'base64':
-                            decoded_data = base64.b64decode(data)
-                        else:
-                            pass
-                        # with open(filename.decode('utf8'), 'wb') as f:
-                        #     f.write(decoded_data)
-
-                    attachments[filename.decode('utf8')] = (content_type, part.size, decoded_data)
-
-        else:
-            if body_number.startswith('1'):
-                BODY = 'BODY[{}]'.format(body_number)  # use correct
-                key = BODY.encode('utf8')
-
-                decoder = part[5]
-                charset = part[2][1].decode('utf8')
-
-                if content_type in ['text/plain', 'text/html'] and not text:  # .get_content_type()
-                    data = server.fetch([msgid], data=[BODY])[msgid][key]
-
-                    if decoder == b'base64':
-                        decoded_data = base64.b64decode(data)
-                    else:
-                        decoded_data = data
-
-                    text = decoded_data.decode(charset)
-
-                    continue
-                # if not text and content_type == 'text/html':  # .get_content_type()
-                #     html = server.fetch([msgid], data=[BODY])[msgid][key].decode(charset).encode('utf8')
-                #     continue
-
-            ctypes = part.ctypes
-            if not ctypes:
-                continue
-            for key, val in ctypes.items():
-                if key.lower() == b'name':
-                    # filename = val.decode('utf8')
-                    # BODY = 'BODY[{}]'.format(body_number).encode('utf8')
-                    # m = server.fetch([msgid], data=[BODY])[msgid]
-
-                    break
+    attachments = {}
+    for filename, part, body_number in plan.attachments:
+        decoded_data = None
+        if body_number is not None:
+            decoded_data = _decoded(plan, part, fetched.get(plan.key(body_number)))
+        attachments[filename] = (part.content_type, part.size, decoded_data)
 
     return text, attachments
+
+
+def walk_parts(msg: BodyData, msgid, server,
+               download_attachments: AttachmentFilter = None) -> Tuple[str, Dict[str, tuple]]:
+    """Return the text of message *msgid* and a dict mapping each
+    attachment's filename to its ``(content_type, size, data)``.
+
+    *data* is only set for the attachments selected by
+    *download_attachments*. All the parts needed are fetched with one
+    command, using BINARY if the server supports it.
+    """
+    plans = {msgid: plan_parts(msg, download_attachments, _binary_supported(server))}
+    fetched = _fetch_plans(server, plans)
+    return decode_parts(plans[msgid], fetched.get(msgid, {}))
+
+
+def walk_messages(messages: Dict[int, BodyData], server,
+                  download_attachments: AttachmentFilter = None) -> Dict[int, Tuple[str, Dict[str, tuple]]]:
+    """:py:func:`walk_parts` for many messages at once. *messages*
+    maps message ids to body structures.
+
+    Messages needing the same sections share a FETCH command, and the
+    commands are pipelined, so the whole batch costs about one round
+    trip. All the downloaded attachments are held in memory, so keep
+    batches to a reasonable size.
+    """
+    binary = _binary_supported(server)
+    plans = {msgid: plan_parts(msg, download_attachments, binary) for msgid, msg in messages.items()}
+    fetched = _fetch_plans(server, plans)
+    return {msgid: decode_parts(plan, fetched.get(msgid, {})) for msgid, plan in plans.items()}
+
+
+def _fetch_plans(server, plans: Dict[int, PartPlan]) -> Dict[int, dict]:
+    # Plans that fall back from BINARY are replaced in *plans*
+    by_sections = defaultdict(list)
+    for msgid, plan in plans.items():
+        if plan.sections:
+            by_sections[tuple(plan.sections)].append(msgid)
+
+    fetched = {}
+    fallback = {}
+    with server.pipeline() as p:
+        results = [(msgids, p.fetch(msgids, list(sections)))
+                   for sections, msgids in by_sections.items()]
+        for msgids, result in results:
+            try:
+                fetched.update(result.result())
+            except server.Error:
+                if not plans[msgids[0]].binary:
+                    raise
+                # The server can't decode one of the parts (UNKNOWN-CTE),
+                # fetch the raw sections and decode them here instead
+                for msgid in msgids:
+                    fallback[msgid] = plans[msgid] = plans[msgid]._replace(binary=False)
+    if fallback:
+        fetched.update(_fetch_plans(server, fallback))
+    return fetched
+
+
+def _decoded(plan: PartPlan, part: Part, data: Optional[bytes]) -> Optional[bytes]:
+    if data is None or plan.binary:
+        return data
+    decoder = decoder_for(part.encoding)
+    return decoder.decode(data) + decoder.flush()
+
+
+def _binary_supported(server) -> bool:
+    return server.has_capability('BINARY')
+
+
+def _wanted(download_attachments: AttachmentFilter, filename: str, content_type: str) -> bool:
+    if download_attachments is None:
+        return False
+    if callable(download_attachments):
+        return download_attachments(filename, content_type)
+    return filename in download_attachments
@@ -0,0 +1,201 @@
+# coding=utf-8
+"""
+A pool of logged in SMTP connections.
+
+Opening an SMTP connection costs a TCP handshake, STARTTLS and AUTH
+before the first message can go out. The pool keeps connections open
+between sends, per server and user, so a run of messages pays for
+that once::
+
+    pool = SMTPPool()
+    for msg in messages:
+        pool.send(host, 587, user, password, msg)
+    pool.close()
+
+Connections idle for a while are checked with NOOP before they are
+reused, and are dropped after *max_idle* seconds. A connection the
+server has closed is replaced by a new one and the send retried.
+"""
+
+import smtplib
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+
+__all__ = ['SMTPPool']
+
+
+class SMTPPool(object):
+    """Keeps up to *max_connections* idle SMTP connections for each
+    ``(host, port, user)``, closing those unused for *max_idle*
+    seconds. Connections unused for more than *check_after* seconds are
+    checked with NOOP first.
+
+    STARTTLS is used whenever the server offers it, with
+    *ssl_context* or a default context; set *require_tls* to refuse
+    servers that don't offer it. *timeout* is the socket timeout.
+
+    The pool can be shared between threads; each connection is used by
+    one thread at a time.
+    """
+
+    def __init__(self, max_connections=2, max_idle=60, check_after=5, timeout=60,
+                 ssl_context=None, require_tls=False):
+        self.max_connections = max_connections
+        self.max_idle = max_idle
+        self.check_after = check_after
+        self.timeout = timeout
+        self.ssl_context = ssl_context
+        self.require_tls = require_tls
+        self.connects = 0
+        self._lock = threading.Lock()
+        # (host, port, user) -> [(connection, last used)], most
+        # recently used last
+        self._idle = {}
+
+    @contextmanager
+    def connection(self, host, port, user, password):
+        """A context manager giving a logged in :py:class:`smtplib.SMTP`
+        connection, returned to the pool afterwards unless an error
+        was raised using it.
+        """
+        key = (host, port, user)
+        conn = self._checkout(key) or self._connect(host, port, user, password)
+        try:
+            yield conn
+        except smtplib.SMTPServerDisconnected:
+            _close(conn)
+            raise
+        except smtplib.SMTPException:
+            # Refused by the server, the connection itself is fine once
+            # the transaction is reset
+            if _reset(conn):
+                self._checkin(key, conn)
+            raise
+        except BaseException:
+            _close(conn)
+            raise
+        else:
+            self._checkin(key, conn)
+
+    def send(self, host, port, user, password, msg, from_addr=None, to_addrs=None):
+        """Send the :py:class:`email.message.Message` *msg* as
+        :py:meth:`smtplib.SMTP.send_message` does, returning the dict of
+        refused recipients. The message is sent again on a new
+        connection if the server had closed the pooled one.
+        """
+        return self.send_many(host, port, user, password, [(msg, from_addr, to_addrs)])[0]
+
+    def send_many(self, host, port, user, password, messages):
+        """Send each ``(msg, from_addr, to_addrs)`` in *messages* over
+        one connection, returning the refused recipients of each.
+        """
+        refused = []
+        pending = list(messages)
+        retried = False
+        while pending:
+            with self.connection(host, port, user, password) as conn:
+                while pending:
+                    msg, from_addr, to_addrs = pending[0]
+                    try:
+                        refused.append(conn.send_message(msg, from_addr, to_addrs))
+                    except smtplib.SMTPServerDisconnected:
+                        # Closed by the server while idle or between
+                        # messages: try once more on a new connection
+                        if retried:
+                            raise
+                        retried = True
+                        break
+                    del pending[0]
+                    retried = False
+        return refused
+
+    def close(self):
+        """Log out of every idle connection.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                _quit(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _checkout(self, key):
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                conns = self._idle.get(key)
+                if not conns:
+                    return None
+                conn, last_used = conns.pop()
+            if now - last_used > self.max_idle:
+                _quit(conn)
+                continue
+            if now - last_used > self.check_after and not _alive(conn):
+                _close(conn)
+                continue
+            return conn
+
+    def _checkin(self, key, conn):
+        if getattr(conn, 'sock', None) is None:
+            return
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+            conns.append((conn, time.monotonic()))
+            excess = conns[:-self.max_connections]
+            del conns[:-self.max_connections]
+        for old, _ in excess:
+            _quit(old)
+
+    def _connect(self, host, port, user, password):
+        conn = smtplib.SMTP(host, port, timeout=self.timeout)
+        try:
+            conn.ehlo()
+            if conn.has_extn('starttls'):
+                conn.starttls(context=self.ssl_context or ssl.create_default_context())
+                conn.ehlo()
+            elif self.require_tls:
+                raise smtplib.SMTPNotSupportedError('%s does not offer STARTTLS' % host)
+            if user is not None:
+                conn.login(user, password)
+        except BaseException:
+            _close(conn)
+            raise
+        self.connects += 1
+        return conn
+
+
+def _reset(conn):
+    try:
+        conn.rset()
+        return True
+    except (smtplib.SMTPException, OSError):
+        _close(conn)
+        return False
+
+
+def _alive(conn):
+    try:
+        return conn.noop()[0] == 250
+    except (smtplib.SMTPException, OSError):
+        return False
+
+
+def _quit(conn):
+    try:
+        conn.quit()
+    except (smtplib.SMTPException, OSError):
+        _close(conn)
+
+
+def _close(conn):
+    try:
+        conn.close()
+    except OSError:
+        pass
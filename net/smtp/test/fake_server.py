@@ -0,0 +1,148 @@
+# coding=utf-8
+"""
+A minimal in-process SMTP server for tests, in the spirit of aiosmtpd's
+test controller.
+
+It answers EHLO, AUTH PLAIN, MAIL, RCPT, DATA, RSET, NOOP and QUIT,
+and records each message accepted in *messages* as a ``(sender,
+recipients, data)`` tuple. Recipients in *refuse* are rejected.
+drop_connections() closes every open connection, as a server does to
+clients idle for too long.
+"""
+
+import base64
+import socket
+import threading
+
+
+class FakeSMTPServer(object):
+
+    def __init__(self, users=None):
+        self.users = users if users is not None else {'user': 'pass'}
+        self.refuse = set()
+        self.messages = []
+        self.commands = []
+        self.connections = 0
+        self._conns = []
+        self._lock = threading.Lock()
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(('127.0.0.1', 0))
+        self._listener.listen(128)
+        self.host, self.port = self._listener.getsockname()
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._listener.close()
+        self.drop_connections()
+
+    def drop_connections(self):
+        with self._lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                return
+            with self._lock:
+                self.connections += 1
+                self._conns.append(conn)
+            thread = threading.Thread(target=self._handle, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _handle(self, conn):
+        f = conn.makefile('rb')
+        try:
+            self._session(conn, f)
+        except OSError:
+            pass
+        finally:
+            f.close()
+            conn.close()
+
+    def _session(self, conn, f):
+        def reply(line):
+            conn.sendall(line.encode('ascii') + b'\r\n')
+
+        reply('220 fake ESMTP')
+        authenticated = False
+        sender, recipients = None, []
+        while True:
+            line = f.readline()
+            if not line:
+                return
+            line = line.decode('utf8').rstrip('\r\n')
+            verb, _, arg = line.partition(' ')
+            verb = verb.upper()
+            self.commands.append(verb)
+            if verb == 'EHLO':
+                reply('250-fake')
+                reply('250-AUTH PLAIN')
+                reply('250 8BITMIME')
+            elif verb == 'HELO':
+                reply('250 fake')
+            elif verb == 'AUTH':
+                mechanism, _, initial = arg.partition(' ')
+                _, user, password = base64.b64decode(initial).decode('utf8').split('\0')
+                if mechanism.upper() == 'PLAIN' and self.users.get(user) == password:
+                    authenticated = True
+                    reply('235 2.7.0 Authentication successful')
+                else:
+                    reply('535 5.7.8 Authentication failed')
+            elif verb == 'MAIL':
+                if not authenticated:
+                    reply('530 5.7.0 Authentication required')
+                    continue
+                sender, recipients = arg.split(':', 1)[1].split()[0].strip('<>'), []
+                reply('250 OK')
+            elif verb == 'RCPT':
+                recipient = arg.split(':', 1)[1].strip().strip('<>')
+                if recipient in self.refuse:
+                    reply('550 5.1.1 No such user')
+                else:
+                    recipients.append(recipient)
+                    reply('250 OK')
+            elif verb == 'DATA':
+                if not recipients:
+                    reply('503 5.5.1 No recipients')
+                    continue
+                reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while True:
+                    line = f.readline()
+                    if line in (b'.\r\n', b''):
+                        break
+                    data.append(line[1:] if line.startswith(b'..') else line)
+                self.messages.append((sender, recipients, b''.join(data)))
+                sender, recipients = None, []
+                reply('250 OK queued')
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                reply('250 OK')
+            elif verb == 'NOOP':
+                reply('250 OK')
+            elif verb == 'QUIT':
+                reply('221 Bye')
+                return
+            else:
+                reply('502 5.5.2 Command not recognised')
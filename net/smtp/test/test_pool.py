@@ -0,0 +1,110 @@
+# coding=utf-8
+
+import smtplib
+import time
+import unittest
+from email.message import EmailMessage
+
+from net.smtp.pool import SMTPPool
+
+from .fake_server import FakeSMTPServer
+
+
+def message(n):
+    msg = EmailMessage()
+    msg['From'] = 'user@example.com'
+    msg['To'] = 'receiver@example.com'
+    msg['Subject'] = 'Message %d' % n
+    msg.set_content('Body %d' % n)
+    return msg
+
+
+class TestSMTPPool(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeSMTPServer()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.pool = SMTPPool()
+        self.addCleanup(self.pool.close)
+
+    def send(self, n, **kwargs):
+        return self.pool.send(self.server.host, self.server.port, 'user', 'pass', message(n), **kwargs)
+
+    def test_one_handshake_for_many_sends(self):
+        for n in range(5):
+            self.assertEqual(self.send(n), {})
+
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.server.commands.count('AUTH'), 1)
+        self.assertEqual(len(self.server.messages), 5)
+        sender, recipients, data = self.server.messages[4]
+        self.assertEqual((sender, recipients), ('user@example.com', ['receiver@example.com']))
+        self.assertIn(b'Subject: Message 4', data)
+
+    def test_send_many(self):
+        refused = self.pool.send_many(self.server.host, self.server.port, 'user', 'pass',
+                                      [(message(n), None, None) for n in range(3)])
+        self.assertEqual(refused, [{}, {}, {}])
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.messages), 3)
+
+    def test_reconnect_after_server_closes(self):
+        self.send(1)
+        self.server.drop_connections()
+        time.sleep(0.05)
+
+        self.send(2)
+
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(len(self.server.messages), 2)
+
+    def test_noop_check_after_idle(self):
+        self.send(1)
+        self.send(2)
+        self.assertNotIn('NOOP', self.server.commands)
+
+        self.pool.check_after = 0
+        time.sleep(0.01)
+        self.send(3)
+        self.assertEqual(self.server.commands.count('NOOP'), 1)
+        self.assertEqual(self.server.connections, 1)
+
+        # A dead connection fails the check and is replaced
+        self.server.drop_connections()
+        time.sleep(0.05)
+        self.send(4)
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(len(self.server.messages), 4)
+
+    def test_max_idle(self):
+        self.pool.max_idle = 0
+        self.send(1)
+        time.sleep(0.01)
+        self.send(2)
+        self.assertEqual(self.server.connections, 2)
+        self.assertIn('QUIT', self.server.commands)
+
+    def test_refused_recipient_keeps_connection(self):
+        self.server.refuse.add('nobody@example.com')
+        self.assertRaises(smtplib.SMTPRecipientsRefused, self.send, 1, to_addrs=['nobody@example.com'])
+        self.assertEqual(self.send(2), {})
+        self.assertIn('RSET', self.server.commands)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_login_failure(self):
+        self.assertRaises(smtplib.SMTPAuthenticationError, self.pool.send,
+                          self.server.host, self.server.port, 'user', 'wrong', message(1))
+        self.assertEqual(self.pool.connects, 0)
+
+    def test_require_tls(self):
+        self.pool.require_tls = True
+        self.assertRaises(smtplib.SMTPNotSupportedError, self.send, 1)
+        self.assertEqual(self.server.messages, [])
+
+    def test_separate_users(self):
+        self.server.users['other'] = 'secret'
+        self.send(1)
+        self.pool.send(self.server.host, self.server.port, 'other', 'secret', message(2))
+        self.send(3)
+        self.assertEqual(self.server.connections, 2)
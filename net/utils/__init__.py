@@ -1,5 +1,14 @@
 # coding=utf-8
 import argparse
+import os
+
+
+def default_cache_path():
+    """Where the message cache lives unless --cache says otherwise:
+    under $XDG_CACHE_HOME, or ~/.cache if that isn't set.
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'mail', 'messages.db')
 
 
 def parse_command_line_args():
@@ -12,6 +21,8 @@ def parse_command_line_args():
                         help='IMAP port to use (default is 143, or 993 for SSL)')
     parser.add_argument('--ssl', dest='ssl', action='store_true', default=True, help='Use SSL connection')
     parser.add_argument('--file', dest='file', action='store', default=None, help='Config file (same as livetest)')
+    parser.add_argument('--cache', dest='cache', action='store', default=default_cache_path(),
+                        help='Message cache database (default is %(default)s)')
     parser.add_argument('--version', action='version', version='0.00001')
 
     return parser.parse_args()
@@ -3,7 +3,7 @@ import curses
 import npyscreen
 # from bin.app import server
 from net.imap.search_constants import process_command
-from net.imap.util import process_from, process_subject, process_body, process_flags, process_size
+from net.imap.util import process_from, process_subject, process_bodies, process_flags, process_size
 
 
 class ActionControllerSearch(npyscreen.ActionControllerSimple):
@@ -14,15 +14,17 @@ class ActionControllerSearch(npyscreen.ActionControllerSimple):
     def set_search(self, command_line, widget_proxy, live):
         self.parent.wCommand.value = ''
         ids = process_command(server, command_line)
-        # todo has attachment?
-        mails = server.fetch(ids, data=['ENVELOPE', 'BODY', 'FLAGS', 'RFC822.SIZE'])
+        # BODYSTRUCTURE includes the dispositions that show attachments
+        mails = server.fetch(ids, data=['ENVELOPE', 'BODYSTRUCTURE', 'FLAGS', 'RFC822.SIZE'])
+
+        bodies = process_bodies(server, {k: v[b'BODYSTRUCTURE'] for k, v in mails.items()})
 
         self.parent.wMain.values = []
         for k, v in mails.items():
             row = [v[b'ENVELOPE'],
                    process_from(v[b'ENVELOPE'].from_[0]),
                    process_subject(v[b'ENVELOPE'].subject),
-                   process_body(server, k, v[b'BODY']),
+                   bodies[k],
                    process_flags(v[b'FLAGS']),
                    process_size(v[b'RFC822.SIZE'])]
 